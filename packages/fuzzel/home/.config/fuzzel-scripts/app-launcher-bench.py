@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+# Benchmarks for app-launcher.py against synthetic application directories.
+#
+# Usage: app-launcher-bench.py [index|scan|daemon|stream|select|spawn|rank|parse
+#                              |fuzz ...] [-n FILES] [-r RUNS]
+
+import argparse
+import importlib.util
+import os
+import random
+import select
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import app_history
+import app_index
+import app_watch
+import desktop_entry
+
+
+def load_script(filename):
+    # The entry points have dashes in their names, so import them by path
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(filename.replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_desktop_dir(path, count):
+    # A mix of regular apps, hidden entries and entries with actions
+    os.makedirs(path, exist_ok=True)
+    for i in range(count):
+        lines = [
+            "[Desktop Entry]",
+            "Type=Application",
+            f"Name=Synthetic App {i}",
+            f"GenericName=Tool {i}",
+            f"Comment=Generated entry number {i} for benchmarking",
+            f"Exec=/usr/bin/synthetic-{i} %U",
+            f"Icon=synthetic-{i}",
+            "Categories=Utility;Development;",
+            "Terminal=false",
+        ]
+        if i % 10 == 0:
+            lines.append("NoDisplay=true")
+        if i % 7 == 0:
+            lines += [
+                "Actions=new-window;",
+                "",
+                "[Desktop Action new-window]",
+                "Name=New Window",
+                f"Exec=/usr/bin/synthetic-{i} --new-window",
+            ]
+        with open(os.path.join(path, f"synthetic-{i}.desktop"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+    return path
+
+
+def legacy_parse(filepath, app_list):
+    # The startswith-based parser app_index.py used before desktop_entry.py
+    try:
+        name = None
+        exec_cmd = None
+        no_display = False
+        in_action = False
+
+        with open(filepath, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    if "Desktop Action" in line:
+                        in_action = True
+                    else:
+                        in_action = False
+                elif line.startswith("NoDisplay=true"):
+                    no_display = True
+                elif line.startswith("Name=") and not in_action:
+                    name = line.split("=", 1)[1]
+                elif line.startswith("Exec=") and not in_action:
+                    exec_cmd = line.split("=", 1)[1]
+
+        if name and exec_cmd and not no_display:
+            app_list.append((name, exec_cmd))
+    except:
+        pass
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return sorted(samples)
+
+
+def report(label, samples):
+    p50 = samples[len(samples) // 2] * 1e3
+    print(f"  {label:<36} p50 {p50:9.2f} ms   min {samples[0] * 1e3:9.2f} ms")
+
+
+def bench_index(args, root):
+    print(f"index: list ready for fuzzel, {args.n} desktop files")
+    apps_dir = make_desktop_dir(os.path.join(root, "applications"), args.n)
+    cache = os.path.join(root, "index.pickle")
+
+    def uncached():
+        apps = []
+        for filename in os.listdir(apps_dir):
+            if filename.endswith(".desktop"):
+                legacy_parse(os.path.join(apps_dir, filename), apps)
+        apps.sort(key=lambda x: x[0].lower())
+
+    def indexed():
+        apps = app_index.get_apps([apps_dir], cache)
+        apps.sort(key=lambda x: x[0].lower())
+
+    def cold():
+        if os.path.exists(cache):
+            os.unlink(cache)
+        indexed()
+
+    report("uncached (previous behaviour)", timed(uncached, args.runs))
+    report("index cold", timed(cold, args.runs))
+    indexed()
+    report("index warm", timed(indexed, args.runs))
+
+    def touched():
+        # A package update rewriting a few entries
+        for i in range(0, 50, 5):
+            os.utime(os.path.join(apps_dir, f"synthetic-{i}.desktop"))
+        indexed()
+
+    report("index warm, 10 files changed", timed(touched, args.runs))
+
+
+def bench_scan(args, root):
+    print(f"scan: cold index, {args.n} desktop files, simulated read latency")
+    apps_dir = make_desktop_dir(os.path.join(root, "applications"), args.n)
+    parse_entry = app_index.parse_entry
+    runs = min(args.runs, 3)
+
+    for latency in (0.0, 0.0002, 0.002):
+
+        def slow_parse(path, latency=latency):
+            # Sleeping releases the GIL the way a blocking read would
+            if latency:
+                time.sleep(latency)
+            return parse_entry(path)
+
+        app_index.parse_entry = slow_parse
+        try:
+            for workers in (1, 4, 8, 16):
+
+                def cold(workers=workers):
+                    app_index.scan_dir(apps_dir, {}, workers)
+
+                label = "sequential" if workers == 1 else f"{workers} threads"
+                report(f"{latency * 1e3:.1f} ms/file, {label}", timed(cold, runs))
+        finally:
+            app_index.parse_entry = parse_entry
+
+    # Same entries in the same order whichever path ran
+    seq, _ = app_index.scan_dir(apps_dir, {}, 1)
+    par, _ = app_index.scan_dir(apps_dir, {}, 8)
+    assert list(seq.items()) == list(par.items())
+
+
+def bench_daemon(args, root):
+    print(f"daemon: list ready for fuzzel, {args.n} desktop files")
+    daemon_mod = load_script("app-launcher-daemon.py")
+    launcher = load_script("app-launcher.py")
+    apps_dir = make_desktop_dir(os.path.join(root, "applications"), args.n)
+    cache = os.path.join(root, "index.pickle")
+    os.environ["XDG_RUNTIME_DIR"] = root
+
+    def indexed():
+        app_index.sort_apps(app_index.get_apps([apps_dir], cache))
+
+    indexed()
+    report("index warm (no daemon)", timed(indexed, args.runs))
+
+    # Missing when the daemon starts, like a fresh ~/.local/share
+    late_dir = os.path.join(root, "late", "share", "applications")
+    server = daemon_mod.bind_server(app_index.get_socket_path())
+    daemon = daemon_mod.LauncherDaemon([late_dir, apps_dir], cache)
+    threading.Thread(target=daemon.serve, args=(server,), daemon=True).start()
+    report("daemon client", timed(launcher.fetch_from_daemon, args.runs))
+
+    def add_and_wait():
+        # Time until a newly installed app shows up in the served list
+        name = f"Fresh App {time.perf_counter_ns()}"
+        path = os.path.join(apps_dir, f"fresh-{time.perf_counter_ns()}.desktop")
+        with open(path, "w") as f:
+            f.write(f"[Desktop Entry]\nName={name}\nExec=/usr/bin/fresh\n")
+        while not any(app[0] == name for app in launcher.fetch_from_daemon()):
+            time.sleep(0.001)
+
+    kind = type(daemon.watcher).__name__
+    report(f"new file visible ({kind})", timed(add_and_wait, args.runs))
+
+    os.makedirs(late_dir)
+    with open(os.path.join(late_dir, "late.desktop"), "w") as f:
+        f.write("[Desktop Entry]\nName=Late App\nExec=/usr/bin/late\n")
+    deadline = time.monotonic() + 2 * app_watch.PollWatcher.interval + 1
+    while time.monotonic() < deadline:
+        if any(app[0] == "Late App" for app in launcher.fetch_from_daemon()):
+            print(f"  {'app dir created after start':<36} ok")
+            break
+        time.sleep(0.01)
+    else:
+        print("  FAIL: app in a directory created after start never showed up")
+    server.close()
+    return time.monotonic() >= deadline
+
+
+# Stands in for fuzzel: reports when the first entry arrives, like a first
+# render would
+FAKE_FUZZEL = [
+    sys.executable,
+    "-c",
+    "import sys, time; sys.stdin.buffer.readline(); t = time.monotonic(); "
+    "sys.stdin.buffer.read(); print(t)",
+]
+
+
+def bench_stream(args, root):
+    print(f"stream: time to first entry in fuzzel, {args.n} desktop files")
+    launcher = load_script("app-launcher.py")
+    apps_dir = make_desktop_dir(os.path.join(root, "applications"), args.n)
+    os.environ["XDG_CACHE_HOME"] = os.path.join(root, "cache")
+    os.environ["XDG_RUNTIME_DIR"] = root
+    app_index.APP_DIRS[:] = [apps_dir]
+    history = app_history.History(os.path.join(root, "history.log"))
+
+    def first_entry(proc, start):
+        out = proc.stdout.read()
+        proc.wait()
+        return float(out) - start
+
+    def tempfile_path():
+        # Previous behaviour: collect, sort, write a temp file, then spawn
+        start = time.monotonic()
+        apps = app_index.sort_apps(app_index.get_apps())
+        with tempfile.NamedTemporaryFile("w", delete=False) as f:
+            f.write("".join(f"{app[0]}\n" for app in apps))
+        with open(f.name) as stdin:
+            proc = subprocess.Popen(FAKE_FUZZEL, stdin=stdin, stdout=subprocess.PIPE)
+        os.unlink(f.name)
+        return first_entry(proc, start)
+
+    def piped():
+        start = time.monotonic()
+        proc = subprocess.Popen(
+            FAKE_FUZZEL, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        launcher.stream_apps(proc.stdin, history)
+        proc.stdin.close()
+        return first_entry(proc, start)
+
+    def cold(fn):
+        def run():
+            shutil.rmtree(os.environ["XDG_CACHE_HOME"], ignore_errors=True)
+            return fn()
+
+        return run
+
+    for label, fn in (
+        ("temp file, cold index", cold(tempfile_path)),
+        ("pipe, cold index", cold(piped)),
+        ("temp file, warm index", tempfile_path),
+        ("pipe, warm index", piped),
+    ):
+        report(label, sorted(fn() for _ in range(args.runs)))
+
+
+# Stands in for fuzzel after the user picks an entry: prints the choice,
+# notes when, and lingers a little before exiting like a real client would
+FAKE_PICK = [
+    sys.executable,
+    "-c",
+    "import sys, time; time.sleep(0.05); t = time.monotonic(); "
+    "print('Synthetic App 1', flush=True); sys.stderr.write(repr(t)); "
+    "sys.stderr.flush(); time.sleep(0.2)",
+]
+
+
+def legacy_wait(proc):
+    # The 0.5 s select/poll loop app-launcher.py used before
+    selected = None
+    start = time.time()
+    while time.time() - start < 30:
+        ret = proc.poll()
+        if ret is not None:
+            if ret == 0:
+                stdout = proc.stdout.read().strip()
+                if stdout:
+                    selected = stdout
+            break
+        r, _, _ = select.select([proc.stdout], [], [], 0.5)
+        if r:
+            chunk = proc.stdout.read(1024)
+            if chunk:
+                if b"\n" in chunk or b"\r" in chunk:
+                    selected = chunk.decode().strip()
+                    proc.terminate()
+                    break
+    return selected
+
+
+def bench_select(args, root):
+    print("select: fuzzel printing a choice -> launcher ready to exec")
+    launcher = load_script("app-launcher.py")
+
+    def latency(wait):
+        proc = subprocess.Popen(
+            FAKE_PICK, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        selected = wait(proc)
+        ready = time.monotonic()
+        proc.wait()
+        printed = float(proc.stderr.read())
+        if selected != "Synthetic App 1":
+            return float("inf")
+        return ready - printed
+
+    for label, wait in (
+        ("select/poll loop (previous)", legacy_wait),
+        ("event-driven", launcher.wait_for_selection),
+    ):
+        report(label, sorted(latency(wait) for _ in range(args.runs)))
+
+
+def bench_spawn(args, root):
+    print("spawn: launch until the app has run (/bin/true, exited)")
+    launcher = load_script("app-launcher.py")
+    exec_cmd = shutil.which("true")
+    runs = max(args.runs, 50)
+
+    def shell():
+        # Previous behaviour
+        subprocess.Popen(
+            exec_cmd,
+            shell=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        ).wait()
+
+    def no_shell():
+        subprocess.Popen(
+            shlex.split(exec_cmd),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            start_new_session=True,
+        ).wait()
+
+    def direct():
+        os.waitpid(launcher.launch(exec_cmd, "True"), 0)
+
+    def scope():
+        os.waitpid(launcher.launch(exec_cmd, "True", scope=True), 0)
+
+    report("shell=True (previous)", timed(shell, runs))
+    report("subprocess, shell=False", timed(no_shell, runs))
+    report("posix_spawn", timed(direct, runs))
+    if launcher.has_user_systemd():
+        report("posix_spawn, systemd-run --scope", timed(scope, min(runs, 10)))
+    else:
+        print("  systemd-run --scope: skipped, no systemd --user instance")
+
+
+def bench_rank(args, root):
+    print(f"rank: frecency ordering, {args.n} apps")
+    apps = [
+        (f"Synthetic App {i}", f"/usr/bin/synthetic-{i}", f"synthetic-{i}.desktop")
+        for i in range(args.n)
+    ]
+    app_index.sort_apps(apps)
+    path = os.path.join(root, "history.log")
+    os.makedirs(root)
+
+    # A year of launches over half the apps, a few of them much more often
+    now = time.time()
+    launches = args.n * 4
+    step = 365 * 24 * 3600 / launches
+    with open(path, "w") as f:
+        for i in range(launches):
+            app = (i % 10) if i % 3 else (i * 7919) % (args.n // 2)
+            f.write(f"{now - (launches - i) * step:.0f}\tsynthetic-{app}.desktop\n")
+
+    def load():
+        history = app_history.History(path)
+        return history.places
+
+    places = load()
+    report("alphabetical sort (previous)", timed(lambda: sorted(apps), args.runs))
+    report(f"load log, {launches} lines", timed(load, args.runs))
+    report(
+        f"rank, {len(places)} launched",
+        timed(lambda: app_history.rank(apps, places), args.runs),
+    )
+
+    history = app_history.History(path)
+    history.record("synthetic-1.desktop")
+    report(f"load compacted, {history.lines} lines", timed(load, args.runs))
+    report(
+        "record one launch",
+        timed(lambda: history.record("synthetic-2.desktop"), args.runs),
+    )
+
+
+# Shapes of entries found in the wild, with the parts parsers trip over
+SAMPLES = {
+    "firefox.desktop": "\n".join(
+        ["[Desktop Entry]", "Version=1.0", "Name=Firefox"]
+        + [f"Name[{lang}]=Firefox ({lang})" for lang in ("de", "fr", "ja", "pt_BR")]
+        + [f"Comment[{lang}]=Browse the Web ({lang})" for lang in ("de", "fr", "ja")]
+        + [
+            "GenericName=Web Browser",
+            "Keywords=Internet;WWW;Browser;Web;Explorer;",
+            "Exec=firefox %u",
+            "Icon=firefox",
+            "Terminal=false",
+            "Type=Application",
+            "MimeType=text/html;text/xml;application/xhtml+xml;x-scheme-handler/http;",
+            "StartupNotify=true",
+            "Categories=Network;WebBrowser;",
+            "Actions=new-window;new-private-window;",
+            "",
+            "[Desktop Action new-window]",
+            "Name=Open a New Window",
+            "Exec=firefox --new-window %u",
+            "",
+            "[Desktop Action new-private-window]",
+            "Name=Open a New Private Window",
+            "Exec=firefox --private-window %u",
+        ]
+    ),
+    "org.gnome.Nautilus.desktop": "\n".join(
+        [
+            "# Installed by the distribution",
+            "[Desktop Entry]",
+            "Name=Files",
+            "Exec=nautilus --new-window %U",
+            "TryExec=nautilus",
+            "Icon=org.gnome.Nautilus",
+            "Type=Application",
+            "OnlyShowIn=GNOME;Unity;",
+        ]
+    ),
+    "com.spotify.Client.desktop": "\n".join(
+        [
+            "[Desktop Entry]",
+            "Type=Application",
+            "Name=Spotify",
+            "Exec=/usr/bin/flatpak run --branch=stable --arch=x86_64 --command=spotify "
+            "--file-forwarding com.spotify.Client @@u %U @@",
+            "Icon=com.spotify.Client",
+            "X-Flatpak=com.spotify.Client",
+        ]
+    ),
+    "vim.desktop": "\n".join(
+        [
+            "[Desktop Entry]",
+            "Name=Vim",
+            "Name[de]=Vim",
+            "Comment=Edit text files\\sin a terminal",
+            "TryExec=vim",
+            "Exec=vim %F",
+            "Terminal=true",
+            "Type=Application",
+            "Keywords=Text;editor\\;vi;",
+        ]
+    ),
+    "wine-notepad.desktop": "\n".join(
+        [
+            "[Desktop Entry]",
+            "Name=Notepad",
+            'Exec=env WINEPREFIX="/home/u/.wine" wine C:\\\\\\\\windows\\\\\\\\notepad.exe',
+            "Type=Application",
+            "NoDisplay=false",
+            "Icon=notepad",
+        ]
+    ),
+    "hidden.desktop": "[Desktop Entry]\nName=Gone\nExec=gone\nHidden=true",
+    "link.desktop": "[Desktop Entry]\nType=Link\nName=Docs\nURL=https://example.org",
+}
+
+
+def make_corpus(path, count):
+    # Real entries installed here, padded with the samples up to count files
+    os.makedirs(path, exist_ok=True)
+    texts = list(SAMPLES.values())
+    for directory in app_index.APP_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".desktop"):
+                try:
+                    with open(os.path.join(directory, filename), "rb") as f:
+                        texts.append(f.read().decode("utf-8", errors="replace"))
+                except OSError:
+                    pass
+    for i in range(count):
+        with open(os.path.join(path, f"corpus-{i}.desktop"), "w") as f:
+            f.write(texts[i % len(texts)] + "\n")
+    return path, len(texts)
+
+
+def bench_parse(args, root):
+    corpus, distinct = make_corpus(os.path.join(root, "corpus"), args.n)
+    print(f"parse: {args.n} files from {distinct} real-world shapes")
+    paths = [os.path.join(corpus, f) for f in sorted(os.listdir(corpus))]
+
+    def legacy():
+        apps = []
+        for path in paths:
+            legacy_parse(path, apps)
+
+    def spec():
+        for path in paths:
+            desktop_entry.parse(path, desktops=["sway"], lang="de_DE.UTF-8")
+
+    def read_only():
+        for path in paths:
+            desktop_entry.DesktopEntry.read(path)
+
+    report("startswith parser (previous)", timed(legacy, args.runs))
+    report("spec parser", timed(spec, args.runs))
+    report("spec parser, grouping only", timed(read_only, args.runs))
+    for filename in sorted(SAMPLES):
+        path = os.path.join(corpus, f"corpus-{sorted(SAMPLES).index(filename)}.desktop")
+        with open(path, "w") as f:
+            f.write(SAMPLES[filename])
+        print(f"    {filename:<30} {desktop_entry.parse(path, ['sway'], 'de_DE')}")
+
+
+# Lines that have broken parsers before
+FUZZ_LINES = [
+    "[Desktop Entry]",
+    "[Desktop Action x]",
+    "[",
+    "Exec=",
+    'Exec="unbalanced',
+    "Exec=%",
+    "Exec=a %c %k %i %% %z",
+    "Exec=\\",
+    "Name=",
+    "Name[=x",
+    "Name[de_DE@euro]=Euro",
+    "Hidden=true",
+    "OnlyShowIn=;;;",
+    "NotShowIn=sway\\;x;",
+    "TryExec=/nonexistent",
+    "Type=",
+    "=value",
+    "no separator",
+    "\x00\xff\ufeff",
+    "Exec=" + "x " * 2000,
+]
+
+
+def mutate(rng, text):
+    lines = text.split("\n")
+    for _ in range(rng.randint(1, 4)):
+        op = rng.randrange(5)
+        pos = rng.randrange(len(lines) + 1)
+        if op == 0:
+            lines.insert(pos, rng.choice(FUZZ_LINES))
+        elif op == 1 and lines:
+            del lines[min(pos, len(lines) - 1)]
+        elif op == 2:
+            rng.shuffle(lines)
+        elif op == 3:
+            joined = "\n".join(lines)
+            lines = joined[: rng.randrange(len(joined) + 1)].split("\n")
+        else:
+            line = list(rng.choice(lines) if lines else "")
+            for _ in range(rng.randint(1, 3)):
+                line.insert(rng.randrange(len(line) + 1), chr(rng.randrange(1, 0x3000)))
+            lines.insert(pos, "".join(line))
+    return "\n".join(lines)
+
+
+def bench_fuzz(args, root):
+    print(f"fuzz: {args.n} mutated entries through desktop_entry.parse")
+    rng = random.Random(0)
+    os.makedirs(root)
+    path = os.path.join(root, "fuzz.desktop")
+    texts = list(SAMPLES.values())
+    listed = failures = 0
+    for i in range(args.n):
+        text = mutate(rng, rng.choice(texts))
+        with open(path, "wb") as f:
+            data = text.encode("utf-8", errors="surrogateescape")
+            if i % 7 == 0:
+                # Invalid UTF-8 too
+                data = data.replace(b"a", b"\xe2\x28", 1)
+            f.write(data)
+        try:
+            result = desktop_entry.parse(path, ["sway"], "de_DE.UTF-8@euro")
+            if result is not None:
+                name, command = result
+                assert name and isinstance(name, str), result
+                assert shlex.split(command), result
+                listed += 1
+        except Exception as e:
+            failures += 1
+            print(f"  {type(e).__name__}: {e}\n{text!r}"[:400])
+    rejected = args.n - listed - failures
+    print(f"  {listed} listed, {rejected} rejected, {failures} crashes")
+    return failures
+
+
+BENCHES = {
+    "index": bench_index,
+    "scan": bench_scan,
+    "daemon": bench_daemon,
+    "stream": bench_stream,
+    "select": bench_select,
+    "spawn": bench_spawn,
+    "rank": bench_rank,
+    "parse": bench_parse,
+    "fuzz": bench_fuzz,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app-launcher.py")
+    parser.add_argument("bench", nargs="*", help=f"any of: {', '.join(BENCHES)}")
+    parser.add_argument("-n", type=int, default=5000, help="desktop files")
+    parser.add_argument("-r", "--runs", type=int, default=7, help="runs per case")
+    args = parser.parse_args()
+    unknown = set(args.bench) - set(BENCHES)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+
+    root = tempfile.mkdtemp(prefix="app-launcher-bench-")
+    failed = False
+    try:
+        for name in args.bench or BENCHES:
+            # Benchmarks that check something return a truthy value on failure
+            failed |= bool(BENCHES[name](args, os.path.join(root, name)))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
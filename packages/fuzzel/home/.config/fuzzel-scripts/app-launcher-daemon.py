@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# Keeps the parsed, sorted app list in memory and serves it to
+# app-launcher.py over a Unix socket. Application directories are watched
+# with inotify (or polled), so a launch never waits on a filesystem scan.
+#
+# Protocol: connect and read until EOF; one "name<TAB>id<TAB>exec" line per
+# app, where id is the desktop-file ID.
+
+import os
+import selectors
+import signal
+import socket
+import sys
+
+import app_index
+import app_watch
+
+
+class LauncherDaemon:
+    def __init__(self, dirs=None, cache_path=None):
+        self.dirs = app_index.APP_DIRS if dirs is None else dirs
+        self.cache_path = cache_path or app_index.get_cache_path()
+        self.index = app_index.load_index(self.cache_path)
+        self.payload = None
+        self.watcher = None
+        self.rescan()
+
+    def rescan(self):
+        # Watch first so nothing slips between the scan and the watch
+        if self.watcher is not None:
+            self.watcher.close()
+        self.watcher = app_watch.make_watcher(self.dirs)
+        if app_index.refresh_index(self.index, self.dirs):
+            self.changed()
+
+    def changed(self):
+        self.payload = None
+        try:
+            app_index.save_index(self.cache_path, self.index)
+        except OSError:
+            pass
+
+    def on_changes(self, changes):
+        if app_watch.RESCAN in changes:
+            self.rescan()
+            return
+        dirty = False
+        for directory, filename in changes:
+            dirty |= app_index.update_file(self.index, directory, filename)
+        if dirty:
+            self.changed()
+
+    def get_payload(self):
+        if self.payload is None:
+            apps = app_index.sort_apps(app_index.apps_from_index(self.index, self.dirs))
+            self.payload = "".join(
+                f"{name}\t{desktop_id}\t{cmd}\n" for name, cmd, desktop_id in apps
+            ).encode()
+        return self.payload
+
+    def serve(self, server):
+        sel = selectors.DefaultSelector()
+        sel.register(server, selectors.EVENT_READ, "client")
+        watcher = fd = None
+        while True:
+            # The watcher is replaced on rescans, often under the same fd
+            # number, so follow the object; epoll forgot the old fd when it
+            # was closed
+            if self.watcher is not watcher:
+                if fd is not None:
+                    sel.unregister(fd)
+                watcher, fd = self.watcher, self.watcher.fileno()
+                if fd is not None:
+                    sel.register(fd, selectors.EVENT_READ, "watch")
+            timeout = None if fd is not None else app_watch.PollWatcher.interval
+            ready = sel.select(timeout)
+            if not ready:
+                self.on_changes(self.watcher.read())
+            for key, _ in ready:
+                if key.data == "watch":
+                    self.on_changes(self.watcher.read())
+                    continue
+                conn, _ = server.accept()
+                try:
+                    conn.sendall(self.get_payload())
+                except OSError:
+                    pass
+                finally:
+                    conn.close()
+
+
+def bind_server(path):
+    # Returns None if another daemon is already answering on the socket
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return None
+    except OSError:
+        pass
+    finally:
+        probe.close()
+
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(8)
+    return server
+
+
+def main():
+    path = app_index.get_socket_path()
+    server = bind_server(path)
+    if server is None:
+        print("app-launcher-daemon.py: already running", file=sys.stderr)
+        return 0
+    # Unwind through the finally below so the socket gets removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        LauncherDaemon().serve(server)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
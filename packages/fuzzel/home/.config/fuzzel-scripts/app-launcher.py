@@ -1,135 +1,195 @@
 #!/usr/bin/env python3
 # App launcher using fuzzel with proper PTY handling
 
+import argparse
 import os
+import re
+import shlex
+import shutil
 import sys
+import selectors
+import socket
 import subprocess
-import tempfile
-import select
 import time
 
+import app_history
+import app_index
+from app_index import get_socket_path, sort_apps
 
-def get_apps():
-    apps = []
-    pwas = []
-
-    # Collect from desktop files
-    for directory in [
-        os.path.expanduser("~/.local/share/applications"),
-        "/usr/share/applications",
-        "/usr/local/share/applications",
-    ]:
-        if not os.path.isdir(directory):
-            continue
-        for filename in os.listdir(directory):
-            if not filename.endswith(".desktop"):
-                continue
-            filepath = os.path.join(directory, filename)
-            parse_desktop_file(filepath, apps)
-
-    # Collect PWAs
-    pwa_dir = os.path.expanduser("~/.local/share/applications")
-    if os.path.isdir(pwa_dir):
-        for filename in os.listdir(pwa_dir):
-            if filename.startswith("vivaldi-") and filename.endswith(".desktop"):
-                filepath = os.path.join(pwa_dir, filename)
-                parse_desktop_file(filepath, pwas)
-
-    return apps + pwas
-
-
-def parse_desktop_file(filepath, app_list):
+FUZZEL_CMD = ["fuzzel", "-d", "-I", "-p", "Apps  >", "-l", "15", "-w", "40"]
+
+
+def fetch_from_daemon():
+    # Sorted (name, exec, desktop-file ID) triples from
+    # app-launcher-daemon.py, None if it isn't running
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     try:
-        name = None
-        exec_cmd = None
-        no_display = False
-        in_action = False
-
-        with open(filepath, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith("["):
-                    if "Desktop Action" in line:
-                        in_action = True
-                    else:
-                        in_action = False
-                elif line.startswith("NoDisplay=true"):
-                    no_display = True
-                elif line.startswith("Name=") and not in_action:
-                    name = line.split("=", 1)[1]
-                elif line.startswith("Exec=") and not in_action:
-                    exec_cmd = line.split("=", 1)[1]
-
-        if name and exec_cmd and not no_display:
-            app_list.append((name, exec_cmd))
-    except:
-        pass
+        sock.connect(get_socket_path())
+        chunks = []
+        while chunk := sock.recv(256 * 1024):
+            chunks.append(chunk)
+    except OSError:
+        return None
+    finally:
+        sock.close()
+    lines = b"".join(chunks).decode().splitlines()
+    apps = []
+    for line in lines:
+        fields = line.split("\t", 2)
+        if len(fields) == 3:
+            name, desktop_id, exec_cmd = fields
+            apps.append((name, exec_cmd, desktop_id))
+    return apps
+
+
+def write_names(out, apps):
+    out.write("".join(f"{app[0]}\n" for app in apps).encode())
+    out.flush()
+
+
+def as_commands(apps):
+    return {name: (exec_cmd, desktop_id) for name, exec_cmd, desktop_id in apps}
+
+
+def stream_apps(out, history):
+    # Feeds app names to fuzzel as soon as each batch is known, most used
+    # first, and returns {name: (exec, desktop-file ID)} for every name
+    # written
+    apps = fetch_from_daemon()
+    if apps is not None:
+        write_names(out, app_history.rank(apps, history.places))
+        return as_commands(apps)
+
+    # Cached entries go first, then whatever the rescan turned up
+    dirs = app_index.APP_DIRS
+    cache_path = app_index.get_cache_path()
+    index = app_index.load_index(cache_path)
+    apps = sort_apps(app_index.apps_from_index(index, dirs))
+    write_names(out, app_history.rank(apps, history.places))
+    commands = as_commands(apps)
+    if app_index.refresh_index(index, dirs):
+        try:
+            app_index.save_index(cache_path, index)
+        except OSError:
+            pass
+        # Names already shown keep working even if the rescan renamed them
+        fresh = sort_apps(app_index.apps_from_index(index, dirs))
+        new = [app for app in fresh if app[0] not in commands]
+        write_names(out, app_history.rank(new, history.places))
+        commands.update(as_commands(fresh))
+    return commands
+
+
+def wait_for_selection(proc, timeout=30.0):
+    # Wakes as soon as fuzzel prints a line or exits, rather than polling;
+    # returns the chosen name or None
+    fd = proc.stdout.fileno()
+    buf = b""
+    deadline = time.monotonic() + timeout
+    with selectors.DefaultSelector() as sel:
+        sel.register(fd, selectors.EVENT_READ)
+        while b"\n" not in buf:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not sel.select(remaining):
+                return None
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            buf += chunk
+    line = buf.split(b"\n", 1)[0].decode(errors="replace").strip()
+    return line or None
 
 
-def main():
-    apps = get_apps()
-    apps.sort(key=lambda x: x[0].lower())
+def spawn(argv):
+    # posix_spawn skips both /bin/sh and subprocess's fork-and-exec
+    # bookkeeping; setsid detaches the app from the launcher's session.
+    # Returns the pid.
+    devnull = [(os.POSIX_SPAWN_OPEN, fd, os.devnull, os.O_RDWR, 0) for fd in (0, 1, 2)]
+    return os.posix_spawnp(argv[0], argv, os.environ, file_actions=devnull, setsid=True)
+
+
+def has_user_systemd():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", "")
+    return bool(shutil.which("systemd-run")) and os.path.exists(
+        os.path.join(runtime_dir, "systemd", "private")
+    )
 
-    # Write to temp file
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False) as f:
-        for name, _ in apps:
-            f.write(name + "\n")
-        temp_path = f.name
 
-    # Run fuzzel - it reads from file via stdin redirect
+def scope_argv(argv, name):
+    # Runs the app in its own transient scope, named the way desktop
+    # launchers name theirs, so its resources are accounted separately
+    unit = re.sub(r"[^A-Za-z0-9:_.-]", "_", name)
+    return [
+        "systemd-run",
+        "--user",
+        "--scope",
+        "--quiet",
+        "--collect",
+        f"--unit=app-fuzzel-{unit}-{os.getpid()}",
+        "--",
+    ] + argv
+
+
+def launch(exec_cmd, name, scope=False):
+    # exec_cmd is the shell-quoted argv desktop_entry.py produced
+    argv = shlex.split(exec_cmd)
+    if scope and has_user_systemd():
+        argv = scope_argv(argv, name)
+    return spawn(argv)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Launch apps through fuzzel")
+    parser.add_argument(
+        "--scope",
+        action="store_true",
+        help="start apps in a transient systemd --user scope when available",
+    )
+    args = parser.parse_args()
+
+    # Start fuzzel first so its startup overlaps with collecting the apps
     # Use setsid to detach from terminal properly
     proc = subprocess.Popen(
-        ["fuzzel", "-d", "-I", "-p", "Apps  >", "-l", "15", "-w", "40"],
-        stdin=open(temp_path, "r"),
+        FUZZEL_CMD,
+        stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         stderr=subprocess.DEVNULL,
         start_new_session=True,
     )
 
-    os.unlink(temp_path)
-
-    # Poll for output with timeout
-    selected = None
-    start = time.time()
-    while time.time() - start < 30:
-        # Check if process has finished
-        ret = proc.poll()
-        if ret is not None:
-            # Process finished
-            if ret == 0:
-                stdout = proc.stdout.read().strip()
-                if stdout:
-                    selected = stdout
-            break
-
-        # Check if there's data ready to read
-        r, _, _ = select.select([proc.stdout], [], [], 0.5)
-        if r:
-            # Read available data
-            chunk = proc.stdout.read(1024)
-            if chunk:
-                # Keep reading until newline or process ends
-                if b"\n" in chunk or b"\r" in chunk:
-                    selected = chunk.decode().strip()
-                    proc.terminate()
-                    break
-
-    if selected:
-        for name, exec_cmd in apps:
-            if name == selected:
-                print(f"Launching: {name}", file=sys.stderr)
-                # Use nohup and setsid to properly detach
-                subprocess.Popen(
-                    exec_cmd,
-                    shell=True,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    start_new_session=True,
-                )
-                break
-    else:
+    history = app_history.History()
+    try:
+        commands = stream_apps(proc.stdin, history)
+    except BrokenPipeError:
+        # fuzzel was dismissed before the list was complete
+        commands = {}
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    selected = wait_for_selection(proc)
+    chosen_at = time.perf_counter()
+
+    exec_cmd, desktop_id = commands.get(selected, (None, None))
+    if exec_cmd:
+        try:
+            launch(exec_cmd, selected, args.scope)
+        except (OSError, ValueError) as e:
+            print(f"app-launcher.py: cannot launch {selected}: {e}", file=sys.stderr)
+        else:
+            elapsed = (time.perf_counter() - chosen_at) * 1e3
+            print(f"Launching: {selected} ({elapsed:.2f} ms)", file=sys.stderr)
+            try:
+                history.record(desktop_id)
+            except OSError:
+                pass
+
+    # fuzzel normally exits right after printing; don't leave it behind
+    if proc.poll() is None:
         proc.terminate()
-        proc.wait()
+    proc.wait()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# Launch history for app-launcher.py, used to put frequently and recently
+# launched apps first.
+#
+# The log is append-only text, one "unix-time<TAB>id" line per launch, id
+# being the desktop-file ID: display names get disambiguated when two IDs
+# share one, which would otherwise start the app's history over.
+# An app's score is log(sum(exp(RATE * t))) over its launches: launches
+# lose half their weight every HALF_LIFE seconds, and comparing scores
+# needs no clock. Compaction rewrites each app as a single line whose
+# time carries the same score, so the format never changes.
+
+import fcntl
+import math
+import mmap
+import os
+import time
+
+HALF_LIFE = 7 * 24 * 3600
+RATE = math.log(2) / HALF_LIFE
+
+# Compact once the log holds this many lines per app (and at least
+# COMPACT_MIN lines)
+COMPACT_RATIO = 4
+COMPACT_MIN = 256
+
+# Entries weighing less than one launch this many half-lives ago are
+# dropped when compacting, which also forgets uninstalled apps
+FORGET_AFTER = 20
+
+
+def get_history_path():
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(data_home, "fuzzel-apps", "history.log")
+
+
+def parse_log(data):
+    # Returns ({app_id: score}, number of lines)
+    scores = {}
+    lines = data.decode(errors="replace").splitlines()
+    for line in lines:
+        stamp, _, app_id = line.partition("\t")
+        try:
+            x = float(stamp) * RATE
+        except ValueError:
+            continue
+        prev = scores.get(app_id)
+        if prev is None:
+            scores[app_id] = x
+        elif prev > x:
+            scores[app_id] = prev + math.log1p(math.exp(x - prev))
+        else:
+            scores[app_id] = x + math.log1p(math.exp(prev - x))
+    return scores, len(lines)
+
+
+def positions(scores):
+    # {app_id: place}, best score first. Compacted logs are written in this
+    # order already, which keeps the sort close to linear.
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return {app_id: i for i, app_id in enumerate(ordered)}
+
+
+def rank(apps, places):
+    # Launched apps move to the front in score order, the rest keep their
+    # (alphabetical) order. One pass, no sorting; a repeated ID after the
+    # first goes with the rest.
+    if not places:
+        return apps
+    slots = [None] * len(places)
+    rest = []
+    get = places.get
+    for app in apps:
+        i = get(app[2])
+        if i is None or slots[i] is not None:
+            rest.append(app)
+        else:
+            slots[i] = app
+    return [app for app in slots if app is not None] + rest
+
+
+class History:
+    """Launch scores, loaded from the log on first use."""
+
+    def __init__(self, path=None):
+        self.path = path or get_history_path()
+        self._scores = None
+        self._places = None
+        self.lines = 0
+
+    @property
+    def scores(self):
+        if self._scores is None:
+            self._scores, self.lines = self._load()
+            self._places = None
+        return self._scores
+
+    @property
+    def places(self):
+        if self._places is None:
+            self._places = positions(self.scores)
+        return self._places
+
+    def _load(self):
+        try:
+            with (
+                open(self.path, "rb") as f,
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+            ):
+                return parse_log(mm[:])
+        except (OSError, ValueError):
+            # Missing or empty log
+            return {}, 0
+
+    def record(self, app_id, when=None):
+        when = time.time() if when is None else when
+        line = f"{when:.0f}\t{app_id}\n".encode()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # A separate lock file, since compaction replaces the log itself
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(self.path, "ab") as f:
+                f.write(line)
+            # Re-read under the lock so other launchers' entries count too
+            self._scores = None
+            limit = max(COMPACT_MIN, COMPACT_RATIO * len(self.scores))
+            if self.lines >= limit:
+                self._compact(when)
+
+    def _compact(self, now):
+        floor = (now - FORGET_AFTER * HALF_LIFE) * RATE
+        kept = sorted(
+            ((score, app_id) for app_id, score in self.scores.items() if score > floor),
+            reverse=True,
+        )
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(
+                "".join(f"{score / RATE:.3f}\t{app_id}\n" for score, app_id in kept)
+            )
+        os.replace(tmp_path, self.path)
+        self._scores = {app_id: score for score, app_id in kept}
+        self._places = None
+        self.lines = len(kept)
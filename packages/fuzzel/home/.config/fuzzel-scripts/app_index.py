@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# Desktop entry discovery for app-launcher.py. Parsed entries are kept in an
+# on-disk index keyed by file inode and mtime, so only changed .desktop
+# files get re-parsed when the launcher opens.
+#
+# Entries are identified by desktop-file ID (the file name, as the scan is
+# not recursive). The first directory in APP_DIRS providing an ID wins, so
+# a user copy shadows the system one, hidden or not.
+
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import desktop_entry
+
+
+def get_app_dirs():
+    # $XDG_DATA_HOME, then $XDG_DATA_DIRS in order, as the basedir spec has it
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    data_dirs = os.environ.get("XDG_DATA_DIRS") or "/usr/local/share:/usr/share"
+    dirs = [data_home] + [d for d in data_dirs.split(":") if d]
+    return [os.path.join(d, "applications") for d in dirs]
+
+
+APP_DIRS = get_app_dirs()
+
+INDEX_VERSION = 2
+
+# Changed files are parsed on a thread pool when a directory has at least
+# PARALLEL_MIN of them and parsing the first PARALLEL_MIN was mostly spent
+# waiting rather than computing: on Flatpak/Nix exports, network homes and
+# cold caches, opening files costs far more than parsing them. With files
+# in the page cache the GIL makes threads slower than one loop.
+SCAN_WORKERS = 8
+PARALLEL_MIN = 64
+
+
+def get_cache_path():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "fuzzel-apps", "index.pickle")
+
+
+def get_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "fuzzel-apps.sock")
+    return os.path.join(tempfile.gettempdir(), f"fuzzel-apps-{os.getuid()}.sock")
+
+
+def sort_apps(apps):
+    apps.sort(key=lambda x: x[0].lower())
+    return apps
+
+
+def parse_entry(filepath):
+    # The (name, exec) pair for a desktop file, or None if it isn't listed
+    return desktop_entry.parse(filepath)
+
+
+def index_env():
+    # Parsed entries depend on these, so a change invalidates the index
+    return (tuple(desktop_entry.current_desktops()), desktop_entry.current_locale())
+
+
+def load_index(path):
+    # The whole index comes in with one read; anything unexpected starts over
+    try:
+        with open(path, "rb") as f:
+            index = pickle.load(f)
+        if index.get("version") == INDEX_VERSION and index.get("env") == index_env():
+            return index
+    except Exception:
+        pass
+    return {"version": INDEX_VERSION, "env": index_env(), "dirs": {}}
+
+
+def save_index(path, index):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def parse_entries(paths, workers=None):
+    # parse_entry() for each path, results in the same order
+    workers = SCAN_WORKERS if workers is None else workers
+    if workers <= 1 or len(paths) < PARALLEL_MIN:
+        return [parse_entry(path) for path in paths]
+
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    parsed = [parse_entry(path) for path in paths[:PARALLEL_MIN]]
+    if time.perf_counter() - wall < 2 * (time.thread_time() - cpu):
+        return parsed + [parse_entry(path) for path in paths[PARALLEL_MIN:]]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return parsed + list(pool.map(parse_entry, paths[PARALLEL_MIN:], chunksize=16))
+
+
+def scan_dir(directory, cached, workers=None):
+    # Returns ({filename: (inode, mtime_ns, entry)}, changed)
+    entries = {}
+    stale = []
+    with os.scandir(directory) as it:
+        for dirent in it:
+            if not dirent.name.endswith(".desktop"):
+                continue
+            try:
+                st = dirent.stat()
+            except OSError:
+                continue
+            prev = cached.get(dirent.name)
+            if prev and prev[0] == st.st_ino and prev[1] == st.st_mtime_ns:
+                entries[dirent.name] = prev
+            else:
+                # Placeholder keeps the directory's order
+                entries[dirent.name] = None
+                stale.append((dirent.name, dirent.path, st))
+
+    parsed = parse_entries([path for _, path, _ in stale], workers)
+    for (name, _, st), entry in zip(stale, parsed):
+        entries[name] = (st.st_ino, st.st_mtime_ns, entry)
+    # Deleted files drop out of the index too
+    return entries, bool(stale) or entries.keys() != cached.keys()
+
+
+def refresh_index(index, dirs):
+    # Brings every directory up to date; returns True if anything changed
+    desktop_entry.find_program.cache_clear()
+    dirty = False
+    for directory in dirs:
+        if not os.path.isdir(directory):
+            dirty |= index["dirs"].pop(directory, None) is not None
+            continue
+        entries, changed = scan_dir(directory, index["dirs"].get(directory, {}))
+        if changed:
+            index["dirs"][directory] = entries
+            dirty = True
+    return dirty
+
+
+def update_file(index, directory, filename):
+    # Re-reads a single desktop file after a change notification; returns
+    # True if the index changed
+    if not filename.endswith(".desktop"):
+        return False
+    entries = index["dirs"].setdefault(directory, {})
+    path = os.path.join(directory, filename)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return entries.pop(filename, None) is not None
+    prev = entries.get(filename)
+    if prev and prev[0] == st.st_ino and prev[1] == st.st_mtime_ns:
+        return False
+    entries[filename] = (st.st_ino, st.st_mtime_ns, parse_entry(path))
+    return True
+
+
+def apps_from_index(index, dirs):
+    # One (display name, exec, desktop-file ID) triple per ID, display
+    # names unique. Names shared by several IDs get the ID appended, so what
+    # is shown doesn't depend on scan order.
+    by_id = {}
+    for directory in dirs:
+        for filename, (_, _, entry) in index["dirs"].get(directory, {}).items():
+            by_id.setdefault(filename, entry)
+
+    counts = {}
+    for entry in by_id.values():
+        if entry is not None:
+            counts[entry[0]] = counts.get(entry[0], 0) + 1
+
+    apps = []
+    for desktop_id, entry in by_id.items():
+        if entry is None:
+            continue
+        name, exec_cmd = entry
+        if counts[name] > 1:
+            name = f"{name} ({desktop_id.removesuffix('.desktop')})"
+        apps.append((name, exec_cmd, desktop_id))
+    return apps
+
+
+def get_apps(dirs=None, cache_path=None):
+    dirs = APP_DIRS if dirs is None else dirs
+    cache_path = cache_path or get_cache_path()
+    index = load_index(cache_path)
+    if refresh_index(index, dirs):
+        try:
+            save_index(cache_path, index)
+        except OSError:
+            pass
+    return apps_from_index(index, dirs)
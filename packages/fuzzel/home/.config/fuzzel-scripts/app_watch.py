@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# Change notifications for application directories: inotify through ctypes
+# where available, otherwise periodic stat polling (stdlib only). A
+# directory that doesn't exist yet is waited for on its nearest existing
+# parent, and callers are asked to rescan once it shows up.
+
+import ctypes
+import ctypes.util
+import os
+import struct
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_MASK_ADD = 0x20000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+# On the parent of a missing directory, only the next path component
+# appearing (or the parent itself going away) matters
+PARENT_MASK = IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_HEADER = struct.Struct("iIII")
+
+# Returned by read() when individual changes were lost and callers should
+# rescan everything
+RESCAN = (None, None)
+
+
+class InotifyWatcher:
+    """Reports (directory, filename) pairs for changed files."""
+
+    def __init__(self, dirs):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        # wd -> names of missing path components under that directory
+        self.parents = {}
+        for directory in dirs:
+            self.watch(directory)
+
+    def add_watch(self, path, mask):
+        return self.libc.inotify_add_watch(
+            self.fd, os.fsencode(path), mask | IN_ONLYDIR
+        )
+
+    def watch(self, directory):
+        wd = self.add_watch(directory, WATCH_MASK)
+        if wd >= 0:
+            self.dirs[wd] = directory
+            return
+        child, parent = directory, os.path.dirname(directory)
+        while parent != child:
+            # IN_MASK_ADD, as the parent may be watched for another directory
+            wd = self.add_watch(parent, PARENT_MASK | IN_MASK_ADD)
+            if wd >= 0:
+                self.parents.setdefault(wd, set()).add(os.path.basename(child))
+                if os.path.isdir(child):
+                    # Created before the parent watch was in place
+                    self.watch(directory)
+                return
+            child, parent = parent, os.path.dirname(parent)
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+    def read(self):
+        changes = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changes
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+                offset += EVENT_HEADER.size
+                name = buf[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    changes.append(RESCAN)
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    # The directory itself went away
+                    self.dirs.pop(wd, None)
+                    self.parents.pop(wd, None)
+                    changes.append(RESCAN)
+                elif os.fsdecode(name) in self.parents.get(wd, ()):
+                    # A missing directory, or one of its parents, appeared
+                    changes.append(RESCAN)
+                elif wd in self.dirs and name:
+                    changes.append((self.dirs[wd], os.fsdecode(name)))
+
+
+class PollWatcher:
+    """Fallback when inotify isn't usable: callers rescan on every tick."""
+
+    interval = 2.0
+
+    def __init__(self, dirs):
+        self.dirs = list(dirs)
+
+    def fileno(self):
+        return None
+
+    def close(self):
+        pass
+
+    def read(self):
+        return [RESCAN]
+
+
+def make_watcher(dirs):
+    try:
+        return InotifyWatcher(dirs)
+    except (OSError, AttributeError):
+        return PollWatcher(dirs)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# Desktop Entry Specification parsing for app_index.py.
+#
+# A file is read in one go and only the [Desktop Entry] group is split into
+# raw key/value pairs; parsing stops at the next group, so actions and other
+# sections cost nothing. Values are unescaped only when asked for.
+
+import functools
+import os
+import re
+import shlex
+import shutil
+
+GROUP = "[Desktop Entry]"
+
+# Codes that expand to files or URLs, or are deprecated; the launcher never
+# passes any, so they are dropped
+DROPPED_CODES = {"%f", "%F", "%u", "%U", "%d", "%D", "%n", "%N", "%v", "%m"}
+FIELD_CODE = re.compile(r"%(.?)")
+# Exec values without these split on whitespace alone
+QUOTING = re.compile(r"[\"'\\]")
+
+ESCAPES = {"s": " ", "n": "\n", "t": "\t", "r": "\r", "\\": "\\"}
+ESCAPE = re.compile(r"\\(.?)")
+
+
+def unescape(value):
+    if "\\" not in value:
+        return value
+    return ESCAPE.sub(lambda m: ESCAPES.get(m.group(1), m.group(0)), value)
+
+
+def split_list(value):
+    # Lists are ";"-separated with an optional trailing ";"; "\;" is literal
+    items = []
+    for item in re.split(r"(?<!\\);", value):
+        if item:
+            items.append(unescape(item.replace("\\;", ";")))
+    return items
+
+
+def locale_keys(key, lang=None):
+    # Candidate keys in the spec's matching order for LC_MESSAGES of the
+    # form lang_COUNTRY.ENCODING@MODIFIER, falling back to the bare key
+    if lang is None:
+        lang = current_locale()
+    lang, _, modifier = lang.partition("@")
+    lang = lang.partition(".")[0]
+    lang, _, country = lang.partition("_")
+    keys = []
+    if lang and lang not in ("C", "POSIX"):
+        if country and modifier:
+            keys.append(f"{key}[{lang}_{country}@{modifier}]")
+        if country:
+            keys.append(f"{key}[{lang}_{country}]")
+        if modifier:
+            keys.append(f"{key}[{lang}@{modifier}]")
+        keys.append(f"{key}[{lang}]")
+    keys.append(key)
+    return keys
+
+
+def current_locale():
+    for var in ("LC_ALL", "LC_MESSAGES", "LANG"):
+        if os.environ.get(var):
+            return os.environ[var]
+    return ""
+
+
+def current_desktops():
+    return [d for d in os.environ.get("XDG_CURRENT_DESKTOP", "").split(":") if d]
+
+
+@functools.lru_cache(maxsize=None)
+def find_program(program):
+    # The same TryExec programs come up again and again during a scan;
+    # clear the cache before the next one
+    return shutil.which(program)
+
+
+class DesktopEntry:
+    """Raw [Desktop Entry] values of one file, decoded on access."""
+
+    def __init__(self, path, raw):
+        self.path = path
+        self.raw = raw
+
+    @classmethod
+    def read(cls, path):
+        # Raises OSError if the file can't be read and ValueError if it
+        # isn't a desktop entry
+        with open(path, "rb") as f:
+            text = f.read().decode("utf-8", errors="replace")
+        # Only comments and blank lines may come before the group header
+        start = 0
+        while True:
+            end = text.find("\n", start)
+            line = text[start:] if end < 0 else text[start:end]
+            if line.rstrip() == GROUP:
+                break
+            if line and line[0] != "#" or end < 0:
+                raise ValueError(f"{path}: first group is not {GROUP}")
+            start = end + 1
+        start = end + 1 if end >= 0 else len(text)
+        end = text.find("\n[", start)
+        body = text[start:] if end < 0 else text[start:end]
+
+        raw = {}
+        for line in body.splitlines():
+            if not line or line[0] == "#":
+                continue
+            key, sep, value = line.partition("=")
+            if sep:
+                key = key.strip()
+                # First occurrence wins, like most implementations
+                if key not in raw:
+                    raw[key] = value.strip()
+        return cls(path, raw)
+
+    def get(self, key, default=None):
+        value = self.raw.get(key)
+        return default if value is None else unescape(value)
+
+    def get_bool(self, key):
+        return self.raw.get(key) == "true"
+
+    def get_list(self, key):
+        value = self.raw.get(key)
+        return split_list(value) if value else []
+
+    def get_localized(self, key, lang=None):
+        for candidate in locale_keys(key, lang):
+            if candidate in self.raw:
+                return self.get(candidate)
+        return None
+
+    def shown_in(self, desktops):
+        only = self.get_list("OnlyShowIn")
+        if only and not any(d in only for d in desktops):
+            return False
+        return not any(d in self.get_list("NotShowIn") for d in desktops)
+
+    def try_exec_ok(self):
+        program = self.get("TryExec")
+        if not program:
+            return True
+        if os.path.isabs(program):
+            return os.access(program, os.X_OK)
+        return find_program(program) is not None
+
+    def exec_argv(self, name=None):
+        # The Exec command with field codes expanded for a launch without
+        # files or URLs; raises ValueError on unbalanced quoting
+        value = self.get("Exec")
+        if not value:
+            return None
+        argv = []
+        args = shlex.split(value) if QUOTING.search(value) else value.split()
+        for arg in args:
+            if arg in DROPPED_CODES:
+                continue
+            if arg == "%i":
+                icon = self.get("Icon")
+                if icon:
+                    argv += ["--icon", icon]
+                continue
+            if "%" in arg:
+                arg = FIELD_CODE.sub(lambda m: self._expand(m.group(1), name), arg)
+            argv.append(arg)
+        return argv or None
+
+    def _expand(self, code, name):
+        if code == "%":
+            return "%"
+        if code == "c":
+            return name or self.get_localized("Name") or ""
+        if code == "k":
+            return self.path
+        return ""
+
+
+def parse(path, desktops=None, lang=None):
+    # The (display name, command) pair for a launchable entry, or None if
+    # it should not be listed. The command is shell-quoted argv.
+    try:
+        entry = DesktopEntry.read(path)
+    except (OSError, ValueError):
+        return None
+    if entry.raw.get("Type", "Application") != "Application":
+        return None
+    if entry.get_bool("Hidden") or entry.get_bool("NoDisplay"):
+        return None
+    if not entry.shown_in(current_desktops() if desktops is None else desktops):
+        return None
+    name = entry.get_localized("Name", lang)
+    if not name:
+        return None
+    try:
+        argv = entry.exec_argv(name)
+    except ValueError:
+        return None
+    if not argv or not entry.try_exec_ok():
+        return None
+    return name, shlex.join(argv)
@@ -0,0 +1,194 @@
+# Filter lists for qutebrowser's blocker, kept as a local mirror.
+#
+# config.py points qutebrowser at file:// copies once they exist, so
+# :adblock-update compiles from disk instead of downloading every list.
+# sync() refreshes the mirror with conditional requests (ETag and
+# Last-Modified) and keeps a SHA-256 per list. compiled.json holds the
+# hashes the blocker was last compiled from, so userscripts/adblock-sync
+# asks for a recompile only when the mirror has moved on since.
+#
+# This module is imported by config.py on every start: keep it cheap,
+# network code is imported inside sync().
+
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+ADBLOCK_LISTS = [
+    "https://easylist.to/easylist/easylist.txt",
+    "https://easylist.to/easylist/easyprivacy.txt",
+    "https://secure.fanboy.co.nz/fanboy-annoyance.txt",
+    "https://easylist.to/easylist/fanboy-social.txt",
+    "https://raw.githubusercontent.com/uBlockOrigin/uAssets/master/filters/filters.txt",
+    "https://raw.githubusercontent.com/uBlockOrigin/uAssets/master/filters/privacy.txt",
+    "https://raw.githubusercontent.com/uBlockOrigin/uAssets/master/filters/resource-abuse.txt",
+]
+
+# qutebrowser's default hosts list, refreshed by the same :adblock-update
+HOSTS_LISTS = [
+    "https://raw.githubusercontent.com/StevenBlack/hosts/master/hosts",
+]
+
+FETCH_TIMEOUT = 30.0
+FETCH_WORKERS = 4
+
+
+def mirror_dir() -> str:
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(data_home, "qutebrowser-adblock")
+
+
+def mirror_name(url: str) -> str:
+    # Readable and unique: the last path parts plus a short hash of the URL
+    tail = "-".join(url.rstrip("/").split("/")[-2:])
+    tail = re.sub(r"[^A-Za-z0-9._-]", "_", tail)
+    return f"{tail}-{hashlib.sha256(url.encode()).hexdigest()[:8]}"
+
+
+def local_urls(urls: List[str], directory: Optional[str] = None) -> List[str]:
+    # The file:// URL for every list with a mirrored copy, the remote URL
+    # for the rest
+    directory = directory or mirror_dir()
+    result = []
+    for url in urls:
+        path = os.path.join(directory, mirror_name(url))
+        result.append(f"file://{path}" if os.path.exists(path) else url)
+    return result
+
+
+def load_state(directory: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(directory, "state.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(directory: str, state: Dict[str, dict]) -> None:
+    path = os.path.join(directory, "state.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def stale_lists(urls: List[str], directory: Optional[str] = None) -> List[str]:
+    # Mirrored lists whose content the blocker hasn't been compiled from
+    directory = directory or mirror_dir()
+    state = load_state(directory)
+    try:
+        with open(os.path.join(directory, "compiled.json"), encoding="utf-8") as f:
+            compiled = json.load(f)
+    except (OSError, ValueError):
+        compiled = {}
+    return [
+        url
+        for url in urls
+        if url in state and state[url]["sha256"] != compiled.get(url)
+    ]
+
+
+def mirror_hashes(urls: List[str], directory: Optional[str] = None) -> Dict[str, str]:
+    # What a compile started now is built from
+    state = load_state(directory or mirror_dir())
+    return {url: state[url]["sha256"] for url in urls if url in state}
+
+
+def mark_compiled(hashes: Dict[str, str], directory: Optional[str] = None) -> None:
+    # Only once the compile is known to have finished; a list that is
+    # recorded too early would never be compiled
+    path = os.path.join(directory or mirror_dir(), "compiled.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def fetch(url: str, entry: dict, path: str) -> dict:
+    """Refreshes one mirrored list.
+
+    Returns the new state entry with ``status`` set to "changed",
+    "unchanged" or "error" and ``received`` to the bytes read off the
+    wire (compressed, headers excluded).
+    """
+    import gzip
+    import urllib.error
+    import urllib.request
+
+    request = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+    # Validators only count while the copy they describe is still there
+    if os.path.exists(path):
+        if entry.get("etag"):
+            request.add_header("If-None-Match", entry["etag"])
+        if entry.get("last_modified"):
+            request.add_header("If-Modified-Since", entry["last_modified"])
+    try:
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            body = response.read()
+            headers = response.headers
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return dict(entry, status="unchanged", received=0)
+        return dict(entry, status="error", error=f"HTTP {e.code}", received=0)
+    except (OSError, ValueError) as e:
+        return dict(entry, status="error", error=str(e), received=0)
+
+    received = len(body)
+    if headers.get("Content-Encoding") == "gzip":
+        try:
+            body = gzip.decompress(body)
+        except (OSError, EOFError) as e:
+            return dict(entry, status="error", error=str(e), received=received)
+    new = {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "sha256": hashlib.sha256(body).hexdigest(),
+        "size": len(body),
+    }
+    # Servers without validators resend everything; the hash still tells
+    # whether the blocker needs recompiling
+    if new["sha256"] == entry.get("sha256") and os.path.exists(path):
+        return dict(new, status="unchanged", received=received)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return dict(new, status="changed", received=received)
+
+
+def sync(
+    urls: List[str], directory: Optional[str] = None, force: bool = False
+) -> Dict[str, dict]:
+    # Refreshes the mirror of urls and returns {url: result}, see fetch().
+    # Lists that fail keep their previous copy.
+    from concurrent.futures import ThreadPoolExecutor
+
+    directory = directory or mirror_dir()
+    os.makedirs(directory, exist_ok=True)
+    state = load_state(directory)
+
+    def one(url: str) -> dict:
+        entry = {} if force else state.get(url, {})
+        return fetch(url, entry, os.path.join(directory, mirror_name(url)))
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        results = dict(zip(urls, pool.map(one, urls)))
+
+    kept = {}
+    for url in urls:
+        r = results[url]
+        if r["status"] != "error":
+            kept[url] = {k: r[k] for k in ("etag", "last_modified", "sha256", "size")}
+        elif url in state:
+            kept[url] = state[url]
+    save_state(directory, kept)
+
+    # Copies of lists no longer configured
+    for url in state.keys() - kept.keys():
+        try:
+            os.unlink(os.path.join(directory, mirror_name(url)))
+        except OSError:
+            pass
+    return results
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# Benchmarks and checks adblock_lists.sync() against a local HTTP stand-in
+# for the list servers, and the blocker's compile and load cost.
+#
+# Usage: adblock_lists_bench.py [sync|compile ...] [--lines N] [--lists DIR]
+#
+# sync reports bytes on the wire and time for a cold mirror, a re-sync with
+# nothing changed, one changed list and a server without validators.
+# compile needs python-adblock: it times compiling the engine from the
+# mirrored lists (what every :adblock-update costs) against loading the
+# serialized engine (what qutebrowser does at startup). Exits non-zero
+# when a check fails.
+
+import argparse
+import gzip
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import adblock_lists
+
+
+def make_list(lines: int, seed: int) -> bytes:
+    # Filter lines in the proportions of easylist: mostly network rules,
+    # a fair share of cosmetic ones and a few exceptions
+    rng = random.Random(seed)
+    out = [f"! Title: Synthetic list {seed}", "! Expires: 4 days"]
+    for i in range(lines):
+        host = f"ads{rng.randrange(1 << 20):x}.example{i % 97}.com"
+        kind = rng.random()
+        if kind < 0.55:
+            out.append(f"||{host}^$third-party")
+        elif kind < 0.75:
+            out.append(f"/banner/{i}/*$image,script")
+        elif kind < 0.95:
+            out.append(f"##.ad-slot-{i:x}")
+        else:
+            out.append(f"@@||{host}^$document")
+    return ("\n".join(out) + "\n").encode()
+
+
+class ListServer:
+    """Serves lists over HTTP with ETag, Last-Modified and gzip support."""
+
+    def __init__(self, lists: Dict[str, bytes], validators: bool = True):
+        self.lists = dict(lists)
+        self.modified = {path: time.time() for path in lists}
+        self.validators = validators
+        self.sent = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                server.handle(self)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def change(self, path: str, body: bytes) -> None:
+        self.lists[path] = body
+        # Last-Modified has one second resolution
+        self.modified[path] = self.modified[path] + 1
+
+    def handle(self, req: BaseHTTPRequestHandler) -> None:
+        body = self.lists.get(req.path)
+        if body is None:
+            req.send_error(404)
+            return
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        modified = formatdate(self.modified[req.path], usegmt=True)
+        with self.lock:
+            self.requests += 1
+        if self.validators and (
+            req.headers.get("If-None-Match") == etag
+            or req.headers.get("If-Modified-Since") == modified
+        ):
+            req.send_response(304)
+            req.end_headers()
+            return
+        if "gzip" in req.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, 6)
+            req.send_response(200)
+            req.send_header("Content-Encoding", "gzip")
+        else:
+            req.send_response(200)
+        if self.validators:
+            req.send_header("ETag", etag)
+            req.send_header("Last-Modified", modified)
+        req.send_header("Content-Length", str(len(body)))
+        req.end_headers()
+        req.wfile.write(body)
+        with self.lock:
+            self.sent += len(body)
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def run_sync(
+    label: str, server: ListServer, urls: List[str], directory: str, force=False
+) -> dict:
+    server.sent = server.requests = 0
+    start = time.perf_counter()
+    results = adblock_lists.sync(urls, directory, force)
+    elapsed = time.perf_counter() - start
+    counts = {"changed": 0, "unchanged": 0, "error": 0}
+    for r in results.values():
+        counts[r["status"]] += 1
+    print(
+        f"  {label:<26} {server.sent / 1024:9.1f} KiB  {elapsed * 1e3:7.1f} ms"
+        f"  changed {counts['changed']}  unchanged {counts['unchanged']}"
+        f"  errors {counts['error']}"
+    )
+    return counts
+
+
+def bench_sync(args: argparse.Namespace) -> bool:
+    print(f"sync: 8 lists of {args.lines} lines from a local server")
+    paths = [f"/list-{i}.txt" for i in range(8)]
+    lists = {path: make_list(args.lines, i) for i, path in enumerate(paths)}
+    raw = sum(len(body) for body in lists.values())
+    print(f"  uncompressed total {raw / 1024:.1f} KiB")
+
+    failures = []
+
+    def check(ok: bool, what: str) -> None:
+        if not ok:
+            failures.append(what)
+
+    mirror = tempfile.mkdtemp(prefix="adblock-mirror-")
+    server = ListServer(lists)
+    try:
+        urls = [server.url(path) for path in paths]
+        counts = run_sync("cold", server, urls, mirror)
+        check(counts["changed"] == 8, "cold sync fetches every list")
+        for url, path in zip(urls, paths):
+            with open(os.path.join(mirror, adblock_lists.mirror_name(url)), "rb") as f:
+                check(f.read() == lists[path], f"mirrored copy of {path}")
+        check(
+            adblock_lists.stale_lists(urls, mirror) == urls,
+            "fresh mirror needs a compile",
+        )
+        adblock_lists.mark_compiled(adblock_lists.mirror_hashes(urls, mirror), mirror)
+        start = time.perf_counter()
+        for _ in range(100):
+            adblock_lists.local_urls(urls, mirror)
+        per_start = (time.perf_counter() - start) / 100
+        print(f"  local_urls() in config.py    {per_start * 1e6:9.1f} us")
+        check(
+            all(
+                u.startswith("file://") for u in adblock_lists.local_urls(urls, mirror)
+            ),
+            "config points at file:// copies",
+        )
+
+        counts = run_sync("nothing changed", server, urls, mirror)
+        check(counts["unchanged"] == 8, "re-sync finds no change")
+        check(server.sent == 0, "re-sync sends no bodies")
+        check(not adblock_lists.stale_lists(urls, mirror), "re-sync needs no compile")
+
+        server.change(paths[3], make_list(args.lines, 100))
+        counts = run_sync("one list changed", server, urls, mirror)
+        check(counts["changed"] == 1, "one changed list is fetched")
+        check(
+            adblock_lists.stale_lists(urls, mirror) == [urls[3]],
+            "only the changed list is stale",
+        )
+        adblock_lists.mark_compiled(adblock_lists.mirror_hashes(urls, mirror), mirror)
+
+        counts = run_sync("forced", server, urls, mirror, force=True)
+        check(counts["changed"] == 8, "forced sync rewrites every list")
+        adblock_lists.mark_compiled(adblock_lists.mirror_hashes(urls, mirror), mirror)
+    finally:
+        server.close()
+
+    # Same mirror, now behind a server that ignores conditional requests
+    server = ListServer(
+        {path: server.lists[path] for path in paths},
+        validators=False,
+    )
+    try:
+        moved = [server.url(path) for path in paths]
+        # New URLs: carry the mirror over as if the lists had moved
+        for old, new in zip(urls, moved):
+            os.replace(
+                os.path.join(mirror, adblock_lists.mirror_name(old)),
+                os.path.join(mirror, adblock_lists.mirror_name(new)),
+            )
+        state = adblock_lists.load_state(mirror)
+        adblock_lists.save_state(
+            mirror, {new: state[old] for old, new in zip(urls, moved)}
+        )
+        counts = run_sync("no validators", server, moved, mirror)
+        check(counts["unchanged"] == 8, "hashes catch unchanged lists")
+
+        server.close()
+        counts = run_sync("server down", server, moved, mirror)
+        check(counts["error"] == 8, "errors are reported")
+        check(
+            all(
+                u.startswith("file://") for u in adblock_lists.local_urls(moved, mirror)
+            ),
+            "failed lists keep their copy",
+        )
+    finally:
+        shutil.rmtree(mirror, ignore_errors=True)
+
+    for what in failures:
+        print(f"  FAIL: {what}")
+    return bool(failures)
+
+
+def bench_compile(args: argparse.Namespace) -> Optional[bool]:
+    try:
+        import adblock
+    except ImportError:
+        print("compile: skipped, python-adblock is not installed")
+        return None
+    print("compile: engine from the lists vs loading the serialized engine")
+
+    if args.lists:
+        files = sorted(
+            os.path.join(args.lists, name)
+            for name in os.listdir(args.lists)
+            if not name.endswith(".json")
+        )
+        texts = []
+        for path in files:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                texts.append(f.read())
+    else:
+        texts = [make_list(args.lines, i).decode() for i in range(8)]
+    rules = sum(text.count("\n") for text in texts)
+    print(f"  {len(texts)} lists, {rules} lines")
+
+    workdir = tempfile.mkdtemp(prefix="adblock-engine-")
+    try:
+        start = time.perf_counter()
+        filter_set = adblock.FilterSet()
+        for text in texts:
+            filter_set.add_filter_list(text)
+        engine = adblock.Engine(filter_set)
+        compiled = time.perf_counter() - start
+
+        path = os.path.join(workdir, "blocking-adblock")
+        start = time.perf_counter()
+        engine.serialize_to_file(path)
+        saved = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded = adblock.Engine(adblock.FilterSet())
+        loaded.deserialize_from_file(path)
+        load = time.perf_counter() - start
+        size = os.path.getsize(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"  compile (every :adblock-update) {compiled * 1e3:9.1f} ms")
+    print(f"  serialize                       {saved * 1e3:9.1f} ms")
+    print(
+        f"  load at startup                 {load * 1e3:9.1f} ms  ({size / 1024:.0f} KiB)"
+    )
+    return None
+
+
+BENCHES = {
+    "sync": bench_sync,
+    "compile": bench_compile,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the adblock list mirror")
+    parser.add_argument("bench", nargs="*", help=f"any of: {', '.join(BENCHES)}")
+    parser.add_argument("--lines", type=int, default=20000, help="lines per list")
+    parser.add_argument("--lists", help="directory of real lists for compile")
+    args = parser.parse_args()
+    unknown = set(args.bench) - set(BENCHES)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+    failed = False
+    for name in args.bench or BENCHES:
+        failed |= bool(BENCHES[name](args))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,19 +2,27 @@
 # Location: ~/.config/qutebrowser/config.py
 
 import os
+import adblock_lists
+import config_profile
+import domain_policy
 from qutebrowser.config.configfiles import ConfigAPI
 from qutebrowser.config.config import ConfigContainer
 
 config: ConfigAPI = config
 c: ConfigContainer = c
 
+# Section timings with QUTE_CONFIG_PROFILE set, see config_profile.py
+profile = config_profile.Profile.from_env()
+
 # Load autoconfig (GUI settings)
-config.load_autoconfig()
+profile.call("load_autoconfig", config.load_autoconfig)
 
 # ============================================================================
 # GENERAL SETTINGS
 # ============================================================================
 
+profile.mark("GENERAL SETTINGS")
+
 # Automatically save the config file on exit
 c.auto_save.session = False
 
@@ -41,22 +49,20 @@ c.qt.args = ["--disable-crash-reporter", "--disable-logging", "--silent"]
 # CONTENT SETTINGS & PRIVACY
 # ============================================================================
 
+profile.mark("CONTENT SETTINGS & PRIVACY")
+
 # Enable adblock (requires python-adblock package)
 # Install with: pip install adblock or from AUR: python-adblock
 try:
     c.content.blocking.enabled = True
     c.content.blocking.method = "both"
 
-    # AdBlock lists (only set if adblock is available)
-    c.content.blocking.adblock.lists = [
-        "https://easylist.to/easylist/easylist.txt",
-        "https://easylist.to/easylist/easyprivacy.txt",
-        "https://secure.fanboy.co.nz/fanboy-annoyance.txt",
-        "https://easylist.to/easylist/fanboy-social.txt",
-        "https://raw.githubusercontent.com/uBlockOrigin/uAssets/master/filters/filters.txt",
-        "https://raw.githubusercontent.com/uBlockOrigin/uAssets/master/filters/privacy.txt",
-        "https://raw.githubusercontent.com/uBlockOrigin/uAssets/master/filters/resource-abuse.txt",
-    ]
+    # AdBlock lists (only set if adblock is available). Mirrored copies are
+    # used once :adblock-sync has fetched them, see adblock_lists.py
+    c.content.blocking.adblock.lists = adblock_lists.local_urls(
+        adblock_lists.ADBLOCK_LISTS
+    )
+    c.content.blocking.hosts.lists = adblock_lists.local_urls(adblock_lists.HOSTS_LISTS)
 except Exception:
     # Fallback if adblock is not available
     c.content.blocking.enabled = False
@@ -91,6 +97,8 @@ c.content.headers.referer = "same-domain"
 # DOWNLOADS
 # ============================================================================
 
+profile.mark("DOWNLOADS")
+
 c.downloads.location.directory = "~/Downloads"
 c.downloads.location.prompt = False
 c.downloads.location.remember = True
@@ -100,6 +108,8 @@ c.downloads.remove_finished = 10000
 # SEARCH ENGINES
 # ============================================================================
 
+profile.mark("SEARCH ENGINES")
+
 c.url.searchengines = {
     "DEFAULT": "https://duckduckgo.com/?q={}",
     "g": "https://www.google.com/search?q={}",
@@ -121,6 +131,8 @@ c.url.default_page = "about:blank"
 # TABS
 # ============================================================================
 
+profile.mark("TABS")
+
 c.tabs.background = True
 c.tabs.last_close = "close"
 c.tabs.new_position.related = "next"
@@ -136,6 +148,8 @@ c.tabs.mousewheel_switching = True
 # WINDOW & UI
 # ============================================================================
 
+profile.mark("WINDOW & UI")
+
 c.window.title_format = "{perc}{current_title}{title_sep}qutebrowser"
 c.window.transparent = False
 
@@ -156,6 +170,8 @@ c.completion.use_best_match = True
 # FONTS
 # ============================================================================
 
+profile.mark("FONTS")
+
 c.fonts.completion.entry = "11pt monospace"
 c.fonts.completion.category = "bold 11pt monospace"
 c.fonts.debug_console = "11pt monospace"
@@ -180,6 +196,8 @@ c.fonts.web.size.default_fixed = 13
 # COLORS & THEME
 # ============================================================================
 
+profile.mark("COLORS & THEME")
+
 # Dark theme
 c.colors.webpage.preferred_color_scheme = "dark"
 c.colors.webpage.darkmode.enabled = True
@@ -192,6 +210,8 @@ c.colors.webpage.darkmode.threshold.background = 100
 # KEYBINDINGS
 # ============================================================================
 
+profile.mark("KEYBINDINGS")
+
 # Clear default bindings that conflict with custom ones
 config.unbind("d", mode="normal")
 config.unbind("u", mode="normal")
@@ -239,6 +259,9 @@ config.bind("gb", "bookmark-list")
 config.bind("M", "quickmark-save")
 config.bind("m", "quickmark-load")
 
+# Full-text search over all history, bookmarks and quickmarks
+config.bind("gh", "history-search")
+
 # Source and reader mode
 config.bind("gs", "view-source")
 config.bind("gr", "reader")
@@ -247,6 +270,8 @@ config.bind("gr", "reader")
 # HINTS
 # ============================================================================
 
+profile.mark("HINTS")
+
 c.hints.chars = "asdfghjkl"
 c.hints.auto_follow = "unique-match"
 c.hints.auto_follow_timeout = 100
@@ -258,12 +283,16 @@ c.hints.uppercase = False
 # EDITOR
 # ============================================================================
 
+profile.mark("EDITOR")
+
 c.editor.command = ["nvim", "{}"]
 
 # ============================================================================
 # SPELLCHECK
 # ============================================================================
 
+profile.mark("SPELLCHECK")
+
 # Spellcheck disabled - install dictionaries manually if needed
 # c.spellcheck.languages = ['en-US']
 
@@ -271,6 +300,8 @@ c.editor.command = ["nvim", "{}"]
 # ALIASES
 # ============================================================================
 
+profile.mark("ALIASES")
+
 c.aliases = {
     "w": "session-save",
     "q": "close",
@@ -280,6 +311,10 @@ c.aliases = {
     "h": "help",
     "clear-cache": "clear-keystore ;; clear-messages ;; history-clear ;; download-clear",
     "adblock-update": "adblock-update",
+    "adblock-sync": "spawn --userscript adblock-sync",
+    "tab-suspend": "spawn --userscript tab-suspend --watch",
+    "tab-suspend-now": "spawn --userscript tab-suspend --now",
+    "history-search": "spawn --userscript history-search",
     "private": "open -p",
     "reader": "reader",
     "dev": "devtools",
@@ -289,6 +324,8 @@ c.aliases = {
 # QUICKMARKS (Examples)
 # ============================================================================
 
+profile.mark("QUICKMARKS (Examples)")
+
 # Quickmarks are set using the quickmark-add command or GUI
 # Example: :quickmark-add arch https://archlinux.org
 # These can be accessed with 'm' key followed by the shortcut
@@ -297,26 +334,22 @@ c.aliases = {
 # PER-DOMAIN SETTINGS
 # ============================================================================
 
-# Allow autoplay for media sites
-config.set("content.autoplay", True, "https://www.youtube.com")
-config.set("content.autoplay", True, "https://youtube.com")
-config.set("content.autoplay", True, "https://netflix.com")
+profile.mark("PER-DOMAIN SETTINGS")
 
-# JavaScript whitelist for essential sites
-config.set("content.javascript.enabled", True, "https://github.com")
-config.set("content.javascript.enabled", True, "https://gmail.com")
-config.set("content.javascript.enabled", True, "https://google.com")
-
-# Cookies for essential sites
-config.set("content.cookies.accept", "all", "https://gmail.com")
-config.set("content.cookies.accept", "all", "https://github.com")
+# Autoplay for media sites, JavaScript and cookies for essential sites;
+# each domain is declared once in domain_policy.py
+domain_policy.apply(config)
 
 # ============================================================================
 # PERFORMANCE SETTINGS
 # ============================================================================
 
+profile.mark("PERFORMANCE SETTINGS")
+
 # Memory and cache settings
-c.content.cache.size = 52428800  # 50MB
+# 50MB; :tab-suspend shrinks it for the session while memory is short
+# (keep in step with tab_suspend.CACHE_SIZE)
+c.content.cache.size = 52428800
 c.session.lazy_restore = True
 
 # Network settings
@@ -326,6 +359,8 @@ c.content.dns_prefetch = True
 # SECURITY SETTINGS
 # ============================================================================
 
+profile.mark("SECURITY SETTINGS")
+
 c.content.tls.certificate_errors = "ask-block-thirdparty"
 c.content.xss_auditing = True
 
@@ -333,6 +368,8 @@ c.content.xss_auditing = True
 # COMPLETION
 # ============================================================================
 
+profile.mark("COMPLETION")
+
 c.completion.web_history.max_items = 1000
 c.completion.cmd_history_max_items = 100
 
@@ -340,4 +377,6 @@ c.completion.cmd_history_max_items = 100
 config_dir = os.path.expanduser("~/.config/qutebrowser")
 local_config = os.path.join(config_dir, "local_config.py")
 if os.path.exists(local_config):
-    config.source(local_config)
+    profile.source(config, local_config)
+
+profile.finish(config, str(config.configdir / "config.py"))
@@ -0,0 +1,116 @@
+# Opt-in timing of config.py, for catching startup regressions.
+#
+# Set QUTE_CONFIG_PROFILE=1 (report in ~/.cache/qutebrowser/config-profile.txt)
+# or QUTE_CONFIG_PROFILE=/some/file and start qutebrowser. config.py calls
+# mark() at each section banner and goes through call() for autoconfig and
+# sourced files; the report has the wall time of each, plus the settings
+# that only take effect on a restart (qt.args, backend, ...) and so cost a
+# QtWebEngine reinit whenever they change. One line per entry, in config
+# order, so two reports diff cleanly. Without the variable every method is
+# a no-op.
+
+import hashlib
+import os
+import time
+from typing import Callable, List, Optional, Tuple
+
+ENV = "QUTE_CONFIG_PROFILE"
+
+# Always reported, set or not; other restart-only settings are listed when
+# they differ from their default
+WATCHED = ("backend", "qt.args", "qt.chromium.low_end_device_mode")
+
+
+def report_path() -> Optional[str]:
+    value = os.environ.get(ENV)
+    if not value or value == "0":
+        return None
+    if value == "1":
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        return os.path.join(cache_home, "qutebrowser", "config-profile.txt")
+    return os.path.expanduser(value)
+
+
+def restart_settings(config) -> List[Tuple[str, object, bool]]:
+    # (name, value, is default) for settings qutebrowser applies only when
+    # it starts, read from its own option table
+    try:
+        from qutebrowser.config import configdata
+    except ImportError:
+        return []
+    result = []
+    for name, option in configdata.DATA.items():
+        if not option.restart:
+            continue
+        try:
+            value = config.get(name)
+        except Exception:
+            continue
+        is_default = value == option.default
+        if name in WATCHED or not is_default:
+            result.append((name, value, is_default))
+    return result
+
+
+class Profile:
+    """Wall time per config.py section and per sourced file."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.enabled = path is not None
+        self.start = self.last = time.perf_counter()
+        self.current = "start"
+        # (label, seconds) in the order they ran
+        self.entries: List[Tuple[str, float]] = []
+
+    @classmethod
+    def from_env(cls) -> "Profile":
+        return cls(report_path())
+
+    def mark(self, section: str) -> None:
+        # Ends the running section and starts the next one
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.entries.append((self.current, now - self.last))
+        self.current = section
+        self.last = now
+
+    def call(self, label: str, fn: Callable, *args) -> object:
+        # Times fn separately from the section it is called in
+        if not self.enabled:
+            return fn(*args)
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.entries.append((label, elapsed))
+            self.last += elapsed
+
+    def source(self, config, path: str) -> None:
+        self.call(f"source {path}", config.source, path)
+
+    def finish(self, config, config_file: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        self.mark("end")
+        total = time.perf_counter() - self.start
+        lines = ["# qutebrowser config.py profile, milliseconds"]
+        if config_file:
+            try:
+                with open(config_file, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()[:12]
+                lines.append(f"# {config_file} {digest}")
+            except OSError:
+                pass
+        lines.append(f"total\t{total * 1e3:.2f}")
+        lines += [f"{label}\t{seconds * 1e3:.2f}" for label, seconds in self.entries]
+        for name, value, is_default in restart_settings(config):
+            suffix = " (default)" if is_default else ""
+            lines.append(f"restart-only\t{name} = {value!r}{suffix}")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
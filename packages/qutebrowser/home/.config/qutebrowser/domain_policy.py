@@ -0,0 +1,68 @@
+# Per-domain settings for config.py, declared once per site.
+#
+# Each domain lists the settings it overrides. A domain covers its
+# subdomains and both http and https (*://*.domain/*), so youtube.com and
+# www.youtube.com are one entry. compile_rules() turns the table into the
+# smallest set of config.set() calls: a subdomain repeating its parent's
+# value adds nothing and is dropped.
+
+from typing import Dict, List, Tuple
+
+POLICIES: Dict[str, Dict[str, object]] = {
+    # Media sites
+    "youtube.com": {"content.autoplay": True},
+    "netflix.com": {"content.autoplay": True},
+    # Essential sites
+    "github.com": {
+        "content.javascript.enabled": True,
+        "content.cookies.accept": "all",
+    },
+    "gmail.com": {
+        "content.javascript.enabled": True,
+        "content.cookies.accept": "all",
+    },
+    "google.com": {"content.javascript.enabled": True},
+}
+
+Rule = Tuple[str, str, object]
+
+_UNSET = object()
+
+
+def pattern(domain: str) -> str:
+    return f"*://*.{domain}/*"
+
+
+def parents(domain: str) -> List[str]:
+    # "a.b.example.com" -> ["b.example.com", "example.com", "com"]
+    parts = domain.split(".")
+    return [".".join(parts[i:]) for i in range(1, len(parts))]
+
+
+def compile_rules(policies: Dict[str, Dict[str, object]] = POLICIES) -> List[Rule]:
+    """(setting, pattern, value) triples for config.set().
+
+    Parents come before their subdomains: qutebrowser lets the pattern set
+    last win, so a subdomain can still override its parent.
+    """
+    rules = []
+    for domain in sorted(policies, key=lambda d: (d.count("."), d)):
+        for setting, value in policies[domain].items():
+            # The nearest parent that sets it decides what would apply
+            inherited = next(
+                (
+                    policies[p][setting]
+                    for p in parents(domain)
+                    if setting in policies.get(p, {})
+                ),
+                _UNSET,
+            )
+            if inherited == value:
+                continue
+            rules.append((setting, pattern(domain), value))
+    return rules
+
+
+def apply(config, policies: Dict[str, Dict[str, object]] = POLICIES) -> None:
+    for setting, url_pattern, value in compile_rules(policies):
+        config.set(setting, value, url_pattern)
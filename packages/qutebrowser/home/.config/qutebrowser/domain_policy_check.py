@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# Checks domain_policy.py against the per-domain rules config.py used to
+# write by hand, and counts the patterns before and after.
+#
+# Usage: domain_policy_check.py
+#
+# Every URL a hand-written rule applied to must get the same value from the
+# compiled rules. The compiled rules may reach further (http://, other
+# subdomains); that is reported, not failed. Hosts that merely contain a
+# policy domain must stay untouched. Exits non-zero when a check fails.
+
+import sys
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import domain_policy
+from domain_policy import Rule
+
+# config.py's PER-DOMAIN SETTINGS before domain_policy.py, as the
+# config.set() calls were written
+LEGACY_CALLS = [
+    ("content.autoplay", True, "https://www.youtube.com"),
+    ("content.autoplay", True, "https://youtube.com"),
+    ("content.autoplay", True, "https://netflix.com"),
+    ("content.javascript.enabled", True, "https://github.com"),
+    ("content.javascript.enabled", True, "https://gmail.com"),
+    ("content.javascript.enabled", True, "https://google.com"),
+    ("content.cookies.accept", "all", "https://gmail.com"),
+    ("content.cookies.accept", "all", "https://github.com"),
+]
+LEGACY_RULES: List[Rule] = [(s, p, v) for s, v, p in LEGACY_CALLS]
+
+
+def matches(url_pattern: str, url: str) -> bool:
+    # The subset of qutebrowser's UrlPattern these rules use: a scheme or
+    # "*" (http and https), an exact host or "*." for it and its
+    # subdomains, and a path that is missing (any) or "/*"
+    scheme, _, rest = url_pattern.partition("://")
+    host, slash, path = rest.partition("/")
+    parts = urlsplit(url)
+    if scheme == "*":
+        if parts.scheme not in ("http", "https"):
+            return False
+    elif scheme != parts.scheme:
+        return False
+    hostname = parts.hostname or ""
+    if host.startswith("*."):
+        base = host[2:]
+        if hostname != base and not hostname.endswith(f".{base}"):
+            return False
+    elif hostname != host:
+        return False
+    return not slash or path == "*"
+
+
+def resolve(rules: List[Rule], setting: str, url: str) -> Optional[object]:
+    # qutebrowser checks the most recently set pattern first
+    for rule_setting, url_pattern, value in reversed(rules):
+        if rule_setting == setting and matches(url_pattern, url):
+            return value
+    return None
+
+
+def sample_urls(domains: List[str]) -> Tuple[List[str], List[str]]:
+    # (URLs on the policy domains, URLs that only look like them)
+    related = []
+    unrelated = ["https://example.com/"]
+    for domain in domains:
+        for host in (domain, f"www.{domain}", f"m.{domain}"):
+            for scheme in ("https", "http"):
+                related += [f"{scheme}://{host}/", f"{scheme}://{host}/a/b?q=1"]
+        unrelated += [
+            f"https://not{domain}/",
+            f"https://{domain}.evil.example/",
+            f"https://{domain.replace('.', '-')}.example/",
+        ]
+    return related, unrelated
+
+
+def main() -> int:
+    rules = domain_policy.compile_rules()
+    settings = sorted({rule[0] for rule in LEGACY_RULES + rules})
+    domains = sorted(
+        {urlsplit(p).hostname.removeprefix("www.") for _, p, _ in LEGACY_RULES}
+        | set(domain_policy.POLICIES)
+    )
+    related, unrelated = sample_urls(domains)
+
+    failures = []
+    widened = 0
+    for setting in settings:
+        for url in related:
+            old = resolve(LEGACY_RULES, setting, url)
+            new = resolve(rules, setting, url)
+            if old is not None and new != old:
+                failures.append(f"{setting} on {url}: {old!r} became {new!r}")
+            elif old is None and new is not None:
+                widened += 1
+        for url in unrelated:
+            new = resolve(rules, setting, url)
+            if new is not None:
+                failures.append(f"{setting} on {url}: {new!r}, expected none")
+
+    # Collapsing: a subdomain repeating its parent goes, one overriding it
+    # stays and comes after the parent
+    collapsed = domain_policy.compile_rules(
+        {
+            "www.example.com": {"content.autoplay": True},
+            "example.com": {"content.autoplay": True},
+            "m.example.com": {"content.autoplay": False},
+        }
+    )
+    if collapsed != [
+        ("content.autoplay", "*://*.example.com/*", True),
+        ("content.autoplay", "*://*.m.example.com/*", False),
+    ]:
+        failures.append(f"collapsing example.com gave {collapsed}")
+
+    checked = len(settings) * (len(related) + len(unrelated))
+    print(f"checked {len(settings)} settings on {len(related) + len(unrelated)} URLs")
+    print(f"  config.set() calls    {len(LEGACY_RULES):3} -> {len(rules)}")
+    print(
+        f"  distinct patterns     {len({p for _, p, _ in LEGACY_RULES}):3}"
+        f" -> {len({p for _, p, _ in rules})}"
+    )
+    for setting in settings:
+        before = sum(1 for s, _, _ in LEGACY_RULES if s == setting)
+        after = sum(1 for s, _, _ in rules if s == setting)
+        print(f"  {setting:<28} {before} -> {after} patterns")
+    print(f"  {widened} of {checked} (setting, URL) pairs newly covered")
+    for rule in rules:
+        print(f"  config.set({rule[0]!r}, {rule[2]!r}, {rule[1]!r})")
+    for failure in failures:
+        print(f"  FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
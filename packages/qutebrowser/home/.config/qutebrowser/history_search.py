@@ -0,0 +1,432 @@
+# Full-text search over qutebrowser's whole history, bookmarks and
+# quickmarks, for userscripts/history-search.
+#
+# qutebrowser's completion only looks at c.completion.web_history.max_items
+# entries. This keeps an SQLite FTS5 index in ~/.cache/qutebrowser next to
+# it: each sync reads only the History rows added since the last one (by
+# rowid) and re-reads bookmarks and quickmarks when their files change.
+# Deleted history (:history-clear, :completion-item-del) is noticed from
+# the row counts and rebuilds the index, so nothing removed stays findable.
+#
+# Pages rank by bm25 relevance plus frecency: each visit weighs half as
+# much every HALF_LIFE seconds, stored as log(sum(exp(RATE * atime))) so
+# scores never need updating as time passes. Ranking costs time per
+# matching page, so a search first looks at the hot tier only (roughly the
+# HOT_PAGES most used pages plus every mark) and at the rest when the hot
+# tier has too few matches; words as broad as "https" stay fast.
+
+import heapq
+import math
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+HALF_LIFE = 14 * 24 * 3600
+RATE = math.log(2) / HALF_LIFE
+
+# The hot tier is trimmed back to HOT_PAGES once it doubles
+HOT_PAGES = 5000
+
+# Ranking: bm25 weights for url, title, bookmark title and quickmark name,
+# how much frecency counts against relevance, and the bonus for marks
+COLUMN_WEIGHTS = (2.0, 4.0, 4.0, 8.0, 0.0)
+FRECENCY_WEIGHT = 0.5
+FRECENCY_FLOOR = -20.0
+MARK_BONUS = 4.0
+
+INDEX_VERSION = 1
+
+TABLES = """
+CREATE TABLE pages (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL DEFAULT '',
+    visits INTEGER NOT NULL DEFAULT 0,
+    frecency REAL,
+    bookmark TEXT,
+    quickmark TEXT,
+    hot INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX pages_frecency ON pages(frecency);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+CREATE VIRTUAL TABLE pages_fts USING fts5(
+    url, title, bookmark, quickmark, hot,
+    content='pages', content_rowid='id', prefix='2 3'
+);
+"""
+
+# Keep pages_fts in step with pages. Left out while the index is built
+# from scratch, which fills pages_fts in one go instead.
+TRIGGERS = {
+    "pages_ai": """
+CREATE TRIGGER pages_ai AFTER INSERT ON pages BEGIN
+    INSERT INTO pages_fts(rowid, url, title, bookmark, quickmark, hot)
+    VALUES (new.id, new.url, new.title, new.bookmark, new.quickmark, new.hot);
+END""",
+    "pages_ad": """
+CREATE TRIGGER pages_ad AFTER DELETE ON pages BEGIN
+    INSERT INTO pages_fts(pages_fts, rowid, url, title, bookmark, quickmark, hot)
+    VALUES ('delete', old.id, old.url, old.title, old.bookmark, old.quickmark,
+            old.hot);
+END""",
+    "pages_au": """
+CREATE TRIGGER pages_au AFTER UPDATE OF title, bookmark, quickmark, hot ON pages
+WHEN old.title IS NOT new.title OR old.bookmark IS NOT new.bookmark
+    OR old.quickmark IS NOT new.quickmark OR old.hot IS NOT new.hot BEGIN
+    INSERT INTO pages_fts(pages_fts, rowid, url, title, bookmark, quickmark, hot)
+    VALUES ('delete', old.id, old.url, old.title, old.bookmark, old.quickmark,
+            old.hot);
+    INSERT INTO pages_fts(rowid, url, title, bookmark, quickmark, hot)
+    VALUES (new.id, new.url, new.title, new.bookmark, new.quickmark, new.hot);
+END""",
+}
+
+# New visits are staged in a temp table and merged in one statement. FTS5
+# writes a segment per statement that touches it, so a statement per page
+# left hundreds of tiny segments for automerge to fold together, which cost
+# more than the sync itself. Rows go in staging order, known pages by
+# rowid first: a rowid lower than the last one written starts a segment
+# too.
+STAGE_VISITS = """
+CREATE TEMP TABLE IF NOT EXISTS new_visits (
+    url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    visits INTEGER NOT NULL,
+    frecency REAL
+)"""
+
+UPSERT_VISITS = """
+INSERT INTO pages(url, title, visits, frecency, hot)
+SELECT url, title, visits, frecency, frecency >= :cutoff
+FROM new_visits WHERE true ORDER BY rowid
+ON CONFLICT(url) DO UPDATE SET
+    title = CASE WHEN excluded.title != '' THEN excluded.title ELSE title END,
+    visits = visits + excluded.visits,
+    frecency = logaddexp(frecency, excluded.frecency),
+    hot = hot OR logaddexp(frecency, excluded.frecency) >= :cutoff
+"""
+
+SEARCH = f"""
+SELECT p.url, coalesce(nullif(p.bookmark, ''), p.title), p.bookmark, p.quickmark
+FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid
+WHERE pages_fts MATCH :query
+ORDER BY bm25(pages_fts, {", ".join(map(str, COLUMN_WEIGHTS))})
+    - {FRECENCY_WEIGHT} * max(coalesce(p.frecency - :now, {FRECENCY_FLOOR}),
+                              {FRECENCY_FLOOR})
+    - {MARK_BONUS} * (p.bookmark IS NOT NULL OR p.quickmark IS NOT NULL)
+LIMIT :limit
+"""
+
+TOP = """
+SELECT url, coalesce(nullif(bookmark, ''), title), bookmark, quickmark
+FROM pages WHERE frecency IS NOT NULL ORDER BY frecency DESC LIMIT :limit
+"""
+
+
+class Page(NamedTuple):
+    url: str
+    title: str
+    bookmark: bool
+    quickmark: Optional[str]
+
+
+def data_dir() -> str:
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.environ.get("QUTE_DATA_DIR") or os.path.join(data_home, "qutebrowser")
+
+
+def config_dir() -> str:
+    config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.environ.get("QUTE_CONFIG_DIR") or os.path.join(config_home, "qutebrowser")
+
+
+def index_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "qutebrowser", "history-fts.sqlite")
+
+
+def logaddexp(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def fts_query(text: str) -> Optional[str]:
+    # Every word must match, as a prefix, in the url, the titles or the
+    # quickmark name
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    terms = " ".join(f'"{word}"*' for word in words)
+    return f"{{url title bookmark quickmark}} : ({terms})"
+
+
+def read_visits(
+    source: sqlite3.Connection, after: int
+) -> Tuple[Dict[str, list], Set[str], int]:
+    # ({url: [title, visits, frecency]}, URLs not indexed, rows read) for
+    # the History rows past rowid after; redirects don't count as visits
+    visits: Dict[str, list] = {}
+    unindexed: Set[str] = set()
+    rows = 0
+    cursor = source.execute(
+        "SELECT url, title, atime, redirect FROM History WHERE rowid > ? ORDER BY rowid",
+        (after,),
+    )
+    for url, title, atime, redirect in cursor:
+        rows += 1
+        if redirect:
+            continue
+        if url.startswith("data:"):
+            # tab-suspend's placeholders, if they get in
+            unindexed.add(url)
+            continue
+        x = (atime or 0) * RATE
+        entry = visits.get(url)
+        if entry is None:
+            visits[url] = [title or "", 1, x]
+        else:
+            if title:
+                entry[0] = title
+            entry[1] += 1
+            entry[2] = logaddexp(entry[2], x)
+    return visits, unindexed, rows
+
+
+def read_bookmarks(path: str) -> List[Tuple[str, str]]:
+    # "url title" lines
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    marks = []
+    for line in lines:
+        url, _, title = line.partition(" ")
+        if url:
+            marks.append((url, title.strip()))
+    return marks
+
+
+def read_quickmarks(path: str) -> List[Tuple[str, str]]:
+    # "name url" lines; names may contain spaces, urls can't
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    marks = []
+    for line in lines:
+        name, _, url = line.rpartition(" ")
+        if name and url:
+            marks.append((name, url))
+    return marks
+
+
+def file_signature(path: str) -> Optional[str]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class Index:
+    """The FTS index; sync() brings it up to date, search() queries it."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or index_path()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.create_function("logaddexp", 2, logaddexp, deterministic=True)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            self.reset()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def reset(self) -> None:
+        for name in ("pages_fts", "pages", "meta"):
+            self.db.execute(f"DROP TABLE IF EXISTS {name}")
+        self.db.executescript(TABLES)
+        for trigger in TRIGGERS.values():
+            self.db.execute(trigger)
+        self.db.execute(f"PRAGMA user_version={INDEX_VERSION}")
+
+    def get_meta(self, key: str, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, key: str, value) -> None:
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def sync(
+        self,
+        history: Optional[str] = None,
+        bookmarks: Optional[str] = None,
+        quickmarks: Optional[str] = None,
+    ) -> int:
+        # Returns the number of history rows read
+        history = history or os.path.join(data_dir(), "history.sqlite")
+        bookmarks = bookmarks or os.path.join(config_dir(), "bookmarks", "urls")
+        quickmarks = quickmarks or os.path.join(config_dir(), "quickmarks")
+        try:
+            source = sqlite3.connect(f"file:{history}?mode=ro", uri=True)
+        except sqlite3.Error:
+            source = None
+        try:
+            added = self.sync_history(source) if source else 0
+        finally:
+            if source:
+                source.close()
+        with self.db:
+            self.sync_marks(bookmarks, quickmarks)
+        return added
+
+    def sync_history(self, source: sqlite3.Connection) -> int:
+        last = self.get_meta("history_rowid", 0)
+        try:
+            top = source.execute("SELECT max(rowid) FROM History").fetchone()[0] or 0
+            completions = source.execute(
+                "SELECT count(*) FROM CompletionHistory"
+            ).fetchone()[0]
+        except sqlite3.Error:
+            # Not there yet, or not qutebrowser's
+            return 0
+        if top == last and completions == self.get_meta("completion_rows"):
+            return 0
+
+        ids: Dict[str, int] = {}
+        if top < last:
+            last = 0
+        else:
+            visits, unindexed, rows = read_visits(source, last)
+        if last:
+            for url in visits:
+                row = self.db.execute(
+                    "SELECT id FROM pages WHERE url = ?", (url,)
+                ).fetchone()
+                if row is not None:
+                    ids[url] = row[0]
+            # A new URL adds a CompletionHistory row, deleting one removes
+            # it from there and from History. Counting History means
+            # reading all of it, so that only happens when the cheap count
+            # doesn't add up.
+            new_urls = len(unindexed) + len(visits) - len(ids)
+            history_rows = self.get_meta("history_rows", 0) + rows
+            if completions != self.get_meta("completion_rows", 0) + new_urls and (
+                source.execute("SELECT count(*) FROM History").fetchone()[0]
+                != history_rows
+            ):
+                last = 0
+        if not last:
+            # First sync, or history was deleted: start over, marks included
+            visits, unindexed, rows = read_visits(source, 0)
+            history_rows = rows
+            self.reset()
+            for name in TRIGGERS:
+                self.db.execute(f"DROP TRIGGER {name}")
+
+        cutoff = self.get_meta("hot_cutoff")
+        if cutoff is None and len(visits) > HOT_PAGES:
+            cutoff = heapq.nlargest(HOT_PAGES, (e[2] for e in visits.values()))[-1]
+        # Known pages in rowid order, new ones after (see STAGE_VISITS)
+        staged = (
+            (url, *visits[url])
+            for url in sorted(visits, key=lambda url: ids.get(url, math.inf))
+        )
+        with self.db:
+            self.db.execute(STAGE_VISITS)
+            self.db.executemany("INSERT INTO new_visits VALUES (?, ?, ?, ?)", staged)
+            self.db.execute(
+                UPSERT_VISITS, {"cutoff": -math.inf if cutoff is None else cutoff}
+            )
+            self.db.execute("DELETE FROM new_visits")
+            if not last:
+                # One FTS rebuild beats a trigger per page. It leaves a dozen
+                # or so segments, which automerge would otherwise fold
+                # together during the next few syncs, at up to 200 ms each.
+                self.db.execute("INSERT INTO pages_fts(pages_fts) VALUES ('rebuild')")
+                self.db.execute("INSERT INTO pages_fts(pages_fts) VALUES ('optimize')")
+                for trigger in TRIGGERS.values():
+                    self.db.execute(trigger)
+            if cutoff is not None:
+                self.set_meta("hot_cutoff", cutoff)
+            self.set_meta("history_rowid", top)
+            self.set_meta("history_rows", history_rows)
+            self.set_meta("completion_rows", completions)
+            self.trim_hot()
+        return rows
+
+    def trim_hot(self) -> None:
+        # Raises the cutoff once the hot tier has doubled. New visits join
+        # it above the cutoff, marked pages always belong to it.
+        hot = self.db.execute(
+            "SELECT count(*) FROM pages_fts WHERE pages_fts MATCH 'hot : 1'"
+        ).fetchone()[0]
+        if hot <= 2 * HOT_PAGES:
+            return
+        (cutoff,) = self.db.execute(
+            "SELECT frecency FROM pages ORDER BY frecency DESC LIMIT 1 OFFSET ?",
+            (HOT_PAGES,),
+        ).fetchone()
+        self.db.execute(
+            "UPDATE pages SET hot = 0 WHERE hot AND frecency < ?"
+            " AND bookmark IS NULL AND quickmark IS NULL",
+            (cutoff,),
+        )
+        self.set_meta("hot_cutoff", cutoff)
+
+    def sync_marks(self, bookmarks: str, quickmarks: str) -> None:
+        signature = f"{file_signature(bookmarks)} {file_signature(quickmarks)}"
+        if signature == self.get_meta("marks"):
+            return
+        self.db.execute("UPDATE pages SET bookmark = NULL WHERE bookmark IS NOT NULL")
+        self.db.execute("UPDATE pages SET quickmark = NULL WHERE quickmark IS NOT NULL")
+        self.db.executemany(
+            "INSERT INTO pages(url, bookmark, hot) VALUES (?, ?, 1)"
+            " ON CONFLICT(url) DO UPDATE SET bookmark = excluded.bookmark, hot = 1",
+            read_bookmarks(bookmarks),
+        )
+        self.db.executemany(
+            "INSERT INTO pages(url, quickmark, hot) VALUES (?, ?, 1)"
+            " ON CONFLICT(url) DO UPDATE SET quickmark = excluded.quickmark, hot = 1",
+            ((url, name) for name, url in read_quickmarks(quickmarks)),
+        )
+        # Marks removed from pages never visited
+        self.db.execute(
+            "DELETE FROM pages WHERE NOT visits AND bookmark IS NULL"
+            " AND quickmark IS NULL"
+        )
+        self.set_meta("marks", signature)
+
+    def search(
+        self, text: str, limit: int = 50, now: Optional[float] = None
+    ) -> List[Page]:
+        now = time.time() if now is None else now
+        query = fts_query(text)
+        if query is None:
+            rows = self.db.execute(TOP, {"limit": limit}).fetchall()
+        else:
+            params = {
+                "query": f"hot : 1 AND {query}",
+                "now": now * RATE,
+                "limit": limit,
+            }
+            rows = self.db.execute(SEARCH, params).fetchall()
+            if len(rows) < limit:
+                params["query"] = query
+                rows = self.db.execute(SEARCH, params).fetchall()
+        return [
+            Page(url, title, bookmark is not None, quickmark)
+            for url, title, bookmark, quickmark in rows
+        ]
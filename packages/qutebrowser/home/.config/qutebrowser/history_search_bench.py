@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# Checks and benchmarks history_search.py against a synthetic history.
+#
+# Usage: history_search_bench.py [--entries N] [--seed N] [--runs N]
+#
+# Writes a history.sqlite with qutebrowser's schema: N visits over N / 5
+# pages, page popularity following Zipf's law, plus bookmarks and
+# quickmarks. Times building the index, a sync with nothing new and one
+# after a few hundred visits, then sync + search for a set of queries, which
+# is what the userscript does before fuzzel shows its list, both with
+# nothing new and after NEW_VISITS visits each time; the p99 of either has
+# to stay under BUDGET_MS. Also checks that the incremental index equals
+# one built from scratch, that deleted history disappears and that marks and
+# frecency rank as they should. Exits non-zero when a check fails.
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+import history_search
+
+BUDGET_MS = 50.0
+# Visits between two runs of the userscript in the incremental case
+NEW_VISITS = 300
+NOW = 1_760_000_000
+SPAN = 2 * 365 * 24 * 3600
+
+# qutebrowser's history.sqlite, as of v3
+HISTORY_SCHEMA = """
+CREATE TABLE History (url TEXT, title TEXT, atime INTEGER, redirect BOOLEAN);
+CREATE TABLE CompletionHistory (url TEXT PRIMARY KEY, title TEXT, last_atime INTEGER);
+CREATE TABLE CompletionMetaInfo (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+QUERIES = [
+    "github",
+    "python docs",
+    "lin",
+    "wiki arch",
+    "quokka hand",
+    "ka",
+    "zzzz nothing",
+    "https",
+]
+
+PLANTED = [
+    # (url, title, visits, age in days)
+    ("https://old.example/quokka", "Zyxwv Quokka Handbook", 1, 600),
+    ("https://fresh.example/tapir", "Tapir field guide", 50, 1),
+    ("https://stale.example/tapir", "Tapir field guide", 1, 400),
+]
+BOOKMARKS = [("https://bookmarked.example/only", "Ocelot reference card")]
+QUICKMARKS = [("margay notes", "https://quick.example/margay")]
+
+
+def words(rng: random.Random, n: int) -> List[str]:
+    syllables = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+    common = ["github", "python", "linux", "arch", "wiki", "docs", "rust", "news"]
+    vocab = set(common)
+    while len(vocab) < n:
+        vocab.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return common + sorted(vocab - set(common))
+
+
+def zipf_weights(n: int) -> List[float]:
+    total = 0.0
+    cumulative = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank
+        cumulative.append(total)
+    return cumulative
+
+
+def make_history(directory: str, entries: int, seed: int) -> str:
+    rng = random.Random(seed)
+    vocab = words(rng, 8000)
+    vocab_weights = zipf_weights(len(vocab))
+    domains = [
+        f"{rng.choice(vocab)}{rng.choice(['', '-', 'x'])}{rng.choice(vocab)}.example"
+        for _ in range(3000)
+    ] + ["github.com", "wiki.archlinux.org", "docs.python.org"]
+    domain_weights = zipf_weights(len(domains))
+    pages = []
+    for _ in range(max(entries // 5, 1)):
+        (domain,) = rng.choices(domains, cum_weights=domain_weights)
+        path = "/".join(
+            rng.choices(vocab, cum_weights=vocab_weights, k=rng.randint(1, 3))
+        )
+        title = " ".join(
+            rng.choices(vocab, cum_weights=vocab_weights, k=rng.randint(2, 8))
+        )
+        pages.append((f"https://{domain}/{path}", title.capitalize()))
+    # The most popular pages come first
+    page_weights = zipf_weights(len(pages))
+
+    path = os.path.join(directory, "history.sqlite")
+    db = sqlite3.connect(path)
+    db.executescript(HISTORY_SCHEMA)
+    rows = []
+    for i in range(entries):
+        (url, title) = rng.choices(pages, cum_weights=page_weights)[0]
+        atime = NOW - SPAN + SPAN * i // entries
+        rows.append((url, title, atime, rng.random() < 0.02))
+    for url, title, visits, age in PLANTED:
+        for v in range(visits):
+            atime = NOW - age * 86400 + v * 60
+            rows.insert(
+                int((atime - NOW + SPAN) / SPAN * len(rows)), (url, title, atime, False)
+            )
+    db.executemany("INSERT INTO History VALUES (?, ?, ?, ?)", rows)
+    db.execute(
+        "INSERT INTO CompletionHistory SELECT url, title, max(atime) FROM History"
+        " WHERE NOT redirect GROUP BY url"
+    )
+    db.commit()
+    db.close()
+
+    os.makedirs(os.path.join(directory, "bookmarks"))
+    with open(os.path.join(directory, "bookmarks", "urls"), "w") as f:
+        for url, title in BOOKMARKS + rng.sample(pages, 500):
+            f.write(f"{url} {title}\n")
+    with open(os.path.join(directory, "quickmarks"), "w") as f:
+        for name, url in QUICKMARKS:
+            f.write(f"{name} {url}\n")
+    return path
+
+
+def visit(db: sqlite3.Connection, url: str, title: str, atime: int) -> None:
+    # What qutebrowser's WebHistory.add_url does
+    db.execute("INSERT INTO History VALUES (?, ?, ?, 0)", (url, title, atime))
+    db.execute(
+        "INSERT OR REPLACE INTO CompletionHistory VALUES (?, ?, ?)", (url, title, atime)
+    )
+
+
+def delete_url(db: sqlite3.Connection, url: str) -> None:
+    # What :completion-item-del does
+    db.execute("DELETE FROM History WHERE url = ?", (url,))
+    db.execute("DELETE FROM CompletionHistory WHERE url = ?", (url,))
+
+
+def append_visits(path: str, n: int, seed: int) -> None:
+    # Revisits plus a few new pages, some with new titles; the planted pages are
+    # left alone so the order checks still hold after a sync
+    rng = random.Random(seed)
+    db = sqlite3.connect(path)
+    planted = [url for url, *_ in PLANTED]
+    urls = [
+        row[0]
+        for row in db.execute(
+            "SELECT url FROM History WHERE url NOT IN (%s) ORDER BY random() LIMIT ?"
+            % ",".join("?" * len(planted)),
+            (*planted, n),
+        )
+    ]
+    for i in range(n):
+        if rng.random() < 0.1:
+            visit(db, f"https://new.example/{i}", f"New page {i}", NOW + i)
+        else:
+            visit(db, rng.choice(urls), rng.choice(["", "New title"]), NOW + i)
+    db.commit()
+    db.close()
+
+
+def snapshot(index: history_search.Index) -> list:
+    # Without the hot flags, which depend on when the cutoff last moved
+    return index.db.execute(
+        "SELECT url, title, visits, round(frecency, 6), bookmark, quickmark"
+        " FROM pages ORDER BY url"
+    ).fetchall()
+
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1e3
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the history search index")
+    parser.add_argument("--entries", type=int, default=500_000, help="history rows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=30, help="runs per query")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="history-search-bench-")
+    failures = []
+    try:
+        _, elapsed = timed(make_history, directory, args.entries, args.seed)
+        history = os.path.join(directory, "history.sqlite")
+        bookmarks = os.path.join(directory, "bookmarks", "urls")
+        quickmarks = os.path.join(directory, "quickmarks")
+        sources = (history, bookmarks, quickmarks)
+        print(
+            f"synthetic history: {args.entries} visits, generated in {elapsed:.0f} ms"
+        )
+
+        # Where the userscript looks for it, with XDG_CACHE_HOME below
+        index = history_search.Index(
+            os.path.join(directory, "cache", "qutebrowser", "history-fts.sqlite")
+        )
+        added, elapsed = timed(index.sync, *sources)
+        pages = index.db.execute("SELECT count(*) FROM pages").fetchone()[0]
+        size = os.path.getsize(index.path) / 2**20
+        print(
+            f"  initial sync       {elapsed:8.1f} ms  {added} rows, {pages} pages, {size:.0f} MiB"
+        )
+        _, elapsed = timed(index.sync, *sources)
+        print(f"  sync, nothing new  {elapsed:8.1f} ms")
+        append_visits(history, NEW_VISITS, args.seed)
+        added, elapsed = timed(index.sync, *sources)
+        print(f"  sync, {added} new     {elapsed:8.1f} ms")
+
+        # A browsing session's worth of visits before every run
+        samples = []
+        for i, query in enumerate(QUERIES * 2):
+            append_visits(history, NEW_VISITS, args.seed + 1 + i)
+            start = time.perf_counter()
+            index.sync(*sources)
+            index.search(query, now=NOW)
+            samples.append((time.perf_counter() - start) * 1e3)
+        p99 = percentile(samples, 0.99)
+        print(
+            f"  sync, {NEW_VISITS} new + search"
+            f"  p50 {percentile(samples, 0.5):6.1f}  p99 {p99:6.1f} ms"
+            f"  ({len(samples)} runs, budget {BUDGET_MS:.0f} ms)"
+        )
+        if p99 > BUDGET_MS:
+            failures.append(
+                f"sync of {NEW_VISITS} new + search p99 {p99:.1f} ms"
+                f" over {BUDGET_MS:.0f} ms"
+            )
+
+        print(f"  sync + search, {args.runs} runs each (budget {BUDGET_MS:.0f} ms):")
+        everything = []
+        for query in QUERIES:
+            samples = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                index.sync(*sources)
+                results = index.search(query, now=NOW)
+                samples.append((time.perf_counter() - start) * 1e3)
+            everything += samples
+            print(
+                f"    {query!r:16} p50 {percentile(samples, 0.5):6.1f}"
+                f"  p99 {percentile(samples, 0.99):6.1f} ms  {len(results)} results"
+            )
+        p99 = percentile(everything, 0.99)
+        print(
+            f"    all queries      p50 {percentile(everything, 0.5):6.1f}  p99 {p99:6.1f} ms"
+        )
+        if p99 > BUDGET_MS:
+            failures.append(f"sync + search p99 {p99:.1f} ms over {BUDGET_MS:.0f} ms")
+
+        # The whole userscript from a shell, interpreter start included
+        script = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "userscripts", "history-search"
+        )
+        env = dict(
+            os.environ,
+            XDG_CACHE_HOME=os.path.join(directory, "cache"),
+            QUTE_DATA_DIR=directory,
+            QUTE_CONFIG_DIR=directory,
+        )
+        samples = []
+        for _ in range(10):
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, script, "python", "docs"],
+                env=env,
+                check=True,
+                capture_output=True,
+            )
+            samples.append((time.perf_counter() - start) * 1e3)
+        print(
+            f"  userscript from a shell   p50 {percentile(samples, 0.5):6.1f} ms  (with interpreter start)"
+        )
+
+        # Checks
+        fresh = history_search.Index(os.path.join(directory, "fresh.sqlite"))
+        fresh.sync(*sources)
+        if snapshot(fresh) != snapshot(index):
+            failures.append("incremental index differs from one built from scratch")
+        fresh.close()
+        try:
+            index.db.execute(
+                "INSERT INTO pages_fts(pages_fts) VALUES ('integrity-check')"
+            )
+        except sqlite3.DatabaseError as e:
+            failures.append(f"FTS index inconsistent: {e}")
+
+        def top_urls(query: str) -> List[str]:
+            return [page.url for page in index.search(query, now=NOW)]
+
+        if top_urls("quokka hand")[:1] != ["https://old.example/quokka"]:
+            failures.append("old page not found by title prefix")
+        if top_urls("tapir field")[:2] != [
+            "https://fresh.example/tapir",
+            "https://stale.example/tapir",
+        ]:
+            failures.append(f"frecency order for tapir: {top_urls('tapir field')[:2]}")
+        if "https://bookmarked.example/only" not in top_urls("ocelot"):
+            failures.append("bookmark without history not found")
+        if "https://quick.example/margay" not in top_urls("margay"):
+            failures.append("quickmark not found by name")
+        # FTS syntax typed in is searched for, not interpreted
+        try:
+            top_urls('" OR * NOT (')
+            top_urls("tapir NEAR hot:1")
+        except sqlite3.Error as e:
+            failures.append(f"query with FTS syntax failed: {e}")
+        if not top_urls(""):
+            failures.append("no words gave no pages")
+
+        hot, marks_cold = index.db.execute(
+            "SELECT sum(hot), sum(NOT hot AND (bookmark IS NOT NULL"
+            " OR quickmark IS NOT NULL)) FROM pages"
+        ).fetchone()
+        marks = len(BOOKMARKS) + len(QUICKMARKS) + 500
+        print(f"  hot tier           {hot:8} pages")
+        if marks_cold or hot > 2 * history_search.HOT_PAGES + marks:
+            failures.append(f"hot tier of {hot} pages, {marks_cold} marks left out")
+
+        # Deleting a page while visiting a new one keeps CompletionHistory's
+        # count; History's has to catch it
+        db = sqlite3.connect(history)
+        delete_url(db, "https://old.example/quokka")
+        visit(db, "https://another.example/", "Another page", NOW)
+        db.commit()
+        db.close()
+        _, elapsed = timed(index.sync, *sources)
+        print(f"  sync after a delete {elapsed:7.1f} ms  (rebuilds)")
+        if top_urls("quokka"):
+            failures.append("deleted history still found")
+        if not top_urls("another page") or not top_urls("ocelot"):
+            failures.append("rebuild after a delete lost pages or marks")
+        db = sqlite3.connect(history)
+        db.execute("DELETE FROM History")
+        db.execute("DELETE FROM CompletionHistory")
+        db.commit()
+        db.close()
+        index.sync(*sources)
+        if top_urls("tapir"):
+            failures.append("cleared history still found")
+
+        with open(bookmarks, "w") as f:
+            f.write("")
+        index.sync(*sources)
+        if top_urls("ocelot"):
+            failures.append("removed bookmark still found")
+        index.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    for failure in failures:
+        print(f"  FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+# Suspends idle background tabs under memory pressure, for
+# userscripts/tab-suspend.
+#
+# Pressure starts when MemAvailable drops under LOW_AVAILABLE of MemTotal,
+# or qutebrowser's processes together pass RSS_LIMIT of it, and ends once
+# MemAvailable is back over HIGH_AVAILABLE and the RSS under RSS_RELEASE;
+# the gaps keep it from flapping. While it lasts, every step
+# suspends the least recently active background tabs and the HTTP cache is
+# shrunk. A suspended tab navigates to a small data: placeholder, which
+# lets its renderer go; when the tab is shown again the placeholder goes
+# back in history, and the page comes back with its scroll position.
+# Placeholders are loaded with :run-with-count N open, which navigates tab N
+# where it is, so focus never moves and nothing visibly changes.
+#
+# Controller.step() takes its inputs as plain values, so the logic runs
+# the same against fake meminfo (tab_suspend_sim.py) as against /proc.
+#
+# Tabs are addressed by index, as counts, so a suspension is only
+# sent if a fresh read right before it shows the same tabs in the same
+# places; otherwise the step is skipped and the next one tries again.
+
+import html
+import json
+import os
+import urllib.parse
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+LOW_AVAILABLE = 0.10
+HIGH_AVAILABLE = 0.20
+RSS_LIMIT = 0.40
+RSS_RELEASE = 0.30
+
+# Tabs suspended per step while under pressure
+SUSPEND_PER_STEP = 2
+# Seconds a tab must have been in the background before it is suspended
+MIN_IDLE = 300.0
+
+# content.cache.size (bytes) normally, as config.py sets it, and while under
+# pressure
+CACHE_SIZE = 52428800
+CACHE_SIZE_UNDER_PRESSURE = 8388608
+
+PLACEHOLDER_PREFIX = "data:text/html;charset=utf-8,"
+PLACEHOLDER_MARK = "<!-- qute-tab-suspend -->"
+
+PLACEHOLDER = """{mark}<!doctype html>
+<title>&#x1F4A4; {title}</title>
+<body style="font: 14px sans-serif; margin: 2em">
+<p>Suspended to save memory: <a href="{url}">{url}</a></p>
+<script>
+// Shown again: go back to the page, which restores its scroll position.
+// Waits for the tab to become visible, as it is loaded in the background.
+document.addEventListener("visibilitychange", () => {{
+  if (document.visibilityState !== "visible") return;
+  if (history.length > 1) history.back();
+  else location.replace({url_js});
+}});
+</script>
+"""
+
+
+class Tab(NamedTuple):
+    index: int  # 1-based, as counts address tabs
+    url: str
+    title: str
+    active: bool
+    pinned: bool
+
+
+def parse_meminfo(text: str) -> Dict[str, int]:
+    # {"MemTotal": kB, ...}
+    info = {}
+    for line in text.splitlines():
+        key, _, rest = line.partition(":")
+        fields = rest.split()
+        if fields and fields[0].isdigit():
+            info[key] = int(fields[0])
+    return info
+
+
+def tree_rss_kib(root: int, proc: str = "/proc") -> int:
+    # Resident memory of root and all its descendants, e.g. qutebrowser and
+    # its QtWebEngineProcess renderers
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir(proc):
+        if not name.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc, name, "stat")) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces and parentheses
+        ppid = int(stat[stat.rindex(")") + 2 :].split()[1])
+        children.setdefault(ppid, []).append(int(name))
+    total = 0
+    stack = [root]
+    while stack:
+        pid = stack.pop()
+        stack += children.get(pid, [])
+        try:
+            with open(os.path.join(proc, str(pid), "status")) as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            pass
+    return total
+
+
+def session_tabs(session: dict) -> Optional[List[Tab]]:
+    # Tabs of the only window of a session-save dump, None when there are
+    # several: commands sent through QUTE_FIFO go to the window the
+    # userscript was started from, and the dump doesn't say which one that is
+    windows = session.get("windows") or []
+    if len(windows) > 1:
+        return None
+    if not windows:
+        return []
+    tabs = []
+    for i, tab in enumerate(windows[0].get("tabs") or [], 1):
+        history = tab.get("history") or [{}]
+        entry = next((h for h in history if h.get("active")), history[-1])
+        tabs.append(
+            Tab(
+                index=i,
+                url=entry.get("url", ""),
+                title=entry.get("title", ""),
+                active=bool(tab.get("active")),
+                pinned=bool(entry.get("pinned") or tab.get("pinned")),
+            )
+        )
+    return tabs
+
+
+def tab_layout(tabs: List[Tab]) -> List[Tuple[int, str, bool]]:
+    # What tab indexes depend on, plus which tab the user is looking at
+    return [(tab.index, tab.url, tab.active) for tab in tabs]
+
+
+def placeholder_url(tab: Tab) -> str:
+    page = PLACEHOLDER.format(
+        mark=PLACEHOLDER_MARK,
+        title=html.escape(tab.title or tab.url),
+        url=html.escape(tab.url),
+        url_js=html.escape(json.dumps(tab.url), quote=False),
+    )
+    return PLACEHOLDER_PREFIX + urllib.parse.quote(page, safe="")
+
+
+def is_placeholder(url: str) -> bool:
+    return url.startswith(PLACEHOLDER_PREFIX) and urllib.parse.unquote(
+        url[len(PLACEHOLDER_PREFIX) :]
+    ).startswith(PLACEHOLDER_MARK)
+
+
+class Controller:
+    """Decides, one sample at a time, which qutebrowser commands to send."""
+
+    def __init__(
+        self,
+        low: float = LOW_AVAILABLE,
+        high: float = HIGH_AVAILABLE,
+        rss_limit: float = RSS_LIMIT,
+        rss_release: float = RSS_RELEASE,
+        per_step: int = SUSPEND_PER_STEP,
+        min_idle: float = MIN_IDLE,
+    ):
+        self.low = low
+        self.high = high
+        self.rss_limit = rss_limit
+        self.rss_release = rss_release
+        self.per_step = per_step
+        self.min_idle = min_idle
+        self.pressure = False
+        self.started: Optional[float] = None
+        # URL -> last time it was the active tab
+        self.last_active: Dict[str, float] = {}
+
+    def under_pressure(self, meminfo: Dict[str, int], rss_kib: int) -> bool:
+        total = meminfo.get("MemTotal")
+        if not total:
+            return False
+        available = meminfo.get("MemAvailable", meminfo.get("MemFree", total)) / total
+        if self.pressure:
+            return available < self.high or rss_kib > self.rss_release * total
+        return available < self.low or rss_kib > self.rss_limit * total
+
+    def victims(self, tabs: List[Tab], now: float) -> List[Tab]:
+        started = self.started if self.started is not None else now
+        candidates = [
+            tab
+            for tab in tabs
+            if not tab.active
+            and not tab.pinned
+            and not is_placeholder(tab.url)
+            and tab.url.startswith(("http://", "https://"))
+            and now - self.last_active.get(tab.url, started) >= self.min_idle
+        ]
+        # Least recently active first; never seen active counts as since the
+        # controller started, ties go to the tab furthest away
+        active = next((tab.index for tab in tabs if tab.active), 0)
+        candidates.sort(
+            key=lambda t: (self.last_active.get(t.url, started), -abs(t.index - active))
+        )
+        return candidates[: self.per_step]
+
+    def step(
+        self,
+        meminfo: Dict[str, int],
+        rss_kib: int,
+        tabs: List[Tab],
+        now: float,
+        force: bool = False,
+        reread: Optional[Callable[[], List[Tab]]] = None,
+    ) -> List[str]:
+        # force suspends as if under pressure, without touching the cache.
+        # reread returns the tabs as they are now; without it, tabs are
+        # trusted to be current.
+        if self.started is None:
+            self.started = now
+        for tab in tabs:
+            if tab.active:
+                self.last_active[tab.url] = now
+
+        commands = []
+        pressure = self.under_pressure(meminfo, rss_kib)
+        if pressure != self.pressure:
+            self.pressure = pressure
+            size = CACHE_SIZE_UNDER_PRESSURE if pressure else CACHE_SIZE
+            commands.append(f"set --temp content.cache.size {size}")
+        if not (pressure or force):
+            return commands
+
+        victims = self.victims(tabs, now)
+        if victims and reread is not None:
+            if tab_layout(reread()) != tab_layout(tabs):
+                return commands
+        for tab in victims:
+            commands.append(f"run-with-count {tab.index} open {placeholder_url(tab)}")
+        return commands
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# Simulates tab_suspend.Controller against fake /proc/meminfo and a fake
+# browser, and checks what it does.
+#
+# Usage: tab_suspend_sim.py [--steps N] [--tabs N] [--seed N] [-v]
+#
+# The browser opens tabs and wanders between them; every loaded tab holds
+# renderer memory, placeholders next to none, and a background job takes a
+# big chunk of memory for a while. Each step the controller gets the
+# meminfo text the machine would show, the browser's RSS and its tabs, and
+# its commands are applied to the browser. Checks: nothing happens without
+# pressure, only idle background tabs are suspended and least recently used
+# first, the tab replaced is the one picked even when the user moves a tab
+# mid-step, focus never moves, the cache size flips once per episode,
+# pressure clears and nothing is suspended while several windows are open.
+# Exits non-zero when a check fails.
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import urllib.parse
+from typing import Dict, List, Optional
+
+import tab_suspend
+from tab_suspend import Tab
+
+MIB = 1024  # meminfo counts kB
+
+MEMINFO = """MemTotal:       {total:>8} kB
+MemFree:        {free:>8} kB
+MemAvailable:   {available:>8} kB
+Buffers:        {buffers:>8} kB
+Cached:         {cached:>8} kB
+SwapTotal:             0 kB
+SwapFree:              0 kB
+"""
+
+
+class FakeBrowser:
+    """Tabs with memory costs that execute the controller's commands."""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.tabs: List[Dict] = []
+        self.active = 0
+        self.cache_size = tab_suspend.CACHE_SIZE
+        self.cache_changes: List[int] = []
+        self.resumed = 0
+
+    def open_tab(self, pinned: bool = False) -> None:
+        n = len(self.tabs)
+        self.tabs.append(
+            {
+                "url": f"https://site{n}.example/page?id={n}",
+                "title": f"Page {n} </title><script>",
+                "pinned": pinned,
+                "placeholder": None,
+                "rss": self.rng.randint(80, 400) * MIB,
+            }
+        )
+        self.active = n
+
+    def focus(self, i: int) -> None:
+        self.active = i
+        tab = self.tabs[i]
+        if tab["placeholder"] is not None:
+            # The placeholder's visibilitychange handler goes back
+            tab["placeholder"] = None
+            self.resumed += 1
+
+    def move(self, i: int, j: int) -> None:
+        # :tab-move; the active tab stays active
+        active = self.tabs[self.active]
+        self.tabs.insert(j, self.tabs.pop(i))
+        self.active = self.tabs.index(active)
+
+    def rss(self) -> int:
+        # Browser process plus a renderer per loaded tab
+        return 300 * MIB + sum(
+            2 * MIB if t["placeholder"] else t["rss"] for t in self.tabs
+        )
+
+    def session(self) -> List[Tab]:
+        return [
+            Tab(
+                index=i + 1,
+                url=t["placeholder"] or t["url"],
+                title=t["title"],
+                active=i == self.active,
+                pinned=t["pinned"],
+            )
+            for i, t in enumerate(self.tabs)
+        ]
+
+    def run(self, command: str) -> None:
+        name, _, arg = command.partition(" ")
+        if name == "run-with-count":
+            # Only "open" is sent with a count: it loads tab N in place, in
+            # the background, and the placeholder waits to become visible
+            count, _, inner = arg.partition(" ")
+            inner_name, _, url = inner.partition(" ")
+            if inner_name != "open":
+                raise ValueError(f"unexpected command {command!r}")
+            self.tabs[int(count) - 1]["placeholder"] = url
+        elif name == "set":
+            size = int(arg.rsplit(" ", 1)[1])
+            self.cache_size = size
+            self.cache_changes.append(size)
+        else:
+            raise ValueError(f"unexpected command {command!r}")
+
+
+def meminfo_text(total: int, used: int) -> str:
+    available = max(total - used, 0)
+    return MEMINFO.format(
+        total=total,
+        free=available // 3,
+        available=available,
+        buffers=64 * MIB,
+        cached=available // 2,
+    )
+
+
+def simulate(args: argparse.Namespace) -> List[str]:
+    rng = random.Random(args.seed)
+    total = 8192 * MIB
+    step_seconds = 30.0
+    browser = FakeBrowser(rng)
+    browser.open_tab(pinned=True)
+    controller = tab_suspend.Controller()
+    failures: List[str] = []
+    last_active: Dict[str, float] = {}
+    episodes = 0
+    pressure_steps = 0
+    min_available = total
+    suspended = 0
+    raced = 0
+    stuck: Optional[int] = None
+
+    for step in range(args.steps):
+        now = step * step_seconds
+        # The user: opens tabs early on, then wanders, mostly among recent ones
+        if len(browser.tabs) < args.tabs and rng.random() < 0.5:
+            browser.open_tab()
+        elif browser.tabs and rng.random() < 0.4:
+            recent = sorted(
+                range(len(browser.tabs)),
+                key=lambda i: last_active.get(browser.tabs[i]["url"], 0.0),
+            )[-5:]
+            browser.focus(rng.choice(recent))
+        last_active[browser.tabs[browser.active]["url"]] = now
+
+        # A memory-hungry job runs through the middle third
+        job = 3000 * MIB if args.steps // 3 <= step < 2 * args.steps // 3 else 0
+        rss = browser.rss()
+        used = 2500 * MIB + job + rss
+        text = meminfo_text(total, used)
+        meminfo = tab_suspend.parse_meminfo(text)
+        available = meminfo["MemAvailable"] / meminfo["MemTotal"]
+        min_available = min(min_available, meminfo["MemAvailable"])
+
+        was_pressure = controller.pressure
+        before = browser.session()
+        active_before = browser.active
+        # Sometimes the user moves a tab between the read and the commands
+        race = len(browser.tabs) > 2 and rng.random() < 0.2
+        moved = False
+
+        def reread() -> List[Tab]:
+            nonlocal active_before, moved
+            if race:
+                browser.move(len(browser.tabs) - 1, 0)
+                active_before = browser.active
+                moved = True
+            return browser.session()
+
+        commands = controller.step(meminfo, rss, before, now, reread=reread)
+        raced += moved
+        for command in commands:
+            browser.run(command)
+        if controller.pressure and not was_pressure:
+            episodes += 1
+        pressure_steps += controller.pressure
+
+        opened = [
+            int(cmd.split()[1]) - 1
+            for cmd in commands
+            if cmd.startswith("run-with-count")
+        ]
+        suspended += len(opened)
+        if moved and opened:
+            failures.append(f"step {step}: suspended tabs moved since the read")
+        if opened and not (
+            was_pressure
+            or available < controller.low
+            or rss > controller.rss_limit * meminfo["MemTotal"]
+        ):
+            failures.append(f"step {step}: suspended without pressure")
+        if browser.active != active_before:
+            failures.append(f"step {step}: focus moved")
+        for i in opened:
+            tab = before[i]
+            if browser.tabs[i]["url"] != tab.url:
+                failures.append(f"step {step}: replaced {browser.tabs[i]['url']}")
+            if tab.active or tab.pinned:
+                failures.append(f"step {step}: suspended active or pinned {tab.url}")
+            idle = now - controller.last_active.get(tab.url, controller.started)
+            if idle < controller.min_idle:
+                failures.append(f"step {step}: suspended {tab.url} after {idle:.0f}s")
+            # Least recently used first: every tab left loaded and eligible
+            # was active more recently
+            seen = controller.last_active.get(tab.url, controller.started)
+            for other in before:
+                if (
+                    other.index - 1 not in opened
+                    and not other.active
+                    and not other.pinned
+                    and not tab_suspend.is_placeholder(other.url)
+                    and controller.last_active.get(other.url, controller.started) < seen
+                ):
+                    failures.append(
+                        f"step {step}: suspended {tab.url} before older {other.url}"
+                    )
+            placeholder = browser.tabs[i]["placeholder"]
+            page = urllib.parse.unquote(
+                placeholder[len(tab_suspend.PLACEHOLDER_PREFIX) :]
+            )
+            if (
+                not tab_suspend.is_placeholder(placeholder)
+                or "<script>\n//" not in page
+            ):
+                failures.append(f"step {step}: bad placeholder for {tab.url}")
+            if "</title><script>" in page:
+                failures.append(f"step {step}: title not escaped")
+
+        # Pressure has to clear within a few minutes once the job is gone
+        if step >= 2 * args.steps // 3 and controller.pressure:
+            stuck = step if stuck is None else stuck
+        elif not controller.pressure:
+            stuck = None
+        if args.verbose:
+            print(
+                f"  {step:4} avail {available:5.1%} rss {browser.rss() // MIB:6} MiB"
+                f"  tabs {len(browser.tabs):3}  {'P' if controller.pressure else ' '}"
+                f"  {len(opened)} suspended"
+            )
+
+    if stuck is not None and args.steps - stuck > 10:
+        failures.append(f"pressure still on {args.steps - stuck} steps after the job")
+    expected = []
+    for _ in range(episodes):
+        expected += [tab_suspend.CACHE_SIZE_UNDER_PRESSURE, tab_suspend.CACHE_SIZE]
+    if browser.cache_changes != expected[: len(browser.cache_changes)] or len(
+        browser.cache_changes
+    ) not in (2 * episodes, 2 * episodes - 1):
+        failures.append(f"cache size changes {browser.cache_changes}")
+    if episodes == 0:
+        failures.append("the job never caused pressure")
+
+    print(
+        f"  {args.steps} steps, {len(browser.tabs)} tabs, {episodes} pressure episodes"
+        f" over {pressure_steps} steps, {suspended} tabs suspended,"
+        f" {raced} steps skipped for a moved tab,"
+        f" {browser.resumed} resumed, lowest MemAvailable {min_available // MIB} MiB"
+    )
+    return failures
+
+
+def check_tree_rss() -> List[str]:
+    # A fake /proc: qutebrowser (10) with a zygote (11) and two renderers,
+    # one named with spaces and parentheses, plus an unrelated process
+    proc = tempfile.mkdtemp(prefix="fake-proc-")
+    processes = {
+        10: (1, "qutebrowser", 300),
+        11: (10, "QtWebEngineProcess", 50),
+        12: (11, "QtWebEngineProc (x) y", 200),
+        13: (11, "QtWebEngineProcess", 150),
+        20: (1, "unrelated", 999),
+    }
+    try:
+        for pid, (ppid, comm, rss) in processes.items():
+            os.mkdir(os.path.join(proc, str(pid)))
+            with open(os.path.join(proc, str(pid), "stat"), "w") as f:
+                f.write(f"{pid} ({comm}) S {ppid} {pid} {pid} 0 -1\n")
+            with open(os.path.join(proc, str(pid), "status"), "w") as f:
+                f.write(f"Name:\t{comm}\nVmRSS:\t{rss} kB\n")
+        got = tab_suspend.tree_rss_kib(10, proc)
+    finally:
+        shutil.rmtree(proc, ignore_errors=True)
+    return [] if got == 700 else [f"tree_rss_kib gave {got} kB, expected 700"]
+
+
+def check_session_tabs() -> List[str]:
+    # A dump with several windows can't say which one commands go to
+    def window(*urls: str) -> dict:
+        return {"tabs": [{"history": [{"url": url, "active": True}]} for url in urls]}
+
+    failures = []
+    one = tab_suspend.session_tabs({"windows": [window("https://a", "https://b")]})
+    if [tab.url for tab in one or []] != ["https://a", "https://b"]:
+        failures.append(f"session_tabs on one window gave {one}")
+    two = {"windows": [window("https://a"), window("https://b")]}
+    if tab_suspend.session_tabs(two) is not None:
+        failures.append("session_tabs picked a window out of several")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Simulate tab suspension")
+    parser.add_argument("--steps", type=int, default=360, help="30 s samples")
+    parser.add_argument("--tabs", type=int, default=40, help="tabs to open")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    print("tab-suspend simulation against fake meminfo")
+    failures = simulate(args) + check_tree_rss() + check_session_tabs()
+    for failure in failures[:20]:
+        print(f"  FAIL: {failure}")
+    if len(failures) > 20:
+        print(f"  ... {len(failures) - 20} more")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
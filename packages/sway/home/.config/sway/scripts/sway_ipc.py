@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# Minimal in-process client for the i3/sway IPC protocol (see sway-ipc(7)).
+# Shared by the MRU scripts so they don't fork swaymsg for every request.
+
+import asyncio
+import json
+import os
+import socket
+import struct
+from typing import AbstractSet, Iterator, List, Optional, Tuple
+
+try:
+    # Optional: about twice as fast as json on large trees
+    import orjson
+except ImportError:
+    orjson = None
+
+MAGIC = b"i3-ipc"
+HEADER = struct.Struct("=6sII")
+
+RUN_COMMAND = 0
+GET_WORKSPACES = 1
+SUBSCRIBE = 2
+GET_OUTPUTS = 3
+GET_TREE = 4
+GET_BINDING_STATE = 12
+
+EVENT_FLAG = 0x80000000
+EVENT_NAMES = {
+    0: "workspace",
+    1: "output",
+    2: "mode",
+    3: "window",
+    4: "barconfig_update",
+    5: "binding",
+    6: "shutdown",
+    7: "tick",
+    0x14: "bar_state_update",
+    0x15: "input",
+}
+
+
+class SwayIPCError(Exception):
+    pass
+
+
+def get_socket_path() -> str:
+    path = os.environ.get("SWAYSOCK") or os.environ.get("I3SOCK")
+    if not path:
+        raise SwayIPCError("SWAYSOCK is not set")
+    return path
+
+
+# Replies at least this large are decoded with the keep projection. It
+# roughly halves peak RSS but costs 25-50% more parse time, which only pays
+# off on trees of a thousand windows or so; smaller replies take the fast
+# path even when the caller passes keep.
+PROJECT_MIN = 1 << 20
+
+
+def decode(
+    body: bytes,
+    keep: Optional[AbstractSet[str]] = None,
+    keep_min: int = PROJECT_MIN,
+) -> object:
+    # keep names the object keys the caller reads; json then drops every
+    # other key as each object is built, so blobs such as rects and
+    # window_properties never pile up. Only replies of keep_min bytes or
+    # more are projected. orjson ignores keep: it decodes everything and is
+    # still faster than plain json.
+    if orjson is not None:
+        return orjson.loads(body)
+    if keep is None or len(body) < keep_min:
+        return json.loads(body)
+    decoder = json.JSONDecoder(
+        object_pairs_hook=lambda pairs: {k: v for k, v in pairs if k in keep}
+    )
+    return decoder.decode(body.decode())
+
+
+def pack(msg_type: int, payload: bytes = b"") -> bytes:
+    return HEADER.pack(MAGIC, len(payload), msg_type) + payload
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:], size - got)
+        if n == 0:
+            raise SwayIPCError("connection closed by sway")
+        got += n
+    return bytes(buf)
+
+
+def read_message(sock: socket.socket) -> Tuple[int, bytes]:
+    magic, length, msg_type = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    if magic != MAGIC:
+        raise SwayIPCError(f"bad magic {magic!r}")
+    return msg_type, _recv_exact(sock, length) if length else b""
+
+
+class SwayIPC:
+    """Request/response connection to sway.
+
+    One connection is reused for every call. Use ``subscribe`` on a separate
+    instance, since a subscribed socket only delivers events afterwards.
+    """
+
+    def __init__(self, path: Optional[str] = None, timeout: Optional[float] = 2.0):
+        self.path = path or get_socket_path()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(self.path)
+        except OSError as e:
+            self.sock.close()
+            raise SwayIPCError(f"cannot connect to {self.path}: {e}") from e
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> "SwayIPC":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def request(
+        self,
+        msg_type: int,
+        payload: str = "",
+        keep: Optional[AbstractSet[str]] = None,
+    ) -> object:
+        self.sock.sendall(pack(msg_type, payload.encode()))
+        while True:
+            reply_type, body = read_message(self.sock)
+            # Events can only arrive on a subscribed socket; skip them here
+            if not reply_type & EVENT_FLAG:
+                break
+        if reply_type != msg_type:
+            raise SwayIPCError(f"expected reply {msg_type}, got {reply_type}")
+        return decode(body, keep)
+
+    def command(self, cmd: str) -> List[dict]:
+        return self.request(RUN_COMMAND, cmd)
+
+    def get_tree(self, keep: Optional[AbstractSet[str]] = None) -> dict:
+        # See decode() for keep
+        return self.request(GET_TREE, keep=keep)
+
+    def get_workspaces(self) -> List[dict]:
+        return self.request(GET_WORKSPACES)
+
+    def get_outputs(self) -> List[dict]:
+        return self.request(GET_OUTPUTS)
+
+    def get_binding_state(self) -> dict:
+        # {"name": current binding mode}
+        return self.request(GET_BINDING_STATE)
+
+    def subscribe(self, events: List[str]) -> None:
+        reply = self.request(SUBSCRIBE, json.dumps(events))
+        if not isinstance(reply, dict) or not reply.get("success"):
+            raise SwayIPCError(f"subscribe failed: {reply!r}")
+        # Events arrive whenever sway has them; block until then
+        self.sock.settimeout(None)
+
+    def read_event(self) -> Tuple[str, dict]:
+        msg_type, body = read_message(self.sock)
+        name = EVENT_NAMES.get(msg_type & ~EVENT_FLAG, str(msg_type))
+        return name, json.loads(body)
+
+    def events(self) -> Iterator[Tuple[str, dict]]:
+        while True:
+            yield self.read_event()
+
+
+async def read_message_async(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    magic, length, msg_type = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if magic != MAGIC:
+        raise SwayIPCError(f"bad magic {magic!r}")
+    return msg_type, await reader.readexactly(length) if length else b""
+
+
+async def subscribe_async(
+    events: List[str], path: Optional[str] = None
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    # asyncio counterpart of SwayIPC.subscribe, for event loops
+    reader, writer = await asyncio.open_unix_connection(path or get_socket_path())
+    try:
+        writer.write(pack(SUBSCRIBE, json.dumps(events).encode()))
+        await writer.drain()
+        _, body = await read_message_async(reader)
+        reply = json.loads(body)
+        if not isinstance(reply, dict) or not reply.get("success"):
+            raise SwayIPCError(f"subscribe failed: {reply!r}")
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer
+
+
+async def read_event_async(reader: asyncio.StreamReader) -> Tuple[str, dict]:
+    msg_type, body = await read_message_async(reader)
+    name = EVENT_NAMES.get(msg_type & ~EVENT_FLAG, str(msg_type))
+    return name, json.loads(body)
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# Shared state and tree helpers for sway_mru_daemon.py and sway_mru_cycle.py.
+
+import mmap
+import os
+import struct
+import tempfile
+import time
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# State file: header (magic, version, reserved, count) then packed int64 ids
+STATE_MAGIC = b"SMRU"
+STATE_VERSION = 1
+STATE_HEADER = struct.Struct("=4sHHI")
+
+# Which windows a cycle steps through, all drawn from the one MRU list:
+# the focused workspace, every workspace on the focused output, everything,
+# or windows of the focused app
+CYCLE_MODES = ("workspace", "output", "global", "app")
+
+# Every get_tree key WindowModel.load reads ("class" is inside
+# window_properties); the rest need not be decoded
+TREE_FIELDS = frozenset(
+    {
+        "id",
+        "type",
+        "name",
+        "focused",
+        "focus",
+        "app_id",
+        "window",
+        "window_properties",
+        "class",
+        "nodes",
+        "floating_nodes",
+    }
+)
+
+
+def _runtime_path(name: str, fallback: str) -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, name)
+    return os.path.join(tempfile.gettempdir(), fallback)
+
+
+def get_state_path() -> str:
+    return _runtime_path("sway_mru.bin", f"sway_mru_{os.getuid()}.bin")
+
+
+def get_control_path() -> str:
+    return _runtime_path("sway_mru.sock", f"sway_mru_{os.getuid()}.sock")
+
+
+def load_mru(path: str) -> List[int]:
+    try:
+        with (
+            open(path, "rb") as f,
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+        ):
+            magic, version, _, count = STATE_HEADER.unpack_from(mm)
+            if magic != STATE_MAGIC or version != STATE_VERSION:
+                return []
+            ids = array("q")
+            ids.frombytes(mm[STATE_HEADER.size : STATE_HEADER.size + 8 * count])
+            return ids.tolist()
+    except (OSError, ValueError, struct.error):
+        # Missing, empty or truncated file
+        return []
+
+
+def save_mru(path: str, mru: Iterable[int]) -> None:
+    ids = array("q", mru)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION, 0, len(ids)))
+        f.write(ids.tobytes())
+    os.replace(tmp_path, path)
+
+
+class WriteBehind:
+    """Coalesces MRU saves: at most one write per ``delay`` seconds.
+
+    Call ``mark`` on every change and ``flush_if_due`` from the event loop,
+    using ``timeout`` as the loop's wait limit. ``flush`` writes immediately,
+    e.g. on shutdown.
+    """
+
+    def __init__(self, path: str, delay: float = 1.0):
+        self.path = path
+        self.delay = delay
+        self.dirty_since: Optional[float] = None
+        self.writes = 0
+
+    def mark(self) -> None:
+        if self.dirty_since is None:
+            self.dirty_since = time.monotonic()
+
+    def timeout(self) -> Optional[float]:
+        if self.dirty_since is None:
+            return None
+        return max(0.0, self.dirty_since + self.delay - time.monotonic())
+
+    def flush_if_due(self, mru: Iterable[int]) -> None:
+        if self.dirty_since is not None and self.timeout() == 0.0:
+            self.flush(mru)
+
+    def flush(self, mru: Iterable[int]) -> None:
+        if self.dirty_since is None:
+            return
+        self.dirty_since = None
+        try:
+            save_mru(self.path, mru)
+            self.writes += 1
+        except OSError:
+            pass
+
+
+def walk(node: dict) -> Iterator[dict]:
+    # Every node under (and including) node, depth first, without building
+    # a list; stop iterating to stop the walk
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        yield n
+        for key in ("nodes", "floating_nodes"):
+            children = n.get(key)
+            if children:
+                stack.extend(children)
+
+
+def focus_path(tree: dict) -> Iterator[dict]:
+    # Root, output, workspace, ... down to the focused node, following each
+    # node's focus array (most recently focused child first) rather than
+    # searching the tree
+    node: Optional[dict] = tree
+    while node is not None:
+        yield node
+        focus = node.get("focus")
+        if node.get("focused") or not focus:
+            return
+        want = focus[0]
+        node = next(
+            (
+                c
+                for key in ("nodes", "floating_nodes")
+                for c in node.get(key) or ()
+                if c.get("id") == want
+            ),
+            None,
+        )
+
+
+def is_window(node: dict) -> bool:
+    return (
+        node.get("type") == "con"
+        and isinstance(node.get("id"), int)
+        and (node.get("app_id") is not None or node.get("window") is not None)
+    )
+
+
+def is_client(node: dict) -> bool:
+    # Like is_window, but also accepts floating windows
+    return (
+        node.get("type") in ("con", "floating_con")
+        and isinstance(node.get("id"), int)
+        and (node.get("app_id") is not None or node.get("window") is not None)
+    )
+
+
+class MRUList:
+    """Most-recently-used window ids as a doubly linked list over dicts.
+
+    touch, discard and eviction of the oldest entry are O(1), as is finding
+    an entry's neighbours, so cycling never scans or rebuilds the list.
+    """
+
+    def __init__(self, ids: Iterable[int] = (), capacity: int = 512):
+        self.capacity = capacity
+        self._next: dict[Optional[int], Optional[int]] = {None: None}
+        self._prev: dict[Optional[int], Optional[int]] = {None: None}
+        # Oldest first, so the most recent entry ends up at the head
+        for con_id in reversed(list(ids)):
+            self.touch(con_id)
+
+    def __len__(self) -> int:
+        return len(self._next) - 1
+
+    def __contains__(self, con_id: object) -> bool:
+        return con_id is not None and con_id in self._next
+
+    def __iter__(self) -> Iterator[int]:
+        con_id = self._next[None]
+        while con_id is not None:
+            yield con_id
+            con_id = self._next[con_id]
+
+    def __reversed__(self) -> Iterator[int]:
+        con_id = self._prev[None]
+        while con_id is not None:
+            yield con_id
+            con_id = self._prev[con_id]
+
+    def head(self) -> Optional[int]:
+        return self._next[None]
+
+    def after(self, con_id: int) -> Optional[int]:
+        # Next less recently used entry, None past the end
+        return self._next.get(con_id)
+
+    def before(self, con_id: int) -> Optional[int]:
+        return self._prev.get(con_id)
+
+    def discard(self, con_id: int) -> bool:
+        if con_id not in self:
+            return False
+        prev = self._prev.pop(con_id)
+        nxt = self._next.pop(con_id)
+        self._next[prev] = nxt
+        self._prev[nxt] = prev
+        return True
+
+    def touch(self, con_id: int) -> None:
+        # Move to front, evicting the oldest entry when over capacity
+        self.discard(con_id)
+        first = self._next[None]
+        self._next[None] = con_id
+        self._prev[con_id] = None
+        self._next[con_id] = first
+        self._prev[first] = con_id
+        if len(self) > self.capacity:
+            self.discard(self._prev[None])
+
+    def cycle(
+        self, window_ids: List[int], focused_id: Optional[int], direction: str
+    ) -> Optional[int]:
+        # Cycle through window_ids in MRU order; untracked ones come last so
+        # they remain reachable
+        if not window_ids:
+            return None
+        members = set(window_ids)
+        untracked = [wid for wid in window_ids if wid not in self]
+        if focused_id not in members or focused_id not in self:
+            ordered = [wid for wid in self if wid in members] + untracked
+            if focused_id not in members:
+                # Focused may be a container parent; fallback to first
+                return ordered[0]
+            idx = ordered.index(focused_id)
+            step = 1 if direction == "next" else -1
+            return ordered[(idx + step) % len(ordered)]
+
+        # Walk the list from the focused window to its nearest member
+        step = self.after if direction == "next" else self.before
+        con_id = step(focused_id)
+        while con_id is not None:
+            if con_id in members:
+                return con_id
+            con_id = step(con_id)
+        # Ran off the tracked part: wrap through the untracked windows
+        if untracked:
+            return untracked[0] if direction == "next" else untracked[-1]
+        wrap = iter(self) if direction == "next" else reversed(self)
+        return next(wid for wid in wrap if wid in members)
+
+
+class WindowModel:
+    """Window index by workspace, output and app kept current from sway events.
+
+    Built once from a get_tree snapshot, then updated incrementally so
+    membership lookups never need a tree walk. Event handlers return False
+    when an event doesn't fit the model (e.g. an unknown container), which
+    means events were missed and the caller should resync.
+    """
+
+    def __init__(self) -> None:
+        # con_id -> {"workspace", "app_id", "floating"}
+        self.windows: dict[int, dict] = {}
+        # workspace name -> con ids on it (dict used as an ordered set)
+        self.workspaces: dict[str, dict[int, None]] = {}
+        # app_id (or X11 class) -> con ids
+        self.apps: dict[Optional[str], dict[int, None]] = {}
+        # workspace name -> output name
+        self.outputs: dict[str, Optional[str]] = {}
+        self.focused_ws: Optional[str] = None
+        self.focused_id: Optional[int] = None
+
+    def load(self, tree: dict, mode: Optional[str] = None) -> None:
+        # The whole tree by default. With a cycle mode, only the part that
+        # mode needs: the focused workspace or output is found through the
+        # focus arrays and only its subtree gets walked.
+        self.windows.clear()
+        self.workspaces.clear()
+        self.apps.clear()
+        self.outputs.clear()
+        self.focused_ws = None
+        self.focused_id = None
+
+        scope, output = tree, None
+        if mode in ("workspace", "output"):
+            for node in focus_path(tree):
+                kind = node.get("type")
+                if kind == "output":
+                    output = node.get("name")
+                    if mode == "output":
+                        scope = node
+                elif kind == "workspace" and mode == "workspace":
+                    scope = node
+            if scope is tree:
+                output = None
+
+        stack: List[Tuple[dict, Optional[str], Optional[str]]] = [(scope, output, None)]
+        while stack:
+            node, output, ws = stack.pop()
+            kind = node.get("type")
+            if kind == "output":
+                output = node.get("name")
+            elif kind == "workspace":
+                ws = node.get("name")
+                self.workspaces[ws] = {}
+                self.outputs[ws] = output
+            if node.get("focused"):
+                self.focused_id = node.get("id")
+                self.focused_ws = ws
+            if ws is not None and is_client(node):
+                self._add(node, ws)
+            for key in ("nodes", "floating_nodes"):
+                for c in node.get(key) or ():
+                    stack.append((c, output, ws))
+
+    def _add(self, con: dict, ws: str) -> None:
+        con_id = con["id"]
+        app_id = con.get("app_id") or (con.get("window_properties") or {}).get("class")
+        self.windows[con_id] = {
+            "workspace": ws,
+            "app_id": app_id,
+            "floating": con.get("type") == "floating_con",
+        }
+        self.workspaces.setdefault(ws, {})[con_id] = None
+        self.apps.setdefault(app_id, {})[con_id] = None
+
+    def _remove(self, con_id: int) -> Optional[dict]:
+        info = self.windows.pop(con_id, None)
+        if info is not None:
+            self.workspaces.get(info["workspace"], {}).pop(con_id, None)
+            members = self.apps.get(info["app_id"])
+            if members is not None:
+                members.pop(con_id, None)
+                if not members:
+                    del self.apps[info["app_id"]]
+        return info
+
+    def windows_on(self, ws: Optional[str]) -> List[int]:
+        # Tiled windows only, matching what get_tree cycling always offered
+        members = self.workspaces.get(ws) or {}
+        return [wid for wid in members if not self.windows[wid]["floating"]]
+
+    def candidates(self, mode: str, focused_id: Optional[int]) -> List[int]:
+        # Tiled windows a cycle in the given mode steps through, relative to
+        # focused_id (which may be ahead of the model during a session)
+        info = self.windows.get(focused_id) if focused_id is not None else None
+        ws = info["workspace"] if info is not None else self.focused_ws
+        if mode == "workspace":
+            return self.windows_on(ws)
+        if mode == "output":
+            output = self.outputs.get(ws)
+            members: Iterable[int] = [
+                wid
+                for name, on in self.outputs.items()
+                if on == output
+                for wid in self.workspaces.get(name, ())
+            ]
+        elif mode == "app":
+            if info is None:
+                return []
+            members = self.apps.get(info["app_id"], ())
+        else:
+            members = self.windows
+        return [wid for wid in members if not self.windows[wid]["floating"]]
+
+    def on_window(self, event: dict) -> bool:
+        change = event.get("change")
+        con = event.get("container") or {}
+        con_id = con.get("id")
+        if not isinstance(con_id, int):
+            return True
+
+        if change == "new":
+            # Windows open on the focused workspace; assign rules that put
+            # them elsewhere are corrected on the next workspace focus
+            if is_client(con) and self.focused_ws is not None:
+                self._add(con, self.focused_ws)
+            return True
+        if change == "close":
+            return self._remove(con_id) is not None or not is_client(con)
+        if change == "focus":
+            self.focused_id = con_id
+            info = self.windows.get(con_id)
+            if info is not None:
+                self.focused_ws = info["workspace"]
+                return True
+            return not is_client(con)
+        if change == "floating":
+            info = self.windows.get(con_id)
+            if info is None:
+                return not is_client(con)
+            info["floating"] = con.get("type") == "floating_con"
+            return True
+        if change == "move":
+            # The event doesn't say where the window went
+            return False
+        return con_id in self.windows or not is_client(con)
+
+    def on_workspace(self, event: dict) -> bool:
+        change = event.get("change")
+        current = event.get("current") or {}
+        name = current.get("name")
+        if change == "init" and name:
+            self.workspaces.setdefault(name, {})
+            self.outputs[name] = current.get("output")
+        elif change == "empty" and name:
+            for con_id in list(self.workspaces.get(name, ())):
+                self._remove(con_id)
+            self.workspaces.pop(name, None)
+            self.outputs.pop(name, None)
+        elif change == "rename":
+            old = (event.get("old") or {}).get("name")
+            if old not in self.workspaces or not name:
+                return False
+            members = self.workspaces.pop(old)
+            self.workspaces[name] = members
+            self.outputs[name] = self.outputs.pop(old, current.get("output"))
+            for con_id in members:
+                self.windows[con_id]["workspace"] = name
+            if self.focused_ws == old:
+                self.focused_ws = name
+        elif change == "move" and name:
+            self.outputs[name] = current.get("output")
+        elif change == "focus" and name:
+            self.focused_ws = name
+            self.outputs[name] = current.get("output")
+            self._reconcile(current)
+        return True
+
+    def _reconcile(self, ws_node: dict) -> None:
+        # Focus events carry the workspace's subtree; trust it over guesses
+        name = ws_node["name"]
+        seen = set()
+        stack = [ws_node]
+        while stack:
+            node = stack.pop()
+            if is_client(node):
+                seen.add(node["id"])
+                self._remove(node["id"])
+                self._add(node, name)
+            for key in ("nodes", "floating_nodes"):
+                stack.extend(node.get(key) or ())
+        for con_id in list(self.workspaces.get(name, {})):
+            if con_id not in seen:
+                self._remove(con_id)
@@ -0,0 +1,993 @@
+#!/usr/bin/env python3
+# Headless benchmarks for the MRU scripts. A fake sway IPC server stands in
+# for the compositor, so this runs without a Wayland session.
+#
+# Usage: sway_mru_bench.py [ipc|cycle|mru|tree|decode|storm|replay|session ...]
+#                          [-n ITERATIONS] [--trace TRACE.jsonl]
+#                          [--tree GET_TREE.json]
+#        sway_mru_bench.py --record TRACE.jsonl   (inside a sway session)
+#
+# Traces are JSON lines: ["window"|"workspace"|..., event] as sway sent it,
+# or ["get_tree"|"get_workspaces", reply] snapshots that the fake server
+# serves from that point of the replay on. Exits non-zero when a checked
+# bound (replay lag, session latency, writes, memory) is exceeded or a cycle
+# session leaves sway stuck in its binding mode.
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+import sway_ipc
+import sway_mru
+from sway_ipc import SwayIPC
+
+
+def make_tree(outputs: int = 2, workspaces: int = 5, windows: int = 8) -> dict:
+    # Synthetic tree shaped like sway's: root > output > workspace > con
+    next_id = [1]
+
+    def nid() -> int:
+        next_id[0] += 1
+        return next_id[0]
+
+    root = {"id": 1, "type": "root", "name": "root", "nodes": [], "focus": []}
+    focused_set = False
+    for o in range(outputs):
+        out = {"id": nid(), "type": "output", "name": f"OUT-{o}", "nodes": []}
+        for w in range(workspaces):
+            ws = {
+                "id": nid(),
+                "type": "workspace",
+                "name": str(o * workspaces + w + 1),
+                "output": out["name"],
+                "nodes": [],
+                "floating_nodes": [],
+            }
+            for k in range(windows):
+                con = {
+                    "id": nid(),
+                    "type": "con",
+                    "name": f"window {k}",
+                    "app_id": f"app{k % 4}",
+                    "window": None,
+                    "focused": False,
+                    "nodes": [],
+                    "floating_nodes": [],
+                    "window_properties": {},
+                }
+                if not focused_set:
+                    con["focused"] = True
+                    focused_set = True
+                ws["nodes"].append(con)
+            ws["focus"] = [c["id"] for c in ws["nodes"]]
+            out["nodes"].append(ws)
+        out["focus"] = [ws["id"] for ws in out["nodes"]]
+        root["nodes"].append(out)
+    root["focus"] = [out["id"] for out in root["nodes"]]
+    return root
+
+
+def workspaces_of(tree: dict) -> List[dict]:
+    res = []
+    first = True
+    for out in tree.get("nodes", []):
+        for ws in out.get("nodes", []):
+            if ws.get("type") != "workspace":
+                continue
+            res.append(
+                {
+                    "id": ws["id"],
+                    "name": ws["name"],
+                    "output": out["name"],
+                    "focused": first,
+                }
+            )
+            first = False
+    return res
+
+
+def make_trace(tree: dict, n: int, seed: int = 0) -> List[Tuple[str, dict]]:
+    # Mostly focus changes, with title updates and workspace switches mixed in
+    import random
+
+    rng = random.Random(seed)
+    nodes = list(sway_mru.walk(tree))
+    windows = [c for c in nodes if sway_mru.is_window(c)]
+    workspaces = [w for w in nodes if w.get("type") == "workspace"]
+    trace = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.05:
+            ws = rng.choice(workspaces)
+            trace.append(("workspace", {"change": "focus", "current": ws}))
+        elif roll < 0.10:
+            con = rng.choice(windows)
+            trace.append(("window", {"change": "title", "container": con}))
+        else:
+            con = rng.choice(windows)
+            trace.append(("window", {"change": "focus", "container": con}))
+    return trace
+
+
+def load_trace(path: str) -> List[Tuple[str, dict]]:
+    # One [kind, payload] JSON array per line
+    with open(path, encoding="utf-8") as f:
+        return [tuple(json.loads(line)) for line in f if line.strip()]
+
+
+def record(path: str) -> int:
+    # Captures a live session for replay: snapshots first, then every event,
+    # with fresh snapshots after workspace changes. Stop with Ctrl-C.
+    from sway_mru_daemon import EVENTS
+
+    ipc = SwayIPC()
+    events = SwayIPC()
+    events.subscribe(EVENTS)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+
+        def write(kind: str, payload: object) -> None:
+            f.write(json.dumps([kind, payload]) + "\n")
+
+        write("get_tree", ipc.get_tree())
+        write("get_workspaces", ipc.get_workspaces())
+        try:
+            for kind, event in events.events():
+                write(kind, event)
+                count += 1
+                if kind == "shutdown":
+                    break
+                if kind == "workspace":
+                    write("get_tree", ipc.get_tree())
+                    write("get_workspaces", ipc.get_workspaces())
+        except KeyboardInterrupt:
+            pass
+    ipc.close()
+    events.close()
+    print(f"recorded {count} events to {path}", file=sys.stderr)
+    return 0
+
+
+def vm_kib(field: str = "VmRSS") -> int:
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field))
+
+
+class FakeSway:
+    """Serves get_tree/get_workspaces/run_command and pushes events.
+
+    Focus commands are answered like sway does, with a window focus event,
+    so cycling can be measured end to end through ``command_times``. Mode
+    commands set the binding mode that get_binding_state reports.
+    """
+
+    def __init__(self, tree: Optional[dict] = None):
+        self.set_tree(tree or make_tree())
+        self.mode = "default"
+        self.commands: List[str] = []
+        # perf_counter() at the arrival of each entry in commands
+        self.command_times: List[float] = []
+        self.subscribers: List[socket.socket] = []
+        self.lock = threading.Lock()
+        self.dir = tempfile.mkdtemp(prefix="fake-sway-")
+        self.path = os.path.join(self.dir, "ipc.sock")
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(16)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def set_tree(self, tree: dict) -> None:
+        self.tree = tree
+        self.workspaces = workspaces_of(tree)
+        self.cons = {n["id"]: n for n in sway_mru.walk(tree) if "id" in n}
+
+    def play(self, kind: str, payload: object) -> None:
+        # One trace entry: a snapshot replaces what is served, events go out
+        if kind == "get_tree":
+            self.set_tree(payload)
+        elif kind == "get_workspaces":
+            self.workspaces = payload
+        else:
+            self.emit(kind, payload)
+
+    def close(self) -> None:
+        self.server.close()
+        with self.lock:
+            for s in self.subscribers:
+                s.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self) -> "FakeSway":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _reply(self, msg_type: int, payload: bytes) -> bytes:
+        if msg_type == sway_ipc.GET_TREE:
+            return json.dumps(self.tree).encode()
+        if msg_type == sway_ipc.GET_WORKSPACES:
+            return json.dumps(self.workspaces).encode()
+        if msg_type == sway_ipc.RUN_COMMAND:
+            cmd = payload.decode()
+            self.command_times.append(time.perf_counter())
+            self.commands.append(cmd)
+            if cmd.startswith("mode "):
+                self.mode = cmd[len("mode ") :].strip('"')
+            return b'[{"success": true}]'
+        if msg_type == sway_ipc.GET_BINDING_STATE:
+            return json.dumps({"name": self.mode}).encode()
+        return b'{"success": true}'
+
+    def _serve(self, conn: socket.socket) -> None:
+        try:
+            while True:
+                msg_type, payload = sway_ipc.read_message(conn)
+                conn.sendall(sway_ipc.pack(msg_type, self._reply(msg_type, payload)))
+                if msg_type == sway_ipc.RUN_COMMAND:
+                    # After the reply, as sway does, and off this thread:
+                    # sway queues events rather than wait for a client that
+                    # is busy, and the next command must still get through
+                    con = self.cons.get(_focus_target(payload.decode()))
+                    if con is not None:
+                        event = {"change": "focus", "container": con}
+                        threading.Thread(
+                            target=self.emit, args=("window", event), daemon=True
+                        ).start()
+                if msg_type == sway_ipc.SUBSCRIBE:
+                    with self.lock:
+                        self.subscribers.append(conn)
+                    return
+        except (OSError, sway_ipc.SwayIPCError):
+            conn.close()
+
+    def emit(self, kind: str, payload: dict) -> None:
+        code = next(k for k, v in sway_ipc.EVENT_NAMES.items() if v == kind)
+        msg = sway_ipc.pack(code | sway_ipc.EVENT_FLAG, json.dumps(payload).encode())
+        with self.lock:
+            for s in list(self.subscribers):
+                try:
+                    s.sendall(msg)
+                except OSError:
+                    # Subscriber went away, e.g. a previous daemon run
+                    self.subscribers.remove(s)
+                    s.close()
+
+
+def _focus_target(cmd: str) -> Optional[int]:
+    # "[con_id=42] focus" -> 42
+    if cmd.startswith("[con_id=") and cmd.endswith("] focus"):
+        try:
+            return int(cmd[len("[con_id=") : -len("] focus")])
+        except ValueError:
+            return None
+    return None
+
+
+def percentile(values: List[float], q: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(len(s) * q))] if s else float("nan")
+
+
+def timeit(fn: Callable[[], object], n: int, pause: float = 0.0) -> List[float]:
+    # pause spaces out calls (untimed) so a consumer can keep up
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+        if pause:
+            time.sleep(pause)
+    return samples
+
+
+def report(label: str, samples: List[float], unit: str = "ms") -> None:
+    scale = {"ms": 1e3, "us": 1e6}[unit]
+    s = sorted(samples)
+    p50 = s[len(s) // 2] * scale
+    p99 = s[min(len(s) - 1, int(len(s) * 0.99))] * scale
+    print(f"  {label:<32} p50 {p50:8.3f} {unit}   p99 {p99:8.3f} {unit}   (n={len(s)})")
+
+
+def bench_ipc(args: argparse.Namespace) -> None:
+    print("ipc: get_tree + get_workspaces + command per keypress")
+    n = args.n
+    with FakeSway() as fake:
+        env = dict(os.environ, SWAYSOCK=fake.path)
+        with SwayIPC(fake.path) as ipc:
+
+            def in_process() -> None:
+                ipc.get_tree()
+                ipc.get_workspaces()
+                ipc.command("[con_id=3] focus")
+
+            report("in-process socket", timeit(in_process, n))
+
+        if shutil.which("swaymsg"):
+
+            def spawned() -> None:
+                for args in (["-t", "get_tree"], ["-t", "get_workspaces"], ["nop"]):
+                    subprocess.run(["swaymsg", *args], env=env, capture_output=True)
+
+            report("swaymsg subprocess x3", timeit(spawned, max(1, n // 10)))
+        else:
+            print("  swaymsg not found; skipping subprocess comparison")
+
+
+def bench_cycle(args: argparse.Namespace) -> None:
+    print("cycle: one $mod+Tab press, standalone script vs daemon")
+    n = args.n
+    import sway_mru_cycle
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(here, "sway_mru_cycle.py")
+    runtime = tempfile.mkdtemp(prefix="sway-mru-bench-")
+    spawns = max(1, n // 10)
+
+    def spawn() -> None:
+        subprocess.run([sys.executable, script, "next"])
+
+    saved = dict(os.environ)
+    try:
+        with FakeSway() as fake:
+            os.environ.update(SWAYSOCK=fake.path, XDG_RUNTIME_DIR=runtime)
+            for mode in sway_mru.CYCLE_MODES:
+                report(
+                    f"standalone (in-process), {mode}",
+                    timeit(lambda: sway_mru_cycle.cycle_standalone("next", mode), n),
+                )
+            report("standalone (spawned)", timeit(spawn, spawns))
+
+            daemon = subprocess.Popen(
+                [sys.executable, os.path.join(here, "sway_mru_daemon.py")]
+            )
+            try:
+                control = os.path.join(runtime, "sway_mru.sock")
+                deadline = time.monotonic() + 5
+                while not os.path.exists(control) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                report(
+                    "daemon client (in-process)",
+                    timeit(lambda: sway_mru_cycle.send_to_daemon("next"), n, 0.005),
+                )
+                report("daemon client (spawned)", timeit(spawn, spawns))
+            finally:
+                daemon.terminate()
+                daemon.wait()
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+        shutil.rmtree(runtime, ignore_errors=True)
+
+    # What a press costs inside the daemon: a filtered view over the one
+    # MRU list, no IPC
+    tree = make_tree(outputs=3, workspaces=10, windows=20)
+    model = sway_mru.WindowModel()
+    model.load(tree)
+    ids = list(model.windows)
+    mru = sway_mru.MRUList(ids[::7] + ids, capacity=len(ids))
+    for mode in sway_mru.CYCLE_MODES:
+
+        def press(mode: str = mode) -> None:
+            focused = model.focused_id
+            mru.cycle(model.candidates(mode, focused), focused, "next")
+
+        size = len(model.candidates(mode, model.focused_id))
+        report(
+            f"daemon, {mode} ({size}/{len(ids)})",
+            timeit(press, n * 10),
+            "us",
+        )
+
+
+def bench_mru(args: argparse.Namespace) -> None:
+    print("mru: list.remove/insert(0)/slice vs MRUList, per operation")
+    n = args.n
+    import random
+
+    rng = random.Random(0)
+    for size in (10, 512, 10_000):
+        ids = list(range(size))
+        picks = [rng.randrange(size) for _ in range(n)]
+        members = rng.sample(ids, min(8, size))
+        mru_list = list(ids)
+        mru = sway_mru.MRUList(ids, capacity=size)
+
+        def list_touch() -> None:
+            nonlocal mru_list
+            for wid in picks:
+                mru_list.remove(wid)
+                mru_list.insert(0, wid)
+                mru_list = mru_list[:size]
+
+        def list_cycle() -> None:
+            ordered = [w for w in mru_list if w in members]
+            ordered.index(members[0])
+
+        def mru_touch() -> None:
+            for wid in picks:
+                mru.touch(wid)
+
+        def per_op(samples: List[float]) -> List[float]:
+            return [t / len(picks) for t in samples]
+
+        print(f" {size} entries")
+        report("list touch", per_op(timeit(list_touch, 10)), "us")
+        report("MRUList touch", per_op(timeit(mru_touch, 10)), "us")
+        report("list cycle", timeit(list_cycle, n), "us")
+        report(
+            "MRUList cycle",
+            timeit(lambda: mru.cycle(members, members[0], "next"), n),
+            "us",
+        )
+
+
+def legacy_scan(tree: dict, workspaces: List[dict]) -> Tuple[Optional[int], list]:
+    # What sway_mru_cycle.py did before: three full flattenings of the tree
+    def flatten_nodes(node: dict) -> List[dict]:
+        res = []
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            res.append(n)
+            for key in ("nodes", "floating_nodes"):
+                for c in n.get(key) or []:
+                    stack.append(c)
+        return res
+
+    name = next((ws["name"] for ws in workspaces if ws.get("focused")), None)
+    workspace = next(
+        (
+            n
+            for n in flatten_nodes(tree)
+            if n.get("type") == "workspace" and n.get("name") == name
+        ),
+        None,
+    )
+    windows = [n for n in flatten_nodes(workspace) if sway_mru.is_window(n)]
+    focused = next((n for n in flatten_nodes(tree) if n.get("focused")), None)
+    return focused.get("id") if focused else None, windows
+
+
+def bench_tree(args: argparse.Namespace) -> None:
+    import tracemalloc
+
+    print("tree: focused workspace, its windows and focus from one get_tree")
+    for outputs, workspaces, windows in ((2, 5, 8), (4, 10, 10), (8, 10, 25)):
+        tree = make_tree(outputs, workspaces, windows)
+        ws_list = workspaces_of(tree)
+        # Focus the last window of the last workspace, which the old scan
+        # reached last
+        for n in sway_mru.walk(tree):
+            n["focused"] = False
+        last_out = tree["nodes"][-1]
+        last_ws = last_out["nodes"][-1]
+        last_ws["nodes"][-1]["focused"] = True
+        tree["focus"] = [last_out["id"]] + tree["focus"][:-1]
+        last_out["focus"] = [last_ws["id"]] + last_out["focus"][:-1]
+        last_ws["focus"] = [last_ws["nodes"][-1]["id"]] + last_ws["focus"][:-1]
+        for ws in ws_list:
+            ws["focused"] = ws["id"] == last_ws["id"]
+
+        model = sway_mru.WindowModel()
+        cases: List[Tuple[str, Callable[[], object]]] = [
+            ("3x flatten (previous)", lambda: legacy_scan(tree, ws_list)),
+            ("full walk", lambda: model.load(tree)),
+        ]
+        for mode in ("workspace", "output"):
+            cases.append((f"focus path, {mode}", lambda m=mode: model.load(tree, m)))
+
+        model.load(tree, "workspace")
+        focused_id, expected = legacy_scan(tree, ws_list)
+        assert model.focused_id == focused_id
+        assert model.windows_on(model.focused_ws) == [w["id"] for w in expected]
+
+        total = outputs * workspaces * windows
+        print(f"  {outputs} outputs x {workspaces} workspaces x {windows} = {total}")
+        for label, fn in cases:
+            tracemalloc.start()
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report(f"{label:<22}{peak // 1024:>5} KiB", timeit(fn, args.n), "us")
+
+
+def fatten(tree: dict) -> dict:
+    # Adds the per-node fields a real get_tree reply carries, so sizes and
+    # decode costs resemble a busy session's
+    for n in sway_mru.walk(tree):
+        rect = {"x": 0, "y": 0, "width": 1920, "height": 1080}
+        n.update(
+            rect=rect,
+            window_rect=dict(rect),
+            deco_rect=dict(rect),
+            geometry=dict(rect),
+            border="normal",
+            current_border_width=2,
+            layout="splith",
+            orientation="horizontal",
+            percent=0.5,
+            urgent=False,
+            marks=[],
+            fullscreen_mode=0,
+            sticky=False,
+            inhibit_idle=False,
+            idle_inhibitors={"user": "none", "application": "none"},
+            pid=4242,
+            visible=True,
+            max_render_time=0,
+            shell="xwayland",
+        )
+        if n.get("type") == "con":
+            n["name"] = f"{n['name']} - " + "a long document title " * 4
+            n["window_properties"] = {
+                "class": n.get("app_id"),
+                "instance": n.get("app_id"),
+                "title": n["name"],
+                "transient_for": None,
+                "window_role": "browser",
+                "window_type": "normal",
+            }
+    return tree
+
+
+# Runs in a fresh interpreter per case. VmHWM rather than ru_maxrss: the
+# latter carries over the (larger) parent's peak through fork and exec.
+RSS_PROBE = """
+import sys
+import sway_ipc, sway_mru
+
+def peak_kib():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+
+mode, path = sys.argv[1:]
+if mode != "orjson":
+    sway_ipc.orjson = None
+with open(path, "rb") as f:
+    body = f.read()
+before = peak_kib()
+keep = sway_mru.TREE_FIELDS if mode == "projected" else None
+tree = sway_ipc.decode(body, keep, keep_min=0)
+print(peak_kib() - before)
+"""
+
+
+def bench_decode(args: argparse.Namespace) -> None:
+    print("decode: get_tree reply to dicts, parse time and peak RSS growth")
+    here = os.path.dirname(os.path.abspath(__file__))
+    trees = []
+    if args.tree:
+        with open(args.tree, "rb") as f:
+            trees.append((os.path.basename(args.tree), f.read()))
+    for outputs, workspaces, windows in ((2, 5, 8), (4, 10, 10), (8, 10, 25)):
+        tree = fatten(make_tree(outputs, workspaces, windows))
+        label = f"synthetic, {outputs * workspaces * windows} windows"
+        trees.append((label, json.dumps(tree).encode()))
+
+    orjson = sway_ipc.orjson
+    cases = ["json", "projected"] + (["orjson"] if orjson is not None else [])
+    tmp = tempfile.mkdtemp(prefix="sway-mru-bench-")
+    try:
+        for label, body in trees:
+            print(f"  {label}: {len(body) // 1024} KiB")
+            path = os.path.join(tmp, "tree.json")
+            with open(path, "wb") as f:
+                f.write(body)
+            for case in cases:
+                sway_ipc.orjson = orjson if case == "orjson" else None
+                keep = sway_mru.TREE_FIELDS if case == "projected" else None
+                samples = timeit(
+                    lambda: sway_ipc.decode(body, keep, keep_min=0), args.n
+                )
+                rss = subprocess.run(
+                    [sys.executable, "-c", RSS_PROBE, case, path],
+                    cwd=here,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout.strip()
+                report(f"{case:<10} RSS +{int(rss):>6} KiB", samples)
+    finally:
+        sway_ipc.orjson = orjson
+        shutil.rmtree(tmp, ignore_errors=True)
+    if orjson is None:
+        print("  orjson: skipped, not installed")
+
+
+def bench_storm(args: argparse.Namespace) -> None:
+    print("storm: state file writes under a 1 kHz focus storm (2 s)")
+    from sway_mru_daemon import MRUDaemon
+
+    tree = make_tree()
+    windows = [c for c in sway_mru.walk(tree) if sway_mru.is_window(c)]
+    runtime = tempfile.mkdtemp(prefix="sway-mru-bench-")
+    try:
+        for delay in (0.0, 0.1, 1.0):
+            control, peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            path = os.path.join(runtime, f"state-{delay}.bin")
+            daemon = MRUDaemon(path, control, flush_delay=delay)
+            daemon.model.load(tree)
+            start = time.monotonic()
+            sent = 0
+            while (now := time.monotonic()) - start < 2.0:
+                # Catch up to 1 event per millisecond, like the daemon loop
+                while sent < (now - start) * 1000:
+                    con = windows[sent % len(windows)]
+                    daemon.on_window({"change": "focus", "container": con})
+                    sent += 1
+                daemon.store.flush_if_due(daemon.mru)
+                time.sleep(0.0005)
+            daemon.flush()
+            control.close()
+            peer.close()
+            elapsed = time.monotonic() - start
+            writes = daemon.store.writes
+            print(
+                f"  flush delay {delay:4.1f} s   {sent / elapsed:7.0f} events/s"
+                f"   {writes / elapsed:7.1f} writes/s   ({writes} writes)"
+            )
+    finally:
+        shutil.rmtree(runtime, ignore_errors=True)
+
+
+async def start_daemon(
+    state_path: str, connect: bool = True
+) -> Tuple[Any, socket.socket, socket.socket, Optional[asyncio.Task]]:
+    # A real MRUDaemon core on the running loop, connected to $SWAYSOCK
+    # unless connect is False; send control messages through peer
+    from sway_mru_daemon import MRUDaemon
+
+    control, peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    # Like bind_control()'s socket: on_control reads until it would block
+    control.setblocking(False)
+    daemon = MRUDaemon(state_path, control)
+    daemon.loop = asyncio.get_running_loop()
+    daemon.loop.add_reader(control.fileno(), daemon.on_control)
+    task = None
+    if connect:
+        task = asyncio.create_task(daemon.connect_forever())
+        while daemon.queue is None:
+            await asyncio.sleep(0.01)
+    return daemon, control, peer, task
+
+
+async def replay(
+    fake: FakeSway,
+    trace: List[Tuple[str, dict]],
+    rate: float,
+    state_path: str,
+    passes: int = 1,
+    cycle_every: float = 0.0,
+) -> dict:
+    # Plays trace through a real MRUDaemon core at rate events/s, passes
+    # times over. With cycle_every, a next/commit pair is sent that often
+    # and timed until the focus command reaches the fake server.
+    daemon, control, peer, task = await start_daemon(state_path)
+
+    events = sum(1 for kind, _ in trace if not kind.startswith("get_")) * passes
+    done = threading.Event()
+    rss: List[int] = []
+
+    def emit_all() -> float:
+        start = time.perf_counter()
+        i = 0
+        for _ in range(passes):
+            for kind, payload in trace:
+                if not kind.startswith("get_"):
+                    i += 1
+                    while time.perf_counter() - start < i / rate:
+                        pass
+                fake.play(kind, payload)
+            # Memory after each pass; the first one is the warm-up
+            rss.append(vm_kib())
+        fake.emit("shutdown", {"change": "exit"})
+        done.set()
+        return time.perf_counter() - start
+
+    def cycle_all() -> List[float]:
+        latencies = []
+        while not done.wait(cycle_every):
+            sent = len(fake.command_times)
+            t0 = time.perf_counter()
+            peer.send(b"next workspace")
+            deadline = t0 + 0.5
+            while len(fake.command_times) == sent and time.perf_counter() < deadline:
+                time.sleep(0.0001)
+            if len(fake.command_times) > sent:
+                latencies.append(fake.command_times[sent] - t0)
+            peer.send(b"commit")
+        return latencies
+
+    cpu = time.thread_time()
+    jobs = [daemon.loop.run_in_executor(None, emit_all)]
+    if cycle_every:
+        jobs.append(daemon.loop.run_in_executor(None, cycle_all))
+    results = await asyncio.gather(*jobs)
+    await task
+    cpu = time.thread_time() - cpu
+    daemon.loop.remove_reader(control.fileno())
+    daemon.flush()
+    control.close()
+    peer.close()
+    elapsed = results[0]
+    lag = list(daemon.lag)
+    return {
+        "events": events,
+        "rate": events / elapsed,
+        "cpu_us": cpu / events * 1e6,
+        "p50": percentile(lag, 0.5) * 1e3,
+        "p99": percentile(lag, 0.99) * 1e3,
+        "max": max(lag) * 1e3,
+        "cycles": results[1] if cycle_every else [],
+        "writes": daemon.store.writes,
+        "rss": rss,
+        "mru": len(daemon.mru),
+        "coalesced": daemon.queue.coalesced,
+        "dropped": daemon.queue.dropped,
+        "resyncs": daemon.resyncs,
+    }
+
+
+def bench_replay(args: argparse.Namespace) -> bool:
+    print("replay: event trace through the daemon core at increasing rates")
+    bound_ms = 50.0
+    failed = False
+    runtime = tempfile.mkdtemp(prefix="sway-mru-bench-")
+    saved = dict(os.environ)
+    try:
+        with FakeSway() as fake:
+            os.environ["SWAYSOCK"] = fake.path
+            trace = (
+                load_trace(args.trace)
+                if args.trace
+                else make_trace(fake.tree, max(args.n, 2000))
+            )
+            for rate in (1_000, 10_000, 100_000):
+                state = os.path.join(runtime, f"state-{rate}.bin")
+                r = asyncio.run(replay(fake, trace, rate, state))
+                ok = r["p99"] <= bound_ms
+                failed |= not ok
+                print(
+                    f"  target {rate:>7}/s  got {r['rate']:8.0f}/s"
+                    f"  cpu {r['cpu_us']:6.1f} us/event"
+                    f"  lag p50 {r['p50']:6.3f} p99 {r['p99']:6.3f}"
+                    f" max {r['max']:6.3f} ms  coalesced {r['coalesced']}"
+                    f"  dropped {r['dropped']}  resyncs {r['resyncs']}"
+                    f"  {'ok' if ok else 'FAIL'}"
+                )
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+        shutil.rmtree(runtime, ignore_errors=True)
+    return failed
+
+
+async def wait_until(cond: Callable[[], bool], timeout: float = 1.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+async def check_sessions(runtime: str) -> List[Tuple[str, bool]]:
+    # Cycle sessions as the keybindings drive them: each press puts sway in
+    # the "mru" mode before the daemon hears of it, and whatever happens
+    # next has to leave sway back in the default mode
+    import sway_mru_daemon
+
+    timeout = sway_mru_daemon.SESSION_TIMEOUT
+    sway_mru_daemon.SESSION_TIMEOUT = 0.2
+    results = []
+    try:
+        with FakeSway() as fake:
+            os.environ["SWAYSOCK"] = fake.path
+            state = os.path.join(runtime, "session-state.bin")
+            daemon, control, peer, task = await start_daemon(state)
+
+            def press(message: bytes) -> None:
+                fake.mode = sway_mru_daemon.CYCLE_MODE
+                peer.send(message)
+
+            def focus(con_id: int) -> None:
+                fake.emit("window", {"change": "focus", "container": fake.cons[con_id]})
+
+            def front(n: int) -> List[int]:
+                return list(daemon.mru)[:n]
+
+            a, b, c = daemon.model.candidates("workspace", daemon.model.focused_id)[:3]
+            for wid in (c, b, a):
+                focus(wid)
+            await wait_until(lambda: front(3) == [a, b, c])
+
+            # Two presses a timeout apart toggle between two windows ("next"
+            # steps to the previously used one, as $mod+Shift+Tab does)
+            press(b"next workspace")
+            first = await wait_until(lambda: daemon.session == b)
+            first = first and await wait_until(lambda: fake.mode == "default")
+            press(b"next workspace")
+            second = await wait_until(lambda: daemon.session == a)
+            second = second and await wait_until(lambda: fake.mode == "default")
+            results.append(
+                ("toggle and time out", first and second and front(2) == [a, b])
+            )
+
+            # Focus moving elsewhere ends the session at once
+            press(b"next workspace")
+            await wait_until(lambda: daemon.session == b)
+            focus(c)
+            ok = await wait_until(lambda: daemon.session is None, timeout=0.15)
+            ok = ok and fake.mode == "default" and front(3) == [c, b, a]
+            results.append(("focus elsewhere mid-session", ok))
+
+            # The exit binding leaves the mode itself and sends commit
+            press(b"next workspace")
+            await wait_until(lambda: daemon.session == b)
+            fake.mode = "default"
+            peer.send(b"commit")
+            ok = await wait_until(lambda: daemon.session is None, timeout=0.15)
+            results.append(("commit binding", ok and front(2) == [b, c]))
+
+            # Nothing to step to: the mode is left without waiting
+            press(b"prev bogus")
+            ok = await wait_until(lambda: fake.mode == "default", timeout=0.15)
+            results.append(("unknown mode", ok))
+
+            fake.emit("shutdown", {"change": "exit"})
+            await task
+            daemon.loop.remove_reader(control.fileno())
+            control.close()
+            peer.close()
+
+        with FakeSway(make_tree(1, 2, 0)) as fake:
+            os.environ["SWAYSOCK"] = fake.path
+            state = os.path.join(runtime, "empty-state.bin")
+            daemon, control, peer, task = await start_daemon(state)
+            fake.mode = sway_mru_daemon.CYCLE_MODE
+            peer.send(b"next workspace")
+            ok = await wait_until(lambda: fake.mode == "default", timeout=0.15)
+            results.append(("empty workspace", ok and daemon.session is None))
+            fake.emit("shutdown", {"change": "exit"})
+            await task
+            daemon.loop.remove_reader(control.fileno())
+            control.close()
+            peer.close()
+
+            # Not connected to sway (yet): left over a one-off connection
+            daemon, control, peer, _ = await start_daemon(state, connect=False)
+            fake.mode = sway_mru_daemon.CYCLE_MODE
+            peer.send(b"next workspace")
+            ok = await wait_until(lambda: fake.mode == "default", timeout=0.15)
+            results.append(("daemon not connected", ok))
+            daemon.loop.remove_reader(control.fileno())
+            control.close()
+            peer.close()
+    finally:
+        sway_mru_daemon.SESSION_TIMEOUT = timeout
+    return results
+
+
+def bench_session(args: argparse.Namespace) -> bool:
+    print("session: long replay with $mod+Tab presses, checked against bounds")
+    passes = 10
+    rate = 5_000
+    # Bounds generous enough for a loaded CI runner; a regression such as
+    # a write per event or a leak per event still trips them
+    bounds = {
+        "event cpu": (200.0, "us"),
+        "cycle p99": (50.0, "ms"),
+        "lag p99": (50.0, "ms"),
+        "writes/event": (0.01, ""),
+        "rss growth": (2048, "KiB"),
+    }
+    runtime = tempfile.mkdtemp(prefix="sway-mru-bench-")
+    saved = dict(os.environ)
+    try:
+        with FakeSway() as fake:
+            os.environ["SWAYSOCK"] = fake.path
+            if args.trace:
+                trace = load_trace(args.trace)
+                # A recorded trace starts with the state it was taken from
+                for kind, payload in trace:
+                    if kind.startswith("get_"):
+                        fake.play(kind, payload)
+            else:
+                trace = make_trace(fake.tree, max(args.n, 2000))
+            state = os.path.join(runtime, "state.bin")
+            r = asyncio.run(replay(fake, trace, rate, state, passes, 0.02))
+        checks = asyncio.run(check_sessions(runtime))
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+        shutil.rmtree(runtime, ignore_errors=True)
+
+    cycles = [c * 1e3 for c in r["cycles"]]
+    measured = {
+        "event cpu": r["cpu_us"],
+        "cycle p99": percentile(cycles, 0.99),
+        "lag p99": r["p99"],
+        "writes/event": r["writes"] / r["events"],
+        # After the first pass everything that should stay has been built
+        "rss growth": r["rss"][-1] - r["rss"][0],
+    }
+    print(
+        f"  {r['events']} events in {passes} passes at {r['rate']:.0f}/s,"
+        f" {len(cycles)} cycles, {r['writes']} state writes,"
+        f" {r['mru']} MRU entries, {r['resyncs']} resyncs"
+    )
+    print(
+        f"  cycle latency p50 {percentile(cycles, 0.5):.3f} ms"
+        f"  p90 {percentile(cycles, 0.9):.3f} ms"
+        f"  max {max(cycles, default=float('nan')):.3f} ms"
+    )
+    print(f"  rss by pass (KiB): {' '.join(str(k) for k in r['rss'])}")
+    failed = False
+    for name, value in measured.items():
+        bound, unit = bounds[name]
+        ok = value <= bound
+        failed |= not ok
+        print(
+            f"  {name:<14} {value:10.3f} {unit:<3}  bound {bound:g} {unit:<3}"
+            f"  {'ok' if ok else 'FAIL'}"
+        )
+    for name, ok in checks:
+        failed |= not ok
+        print(f"  {name:<28} {'ok' if ok else 'FAIL'}")
+    return failed
+
+
+BENCHES = {
+    "ipc": bench_ipc,
+    "cycle": bench_cycle,
+    "mru": bench_mru,
+    "tree": bench_tree,
+    "decode": bench_decode,
+    "storm": bench_storm,
+    "replay": bench_replay,
+    "session": bench_session,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the sway MRU scripts")
+    parser.add_argument("bench", nargs="*", help=f"any of: {', '.join(BENCHES)}")
+    parser.add_argument("-n", type=int, default=200, help="iterations")
+    parser.add_argument("--trace", help="recorded events for replay (JSON lines)")
+    parser.add_argument("--tree", help="recorded get_tree reply for decode")
+    parser.add_argument(
+        "--record", metavar="TRACE", help="record a trace from the running sway"
+    )
+    args = parser.parse_args()
+    if args.record:
+        return record(args.record)
+    unknown = set(args.bench) - set(BENCHES)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+    failed = False
+    for name in args.bench or BENCHES:
+        # Benchmarks that check bounds return True when one is exceeded
+        failed |= bool(BENCHES[name](args))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
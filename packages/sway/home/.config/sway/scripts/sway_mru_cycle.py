@@ -1,159 +1,82 @@
 #!/usr/bin/env python3
 
-import json
 import os
-import subprocess
+import socket
 import sys
-import tempfile
-from typing import List, Optional, Tuple
 
 
-def get_state_path() -> str:
+def control_path() -> str:
+    # Mirrors sway_mru.get_control_path; duplicated so the fast path below
+    # needs nothing beyond the socket module. tempfile costs ~10 ms to
+    # import, so only the fallback pays for it.
     runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
     if runtime_dir and os.path.isdir(runtime_dir):
-        return os.path.join(runtime_dir, "sway_mru.json")
-    return os.path.join(tempfile.gettempdir(), f"sway_mru_{os.getuid()}.json")
+        return os.path.join(runtime_dir, "sway_mru.sock")
+    import tempfile
 
-
-def get_pause_path() -> str:
-    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
-    if runtime_dir and os.path.isdir(runtime_dir):
-        return os.path.join(runtime_dir, "sway_mru_pause")
-    return os.path.join(tempfile.gettempdir(), f"sway_mru_pause_{os.getuid()}")
-
-
-def swaymsg_get_tree() -> dict:
-    proc = subprocess.run(
-        ["swaymsg", "-t", "get_tree"], capture_output=True, text=True, check=True
-    )
-    return json.loads(proc.stdout)
+    return os.path.join(tempfile.gettempdir(), f"sway_mru_{os.getuid()}.sock")
 
 
-def swaymsg_get_workspaces() -> List[dict]:
-    proc = subprocess.run(
-        ["swaymsg", "-t", "get_workspaces"], capture_output=True, text=True, check=True
-    )
-    return json.loads(proc.stdout)
-
+def send_to_daemon(cmd: str) -> bool:
+    # One datagram to the daemon, which answers from its in-memory state
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(cmd.encode(), control_path())
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
 
-def run_swaymsg(cmd: str) -> None:
-    subprocess.run(
-        ["swaymsg", cmd], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-    )
 
+def cycle_standalone(direction: str, mode: str) -> int:
+    # Fallback when the daemon isn't running: query sway directly
+    from sway_ipc import SwayIPC, SwayIPCError
+    import sway_mru
 
-def load_mru(path: str) -> List[int]:
+    mru = sway_mru.MRUList(sway_mru.load_mru(sway_mru.get_state_path()))
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, list):
-            return [int(x) for x in data]
-    except Exception:
-        pass
-    return []
-
-
-def flatten_nodes(node: dict) -> List[dict]:
-    res = []
-    stack = [node]
-    while stack:
-        n = stack.pop()
-        res.append(n)
-        for key in ("nodes", "floating_nodes"):
-            children = n.get(key) or []
-            for c in children:
-                stack.append(c)
-    return res
-
-
-def find_workspace_and_windows(
-    tree: dict, workspace_name: Optional[str]
-) -> Tuple[Optional[int], List[dict]]:
-    if not workspace_name:
-        return None, []
-    nodes = flatten_nodes(tree)
-    workspace = next(
-        (
-            n
-            for n in nodes
-            if n.get("type") == "workspace" and n.get("name") == workspace_name
-        ),
-        None,
-    )
-    if workspace is None:
-        return None, []
-    ws_nodes = flatten_nodes(workspace)
-    windows = [
-        n
-        for n in ws_nodes
-        if n.get("type") == "con"
-        and isinstance(n.get("id"), int)
-        and (n.get("app_id") is not None or n.get("window") is not None)
-    ]
-    return workspace.get("id"), windows
-
-
-def current_focused_id(tree: dict) -> Optional[int]:
-    nodes = flatten_nodes(tree)
-    focused = next((n for n in nodes if n.get("focused")), None)
-    return focused.get("id") if focused else None
-
-
-def main() -> int:
-    direction = sys.argv[1] if len(sys.argv) > 1 else "next"
-    if direction not in ("next", "prev"):
-        print("Usage: sway_mru_cycle.py [next|prev]", file=sys.stderr)
+        ipc = SwayIPC()
+    except SwayIPCError as e:
+        print(f"sway_mru_cycle.py: {e}", file=sys.stderr)
         return 1
 
-    state_path = get_state_path()
-    mru = load_mru(state_path)
+    with ipc:
+        # One get_tree covers every mode; only the part it needs is walked.
+        # Decoded in full: the process exits right after, so its peak RSS
+        # doesn't matter and the projection would only slow the keypress.
+        model = sway_mru.WindowModel()
+        model.load(ipc.get_tree(), mode)
+        window_ids = model.candidates(mode, model.focused_id)
+        target = mru.cycle(window_ids, model.focused_id, direction)
+        if target is not None:
+            ipc.command(f"[con_id={target}] focus")
+        # No session to keep open without the daemon
+        ipc.command('mode "default"')
+    return 0
 
-    tree = swaymsg_get_tree()
-    workspaces = swaymsg_get_workspaces()
-    focused_ws_name = None
-    for ws in workspaces:
-        if ws.get("focused"):
-            focused_ws_name = ws.get("name")
-            break
 
-    ws_id, windows = find_workspace_and_windows(tree, focused_ws_name)
-    if ws_id is None or not windows:
-        return 0
+# Kept in step with sway_mru.CYCLE_MODES, which the fast path doesn't import
+MODES = ("workspace", "output", "global", "app")
 
-    # Build list of window ids in MRU order filtered to current workspace
-    ws_window_ids = {w["id"] for w in windows if isinstance(w.get("id"), int)}
-    ordered = [wid for wid in mru if wid in ws_window_ids]
 
-    # Add any windows not yet tracked to the end to ensure they are reachable
-    tracked = set(ordered)
-    for w in windows:
-        wid = w["id"]
-        if wid not in tracked:
-            ordered.append(wid)
+def main() -> int:
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "next"
+    mode = sys.argv[2] if len(sys.argv) > 2 else "workspace"
+    if cmd not in ("next", "prev", "commit") or mode not in MODES:
+        print(
+            "Usage: sway_mru_cycle.py [next|prev|commit] [workspace|output|global|app]",
+            file=sys.stderr,
+        )
+        return 1
 
-    if not ordered:
+    # next/prev open or continue a cycle session in the daemon; commit (sent
+    # by the exit bindings of the "mru" mode) ends it and reorders the MRU
+    # once
+    message = cmd if cmd == "commit" else f"{cmd} {mode}"
+    if send_to_daemon(message) or cmd == "commit":
         return 0
-
-    focused_id = current_focused_id(tree)
-    if focused_id not in ordered:
-        # Focused may be a container parent; fallback to first
-        target_idx = 0
-    else:
-        idx = ordered.index(focused_id)
-        if direction == "next":
-            target_idx = (idx + 1) % len(ordered)
-        else:
-            target_idx = (idx - 1) % len(ordered)
-
-    target = ordered[target_idx]
-    # Touch pause file to signal daemon to ignore transient focus changes while cycling
-    try:
-        with open(get_pause_path(), "w", encoding="utf-8") as f:
-            f.write("pause")
-    except Exception:
-        pass
-    run_swaymsg(f"[con_id={target}] focus")
-    return 0
+    return cycle_standalone(cmd, mode)
 
 
 if __name__ == "__main__":
@@ -1,136 +1,368 @@
 #!/usr/bin/env python3
 
-import json
+import argparse
+import asyncio
 import os
-import subprocess
+import signal
+import socket
 import sys
-import tempfile
 import time
+from collections import deque
+from typing import Optional, Tuple
 
+import sway_ipc
+import sway_mru
+from sway_ipc import SwayIPC, SwayIPCError
 
-def get_state_path() -> str:
-    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
-    if runtime_dir and os.path.isdir(runtime_dir):
-        return os.path.join(runtime_dir, "sway_mru.json")
-    return os.path.join(tempfile.gettempdir(), f"sway_mru_{os.getuid()}.json")
+# Window/workspace changes keep the model current; shutdown exits cleanly
+EVENTS = ["window", "workspace", "shutdown"]
 
+# Binding mode $mod+Tab enters (see keybindings); its $mod+Escape binding
+# sends "commit". sway runs a --release binding on a bare modifier only when
+# nothing else was pressed with it, so releasing $mod can't end a session.
+CYCLE_MODE = "mru"
+# Seconds without a step after which a session commits by itself and the
+# mode is left, for when the exit binding isn't pressed
+SESSION_TIMEOUT = 1.5
 
-def get_pause_path() -> str:
-    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
-    if runtime_dir and os.path.isdir(runtime_dir):
-        return os.path.join(runtime_dir, "sway_mru_pause")
-    return os.path.join(tempfile.gettempdir(), f"sway_mru_pause_{os.getuid()}")
 
+def bind_control(path: str) -> Optional[socket.socket]:
+    # Returns None if another daemon already owns the socket
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        probe.sendto(b"ping", path)
+        return None
+    except OSError:
+        pass
+    finally:
+        probe.close()
 
-def is_paused(max_age_sec: float = 2.0) -> bool:
-    path = get_pause_path()
     try:
-        st = os.stat(path)
-        return (time.time() - st.st_mtime) <= max_age_sec
+        os.unlink(path)
     except FileNotFoundError:
-        return False
-    except Exception:
-        return False
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    os.chmod(path, 0o600)
+    sock.setblocking(False)
+    return sock
 
 
-def load_mru(path: str) -> list[int]:
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, list):
-            return [int(x) for x in data]
-    except Exception:
-        pass
-    return []
-
-
-def save_mru(path: str, mru: list[int]) -> None:
-    tmp_path = f"{path}.tmp"
-    with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(mru, f)
-    os.replace(tmp_path, path)
-
-
-def subscribe_events() -> subprocess.Popen:
-    # Subscribe to window focus changes and shutdown to exit cleanly
-    return subprocess.Popen(
-        [
-            "swaymsg",
-            "-m",
-            "-t",
-            "subscribe",
-            '["window","shutdown"]',
-        ],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        text=True,
-        bufsize=1,
-        universal_newlines=True,
-    )
+def is_focus(kind: str, event: Optional[dict]) -> bool:
+    return kind == "window" and event is not None and event.get("change") == "focus"
 
 
-def main() -> int:
-    state_path = get_state_path()
-    mru: list[int] = load_mru(state_path)
-
-    backoff = 0.5
-    while True:
-        proc = subscribe_events()
-        if proc.stdout is None:
-            time.sleep(backoff)
-            backoff = min(backoff * 2, 5.0)
-            continue
+class EventQueue:
+    """Bounded FIFO between the sway reader and the event handlers.
+
+    Once the backlog passes ``maxsize // 8``, a focus event replaces a focus
+    event queued right before it: under load only the last window of a
+    burst matters. If the queue fills up anyway, everything queued is
+    dropped and the consumer is told to resync from get_tree instead.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.coalesce_at = max(1, maxsize // 8)
+        self.items: deque[Tuple[str, Optional[dict], float]] = deque()
+        self.ready = asyncio.Event()
+        self.coalesced = 0
+        self.dropped = 0
+
+    def put(self, kind: str, event: Optional[dict], stamp: float) -> None:
+        if is_focus(kind, event) and len(self.items) >= self.coalesce_at:
+            last_kind, last_event, last_stamp = self.items[-1]
+            if is_focus(last_kind, last_event):
+                # Keep the older stamp so measured lag stays honest
+                self.items[-1] = (kind, event, last_stamp)
+                self.coalesced += 1
+                return
+        if len(self.items) >= self.maxsize:
+            self.dropped += len(self.items)
+            self.items.clear()
+            self.items.append(("resync", None, stamp))
+        self.items.append((kind, event, stamp))
+        self.ready.set()
+
+    async def get(self) -> Tuple[str, Optional[dict], float]:
+        while not self.items:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.items.popleft()
+
+
+class MRUDaemon:
+    def __init__(
+        self,
+        state_path: str,
+        control: socket.socket,
+        flush_delay: float = 1.0,
+        queue_size: int = 256,
+    ):
+        self.control = control
+        self.queue_size = queue_size
+        self.store = sway_mru.WriteBehind(state_path, flush_delay)
+        self.mru = sway_mru.MRUList(sway_mru.load_mru(state_path))
+        self.model = sway_mru.WindowModel()
+        # Request/response connection, set while connected to sway
+        self.ipc: Optional[SwayIPC] = None
+        # Window focused by the cycle session in progress, None when idle.
+        # The MRU stays frozen during a session and is reordered on commit.
+        self.session: Optional[int] = None
+        self.session_handle: Optional[asyncio.TimerHandle] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.queue: Optional[EventQueue] = None
+        # Seconds from reading an event to finishing its handling
+        self.lag: deque[float] = deque(maxlen=4096)
+        self.resyncs = 0
+
+    def resync(self) -> None:
+        if self.ipc is None:
+            return
+        self.resyncs += 1
+        # The daemon keeps whatever peak it reaches, so very large trees
+        # are projected (see sway_ipc.decode)
+        self.model.load(self.ipc.get_tree(sway_mru.TREE_FIELDS))
+        # Drop ids of windows that closed while we weren't looking
+        stale = [wid for wid in self.mru if wid not in self.model.windows]
+        for wid in stale:
+            self.mru.discard(wid)
+        if stale:
+            self.save()
+
+    def save(self) -> None:
+        self.store.mark()
+        if self.loop is not None and self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(
+                self.store.timeout() or 0.0, self._flush_due
+            )
+
+    def _flush_due(self) -> None:
+        self.flush_handle = None
+        self.store.flush_if_due(self.mru)
+        if self.store.dirty_since is not None:
+            self.save()
+
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.store.flush(self.mru)
+
+    def on_window(self, event: dict) -> None:
+        if not self.model.on_window(event):
+            self.resync()
+        change = event.get("change")
+        if change == "close":
+            con_id = (event.get("container") or {}).get("id")
+            if self.mru.discard(con_id):
+                self.save()
+            return
+        # Only focus events reorder the MRU
+        if change != "focus":
+            return
+        container = event.get("container") or {}
+        if self.session is not None:
+            # Our own focus command; anything else ends the session, and the
+            # window it landed on goes in front before the new one does
+            if container.get("id") == self.session:
+                return
+            self.commit(leave_mode=True)
+        # Track only real windows with an id and either app_id or window
+        if not sway_mru.is_window(container):
+            return
+        con_id = container["id"]
+
+        # Move to front; the list evicts its oldest entry past capacity
+        self.mru.touch(con_id)
+        self.save()
+
+    def on_control(self) -> None:
+        while True:
+            try:
+                data = self.control.recv(64)
+            except BlockingIOError:
+                return
+            # "next" / "prev", optionally followed by a mode; or "commit"
+            cmd, _, mode = data.decode(errors="replace").strip().partition(" ")
+            if cmd in ("next", "prev"):
+                self.cycle(cmd, mode or "workspace")
+            elif cmd == "commit":
+                self.commit()
 
+    def cycle(self, direction: str, mode: str = "workspace") -> None:
+        target = None
+        if self.ipc is not None and mode in sway_mru.CYCLE_MODES:
+            # Step from the session's window even if its focus event is
+            # pending
+            focused = self.model.focused_id if self.session is None else self.session
+            window_ids = self.model.candidates(mode, focused)
+            target = self.mru.cycle(window_ids, focused, direction)
+        if target is None:
+            # The binding entered the mode all the same. A session in
+            # progress still times out; without one nothing else would
+            # leave it.
+            if self.session is None:
+                self.leave_mode()
+            return
+        self.session = target
+        self.ipc.command(f"[con_id={target}] focus")
+        if self.loop is not None:
+            if self.session_handle is not None:
+                self.session_handle.cancel()
+            self.session_handle = self.loop.call_later(
+                SESSION_TIMEOUT, self.commit, True
+            )
+
+    def commit(self, leave_mode: bool = False) -> None:
+        # Session over: the window it landed on becomes MRU. leave_mode when
+        # it ended some other way than the mode's exit binding.
+        if self.session is None:
+            return
+        if self.session_handle is not None:
+            self.session_handle.cancel()
+            self.session_handle = None
+        if self.session in self.model.windows:
+            self.mru.touch(self.session)
+            self.save()
+        self.session = None
+        if leave_mode:
+            self.leave_mode()
+
+    def leave_mode(self) -> None:
+        # Back to the default mode if sway is still in CYCLE_MODE, over a
+        # one-off connection while the daemon isn't connected
+        ipc = self.ipc
         try:
-            for line in proc.stdout:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    event = json.loads(line)
-                except json.JSONDecodeError:
-                    continue
-
-                change = event.get("change")
-                if event.get("type") == "shutdown":
-                    return 0
-
-                if event.get("event") == "window" or event.get("type") == "window":
-                    # Only react to focus events
-                    if change != "focus":
-                        continue
-                    # Ignore focus updates while cycling is in progress
-                    if is_paused():
-                        continue
-                    container = event.get("container") or {}
-                    con_id = container.get("id")
-                    # Track only real windows with an id and either app_id or window
-                    is_real_window = isinstance(con_id, int) and (
-                        container.get("app_id") is not None
-                        or container.get("window") is not None
-                    )
-                    if not is_real_window:
-                        continue
-
-                    # Move to front (MRU) and uniquify
-                    if con_id in mru:
-                        mru.remove(con_id)
-                    mru.insert(0, con_id)
-                    # Keep the list reasonably bounded
-                    if len(mru) > 512:
-                        mru = mru[:512]
-                    try:
-                        save_mru(state_path, mru)
-                    except Exception:
-                        pass
+            if ipc is None:
+                ipc = SwayIPC()
+            state = ipc.get_binding_state()
+            if isinstance(state, dict) and state.get("name") == CYCLE_MODE:
+                ipc.command('mode "default"')
+        except (OSError, SwayIPCError):
+            pass
         finally:
+            if ipc is not None and ipc is not self.ipc:
+                ipc.close()
+
+    async def read_events(
+        self, reader: asyncio.StreamReader, queue: EventQueue
+    ) -> None:
+        while True:
+            kind, event = await sway_ipc.read_event_async(reader)
+            queue.put(kind, event, time.perf_counter())
+
+    async def consume(self, queue: EventQueue) -> bool:
+        # Returns True when sway announced shutdown
+        while True:
+            kind, event, stamp = await queue.get()
+            if kind == "shutdown":
+                return True
+            if kind == "resync":
+                self.resync()
+            elif kind == "window":
+                self.on_window(event)
+            elif kind == "workspace" and not self.model.on_workspace(event):
+                self.resync()
+            self.lag.append(time.perf_counter() - stamp)
+            # Let the reader drain the socket between events
+            await asyncio.sleep(0)
+
+    async def serve(self, reader: asyncio.StreamReader) -> bool:
+        # Requests to sway answer in well under a millisecond, so they stay
+        # synchronous; only the unbounded event stream goes through the loop
+        self.resync()
+        self.queue = EventQueue(self.queue_size)
+        tasks = {
+            asyncio.create_task(self.read_events(reader, self.queue)),
+            asyncio.create_task(self.consume(self.queue)),
+        }
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            return any(t.result() for t in done)
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def connect_forever(self) -> None:
+        backoff = 0.5
+        while True:
+            writer = None
             try:
-                proc.kill()
-            except Exception:
+                reader, writer = await sway_ipc.subscribe_async(EVENTS)
+                self.ipc = SwayIPC()
+                backoff = 0.5
+                if await self.serve(reader):
+                    return
+            except (OSError, SwayIPCError, ValueError, asyncio.IncompleteReadError):
                 pass
+            finally:
+                if writer is not None:
+                    writer.close()
+                if self.ipc is not None:
+                    self.ipc.close()
+                    self.ipc = None
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 5.0)
+
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(sig, stop.set)
+        self.loop.add_reader(self.control.fileno(), self.on_control)
+        tasks = {
+            asyncio.create_task(self.connect_forever()),
+            asyncio.create_task(stop.wait()),
+        }
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for t in tasks:
+                t.cancel()
+            self.loop.remove_reader(self.control.fileno())
+            # Pending state gets written on shutdown, SIGTERM and SIGINT alike
+            self.flush()
+
 
-        time.sleep(backoff)
-        backoff = min(backoff * 2, 5.0)
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Track sway window focus order")
+    parser.add_argument(
+        "--flush-delay",
+        type=float,
+        default=1.0,
+        metavar="SECONDS",
+        help="coalesce state file writes over this window (default: 1.0)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=256,
+        metavar="EVENTS",
+        help="events buffered before falling back to a resync (default: 256)",
+    )
+    args = parser.parse_args()
+
+    control_path = sway_mru.get_control_path()
+    control = bind_control(control_path)
+    if control is None:
+        print("sway_mru_daemon.py: already running", file=sys.stderr)
+        return 0
+
+    daemon = MRUDaemon(
+        sway_mru.get_state_path(), control, args.flush_delay, args.queue_size
+    )
+    try:
+        asyncio.run(daemon.run())
+    finally:
+        control.close()
+        try:
+            os.unlink(control_path)
+        except OSError:
+            pass
+    return 0
 
 
 if __name__ == "__main__":